@@ -0,0 +1,158 @@
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from posts import caching, feeds
+from posts.models import Comment, Follow, Group, Post
+
+
+def _file_url(name):
+    return default_storage.url(name) if name else None
+
+
+class Serializer:
+    """
+    JSON-представление модели: поле ответа -> lookup модели, связанные
+    поля через __. Объекты выбираются одним запросом .values() только
+    с запрошенными полями (?fields=), JOIN строится по lookup, а
+    готовые представления лежат в кеше, пока не изменятся версии
+    областей кеша объекта.
+    """
+    model = None
+    fields = {}
+    # Поля лёгких строк страницы: ключ и то, что нужно scopes()
+    row_fields = ()
+    # Как превратить значение поля в JSON, если оно не годится как есть
+    converters = {}
+
+    def __init__(self, names=None):
+        names = list(names or self.fields)
+        unknown = set(names) - self.fields.keys()
+        if unknown:
+            raise ValueError(
+                'Неизвестные поля: ' + ', '.join(sorted(unknown))
+            )
+        self.names = names
+
+    @classmethod
+    def from_request(cls, request):
+        names = request.GET.get('fields', '').split(',')
+        return cls([name.strip() for name in names if name.strip()])
+
+    def rows(self, queryset):
+        """Лёгкие строки для паджинации: без JOIN и лишних колонок."""
+        return queryset.only(*self.row_fields)
+
+    def scopes(self, row):
+        """Области кеша, от которых зависит представление объекта."""
+        return []
+
+    def annotate(self, queryset):
+        return queryset
+
+    def represent(self, values):
+        data = {}
+        for name in self.names:
+            value = values[self.fields[name]]
+            if name in self.converters:
+                value = self.converters[name](value)
+            data[name] = value
+        return data
+
+    def dump(self, rows):
+        """
+        Представления объектов rows в том же порядке. Из кеша берётся
+        всё, что там есть, остальное выбирается одним запросом.
+        """
+        rows = list(rows)
+        scopes = {row.pk: self.scopes(row) for row in rows}
+        versions = caching.get_versions(
+            {scope for row_scopes in scopes.values() for scope in row_scopes}
+        )
+        keys = {
+            pk: caching.object_key(
+                'api:' + self.model._meta.label_lower + ':',
+                pk, self.names, [versions[scope] for scope in row_scopes],
+            )
+            for pk, row_scopes in scopes.items()
+        }
+        found = cache.get_many(keys.values())
+        missing = [pk for pk, key in keys.items() if key not in found]
+        if missing:
+            lookups = {self.fields[name] for name in self.names}
+            fetched = {
+                keys[values['pk']]: self.represent(values)
+                for values in self.annotate(
+                    self.model.objects.filter(pk__in=missing)
+                ).values('pk', *lookups)
+            }
+            cache.set_many(fetched, caching.cache_timeout())
+            found.update(fetched)
+        return [found[keys[row.pk]] for row in rows if keys[row.pk] in found]
+
+
+class PostSerializer(Serializer):
+    model = Post
+    fields = {
+        'id': 'pk',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'image': 'image',
+        'comment_count': 'comment_count',
+    }
+    row_fields = ('pub_date', 'group')
+    converters = {'image': _file_url}
+
+    def scopes(self, row):
+        scopes = [caching.post_scope(row.pk)]
+        if row.group_id is not None:
+            scopes.append(caching.group_scope(row.group_id))
+        return scopes
+
+    def annotate(self, queryset):
+        if 'comment_count' in self.names:
+            return feeds.with_comment_count(queryset)
+        return queryset
+
+
+class CommentSerializer(Serializer):
+    model = Comment
+    fields = {
+        'id': 'pk',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    }
+    row_fields = ('created', 'post')
+
+    def scopes(self, row):
+        return [caching.post_scope(row.post_id)]
+
+
+class GroupSerializer(Serializer):
+    model = Group
+    fields = {
+        'id': 'pk',
+        'title': 'title',
+        'slug': 'slug',
+        'description': 'description',
+    }
+    row_fields = ('pk',)
+
+    def scopes(self, row):
+        return [caching.group_scope(row.pk)]
+
+
+class FollowSerializer(Serializer):
+    model = Follow
+    fields = {
+        'id': 'pk',
+        'user': 'user__username',
+        'author': 'author__username',
+    }
+    row_fields = ('user',)
+
+    def scopes(self, row):
+        return [caching.follow_scope(row.user_id)]
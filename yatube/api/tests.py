@@ -0,0 +1,242 @@
+import base64
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', password='secret'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', password='secret'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            text='Первый пост', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def basic(self, user):
+        credentials = base64.b64encode(f'{user.username}:secret'.encode())
+        return {'HTTP_AUTHORIZATION': 'Basic ' + credentials.decode()}
+
+    def send(self, method, url, data=None, user=None):
+        headers = self.basic(user) if user else {}
+        return getattr(self.client, method)(
+            url, json.dumps(data or {}), content_type='application/json',
+            **headers
+        )
+
+    def test_post_list_and_detail(self):
+        Comment.objects.create(post=self.post, author=self.reader, text='Ок')
+        results = self.client.get(reverse('api:posts')).json()['results']
+        self.assertEqual(results, [{
+            'id': self.post.pk,
+            'text': 'Первый пост',
+            'pub_date': DjangoJSONEncoder().default(self.post.pub_date),
+            'author': 'author',
+            'group': 'test',
+            'image': None,
+            'comment_count': 1,
+        }])
+        detail = self.client.get(
+            reverse('api:post', args=(self.post.pk,)), {'fields': 'id,text'}
+        ).json()
+        self.assertEqual(detail, {'id': self.post.pk, 'text': 'Первый пост'})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('api:posts'), {'fields': 'pk'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        """Курсоры ведут по всем постам без повторов"""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.author)
+            for number in range(6)
+        )
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 4, 'fields': 'id'}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(reverse('api:posts'), params).json()
+            seen += [item['id'] for item in data['results']]
+            cursor = data['next']
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_page_query_count_is_constant(self):
+        """Страница из 100 постов стоит столько же запросов, что и из 1"""
+        def count_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    reverse('api:posts'), {'limit': 100}
+                )
+            return len(queries), len(response.json()['results'])
+
+        small, _ = count_queries()
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.reader, group=self.group)
+            for number in range(99)
+        )
+        Comment.objects.create(
+            post=Post.objects.filter(author=self.reader).first(),
+            author=self.reader, text='Ок'
+        )
+        self.assertEqual(count_queries(), (small, 100))
+        self.assertLessEqual(small, 2)
+
+    def test_cached_representations(self):
+        """Повторная страница берёт представления из кеша"""
+        url = reverse('api:posts')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(queries), 1)
+        Comment.objects.create(post=self.post, author=self.reader, text='Ок')
+        self.assertEqual(
+            self.client.get(url).json()['results'][0]['comment_count'], 1
+        )
+
+    def test_create_and_edit_post(self):
+        response = self.send(
+            'post', reverse('api:posts'),
+            {'text': 'Новый пост', 'group': 'test'}, self.reader,
+        )
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(pk=response.json()['id'])
+        self.assertEqual(
+            (post.author, post.group), (self.reader, self.group)
+        )
+        url = reverse('api:post', args=(post.pk,))
+        response = self.send('patch', url, {'group': None}, self.reader)
+        self.assertEqual(response.json()['group'], None)
+        self.assertEqual(response.json()['text'], 'Новый пост')
+        self.assertEqual(
+            self.send('delete', url, user=self.reader).status_code, 204
+        )
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+
+    def test_only_author_edits_post(self):
+        url = reverse('api:post', args=(self.post.pk,))
+        self.assertEqual(
+            self.send('patch', url, {'text': 'Чужой'}).status_code, 401
+        )
+        for method in ('patch', 'delete'):
+            with self.subTest(method=method):
+                response = self.send(method, url, {'text': 'Чужой'},
+                                     self.reader)
+                self.assertEqual(response.status_code, 403)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Первый пост')
+
+    def test_invalid_post(self):
+        response = self.send(
+            'post', reverse('api:posts'), {'text': ''}, self.author
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['detail'])
+        response = self.send(
+            'post', reverse('api:posts'),
+            {'text': 'Пост', 'group': 'missing'}, self.author,
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_wrong_password(self):
+        response = self.client.get(
+            reverse('api:follows'),
+            HTTP_AUTHORIZATION='Basic ' + base64.b64encode(
+                b'reader:wrong'
+            ).decode(),
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_session_writes_need_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.reader)
+        response = client.post(
+            reverse('api:posts'), json.dumps({'text': 'Пост'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_comments(self):
+        url = reverse('api:comments', args=(self.post.pk,))
+        response = self.send('post', url, {'text': 'Ок'}, self.reader)
+        self.assertEqual(response.status_code, 201)
+        data = self.client.get(url).json()
+        self.assertEqual(
+            [(item['author'], item['text']) for item in data['results']],
+            [('reader', 'Ок')]
+        )
+        self.assertIsNone(data['next'])
+
+    def test_groups(self):
+        data = self.client.get(reverse('api:groups')).json()
+        self.assertEqual(
+            [item['slug'] for item in data['results']], ['test']
+        )
+        response = self.client.get(reverse('api:group', args=('test',)))
+        self.assertEqual(response.json()['title'], 'Тестовая группа')
+        response = self.client.get(reverse('api:group', args=('missing',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Не найдено'})
+
+    def test_follow_and_unfollow(self):
+        response = self.send(
+            'post', reverse('api:follows'), {'author': 'author'}, self.reader
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(
+            Follow.objects.filter(user=self.reader, author=self.author)
+        )
+        response = self.client.get(
+            reverse('api:follows'), **self.basic(self.reader)
+        )
+        self.assertEqual(
+            [item['author'] for item in response.json()['results']],
+            ['author']
+        )
+        url = reverse('api:follow', args=('author',))
+        self.assertEqual(
+            self.send('delete', url, user=self.reader).status_code, 204
+        )
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(
+            self.send('delete', url, user=self.reader).status_code, 404
+        )
+
+    def test_cannot_follow_self(self):
+        response = self.send(
+            'post', reverse('api:follows'), {'author': 'reader'}, self.reader
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_method_not_allowed(self):
+        response = self.client.put(reverse('api:groups'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'GET, HEAD')
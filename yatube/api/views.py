@@ -0,0 +1,318 @@
+import base64
+import binascii
+import json
+from functools import wraps
+
+from django.contrib.auth import authenticate
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+
+from core.querystats import query_budget
+from core.routers import replica_reads
+from posts import permissions
+from posts.forms import CommentForm, PostForm
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import CURSOR_PARAM, CursorPaginator, comment_page
+
+from .serializers import (
+    CommentSerializer, FollowSerializer, GroupSerializer, PostSerializer
+)
+
+# Размер страницы по умолчанию и наибольший, который можно запросить
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API: отдаётся клиенту как {"detail": ...}."""
+
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class _CsrfCheck(CsrfViewMiddleware):
+    def _reject(self, request, reason):
+        return reason
+
+
+def _basic_user(request):
+    """Пользователь из заголовка Authorization: Basic или None."""
+    scheme, _, credentials = request.META.get(
+        'HTTP_AUTHORIZATION', ''
+    ).partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        username, _, password = base64.b64decode(
+            credentials, validate=True
+        ).decode().partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        raise ApiError(401, 'Неверный заголовок Authorization')
+    user = authenticate(request, username=username, password=password)
+    if user is None:
+        raise ApiError(401, 'Неверное имя пользователя или пароль')
+    return user
+
+
+def _authenticate(request):
+    user = _basic_user(request)
+    if user is not None:
+        request.user = user
+    elif request.method not in SAFE_METHODS and request.user.is_authenticated:
+        reason = _CsrfCheck().process_view(request, None, (), {})
+        if reason:
+            raise ApiError(403, f'Ошибка CSRF: {reason}')
+
+
+def api_view(*methods):
+    """
+    Декоратор view API: разрешённые методы и вход по заголовку
+    Authorization: Basic или по сессии сайта. Запись по сессии, как
+    и формы сайта, требует CSRF-токена. Ошибки отдаются в JSON.
+    """
+    if 'GET' in methods:
+        methods += ('HEAD',)
+
+    def decorator(view_func):
+        @csrf_exempt
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    response = _error(
+                        405, f'Метод {request.method} не поддерживается'
+                    )
+                    response['Allow'] = ', '.join(methods)
+                    return response
+                _authenticate(request)
+                return view_func(request, *args, **kwargs)
+            except Http404:
+                return _error(404, 'Не найдено')
+            except ApiError as error:
+                return _error(error.status, error.detail)
+        return inner
+    return decorator
+
+
+def _error(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def _require_user(request):
+    if not request.user.is_authenticated:
+        raise ApiError(401, 'Нужно войти')
+
+
+def _payload(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError(400, 'Тело запроса - не JSON')
+    if not isinstance(data, dict):
+        raise ApiError(400, 'Тело запроса должно быть JSON-объектом')
+    return data
+
+
+def _form_errors(form):
+    return {
+        field: [error['message'] for error in errors]
+        for field, errors in form.errors.get_json_data().items()
+    }
+
+
+def _serializer(serializer_class, request):
+    try:
+        return serializer_class.from_request(request)
+    except ValueError as error:
+        raise ApiError(400, str(error))
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ApiError(400, f'limit - число от 1 до {MAX_PAGE_SIZE}')
+    return limit
+
+
+def _page(serializer, rows, next_cursor=None, previous_cursor=None):
+    return JsonResponse({
+        'results': serializer.dump(rows),
+        'next': next_cursor,
+        'previous': previous_cursor,
+    })
+
+
+def _post_page(serializer, queryset, request):
+    # Номеров страниц в API нет: окно - только соседние страницы
+    paginator = CursorPaginator(
+        serializer.rows(queryset), _limit(request), window=1
+    )
+    cursor = request.GET.get(CURSOR_PARAM)
+    page = paginator.cursor_page(cursor) if cursor else paginator.first_page()
+    return _page(serializer, page, page.next_cursor, page.previous_cursor)
+
+
+def _key_page(serializer, queryset, request):
+    """Страница по возрастанию ключа, курсор - ключ последней строки."""
+    limit = _limit(request)
+    queryset = serializer.rows(queryset).order_by('pk')
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        if not cursor.isdigit():
+            raise ApiError(400, 'Неверный курсор')
+        queryset = queryset.filter(pk__gt=int(cursor))
+    rows = list(queryset[:limit + 1])
+    next_cursor = str(rows[limit - 1].pk) if len(rows) > limit else None
+    return _page(serializer, rows[:limit], next_cursor)
+
+
+def _save_post(request, post=None):
+    data = _payload(request)
+    fields = {}
+    if post is not None:
+        fields = {'text': post.text, 'group': post.group_id}
+    if 'text' in data:
+        fields['text'] = data['text']
+    if data.get('group'):
+        fields['group'] = Group.objects.filter(
+            slug=data['group']
+        ).values_list('pk', flat=True).first()
+        if fields['group'] is None:
+            raise ApiError(400, {'group': ['Такой группы нет']})
+    elif 'group' in data:
+        fields['group'] = None
+    form = PostForm(fields, instance=post)
+    if not form.is_valid():
+        raise ApiError(400, _form_errors(form))
+    post = form.save(commit=False)
+    if post.author_id is None:
+        post.author = request.user
+    form.save()
+    return post
+
+
+@query_budget(4)
+@replica_reads
+@api_view('GET', 'POST')
+def posts(request):
+    """Посты от новых к старым, фильтры ?group=slug и ?author=username"""
+    if request.method == 'POST':
+        _require_user(request)
+        post = _save_post(request)
+        return JsonResponse(PostSerializer().dump([post])[0], status=201)
+    queryset = Post.objects.all()
+    if request.GET.get('group'):
+        queryset = queryset.filter(group__slug=request.GET['group'])
+    if request.GET.get('author'):
+        queryset = queryset.filter(author__username=request.GET['author'])
+    return _post_page(_serializer(PostSerializer, request), queryset, request)
+
+
+@query_budget(4)
+@replica_reads
+@api_view('GET', 'PATCH', 'DELETE')
+def post(request, post_id):
+    if request.method == 'GET':
+        serializer = _serializer(PostSerializer, request)
+        row = get_object_or_404(serializer.rows(Post.objects), pk=post_id)
+        return JsonResponse(serializer.dump([row])[0])
+    _require_user(request)
+    post = get_object_or_404(Post, pk=post_id)
+    if not permissions.can_edit(request.user, post):
+        raise ApiError(403, 'Менять пост может только его автор')
+    if request.method == 'DELETE':
+        post.delete()
+        return HttpResponse(status=204)
+    post = _save_post(request, post)
+    return JsonResponse(PostSerializer().dump([post])[0])
+
+
+@query_budget(4)
+@replica_reads
+@api_view('GET', 'POST')
+def comments(request, post_id):
+    """Комментарии поста от старых к новым"""
+    if request.method == 'POST':
+        _require_user(request)
+        post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+        form = CommentForm(_payload(request))
+        if not form.is_valid():
+            raise ApiError(400, _form_errors(form))
+        comment = form.save(commit=False)
+        comment.author = request.user
+        comment.post = post
+        comment.save()
+        return JsonResponse(
+            CommentSerializer().dump([comment])[0], status=201
+        )
+    serializer = _serializer(CommentSerializer, request)
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    rows, next_cursor = comment_page(
+        serializer.rows(Comment.objects.filter(post_id=post_id)),
+        request.GET.get(CURSOR_PARAM),
+        _limit(request),
+    )
+    return _page(serializer, rows, next_cursor)
+
+
+@query_budget(4)
+@replica_reads
+@api_view('GET')
+def groups(request):
+    return _key_page(
+        _serializer(GroupSerializer, request), Group.objects, request
+    )
+
+
+@query_budget(4)
+@replica_reads
+@api_view('GET')
+def group(request, slug):
+    serializer = _serializer(GroupSerializer, request)
+    row = get_object_or_404(serializer.rows(Group.objects), slug=slug)
+    return JsonResponse(serializer.dump([row])[0])
+
+
+@query_budget(4)
+@api_view('GET', 'POST')
+def follows(request):
+    """Подписки пользователя; POST {"author": username} подписывает"""
+    _require_user(request)
+    if request.method == 'POST':
+        username = _payload(request).get('author')
+        author = User.objects.filter(username=username).first()
+        if author is None:
+            raise ApiError(400, {'author': ['Такого автора нет']})
+        if not permissions.can_follow(request.user, author):
+            raise ApiError(400, {'author': ['Нельзя подписаться на себя']})
+        follow, created = Follow.objects.get_or_create(
+            user=request.user, author=author
+        )
+        return JsonResponse(
+            FollowSerializer().dump([follow])[0],
+            status=201 if created else 200,
+        )
+    return _key_page(
+        _serializer(FollowSerializer, request),
+        Follow.objects.filter(user=request.user),
+        request,
+    )
+
+
+@api_view('DELETE')
+def follow(request, username):
+    _require_user(request)
+    deleted, _ = Follow.objects.filter(
+        user=request.user, author__username=username
+    ).delete()
+    if not deleted:
+        raise Http404
+    return HttpResponse(status=204)
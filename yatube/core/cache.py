@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends import filebased
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: там запускается только однопроцессный сервер разработки
+    fcntl = None
+
+# Номер последнего сообщения о сброшенных ключах в общем кеше
+SEQ_KEY = 'two-tier:seq'
+# Сообщение с номером N: список ключей, которые сбросили воркеры
+LOG_KEY = 'two-tier:log:{}'
+# Ключ в сообщении, означающий «сбросить всё»
+CLEAR_ALL = '*'
+# Файл блокировки в каталоге файлового кеша
+LOCK_FILE = 'incr.lock'
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    """
+    Файловый кеш Django, в котором incr и add атомарны для всех
+    процессов сервера: оба выполняются под блокировкой файла в каталоге
+    кеша. У стандартного файлового кеша это чтение и запись без
+    блокировки, и два воркера могут получить один номер сообщения
+    журнала TwoTierCache.
+    """
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        self._createdir()
+        with open(os.path.join(self._dir, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked():
+            return super().incr(key, delta, version)
+
+
+class TwoTierCache(BaseCache):
+    """
+    Двухуровневый кеш: небольшой LRU в памяти процесса
+    перед общим для всех воркеров бэкендом.
+
+    LOCATION - имя общего кеша из settings.CACHES; его incr и add
+    должны быть атомарны (Redis, Memcached, FileBasedCache отсюда).
+    Записи идут сразу в общий кеш. Удаления, incr и clear ещё и
+    публикуются в журнал сообщений, который каждый воркер читает не
+    чаще раза в SYNC_INTERVAL секунд и выбрасывает из своего LRU
+    устаревшие ключи. set не публикуется: кеш заполняется записями
+    под ключами с версиями, которые не перезаписываются, а
+    перезаписанный ключ другие воркеры увидят через LOCAL_TIMEOUT
+    секунд - столько живёт любая локальная запись.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._sync_interval = options.get('SYNC_INTERVAL', 1)
+        self._log_size = options.get('LOG_SIZE', 1000)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._seen = None
+        self._next_sync = 0
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # Локальный уровень
+
+    def _local_get(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return item
+
+    def _local_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._local_delete(key)
+            return
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def _local_clear(self):
+        with self._lock:
+            self._local.clear()
+
+    # Рассылка сбросов между воркерами
+
+    def _publish(self, *keys):
+        self._sync()
+        try:
+            seq = self.shared.incr(SEQ_KEY)
+        except ValueError:
+            self.shared.add(SEQ_KEY, 0, None)
+            seq = self.shared.incr(SEQ_KEY)
+        self.shared.set(LOG_KEY.format(seq), list(keys), None)
+        if self._seen == seq - 1:
+            # Своё сообщение перечитывать не нужно
+            self._seen = seq
+        self.shared.delete(LOG_KEY.format(seq - self._log_size))
+
+    def _sync(self):
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self._sync_interval
+        seq = self.shared.get(SEQ_KEY)
+        if seq == self._seen:
+            return
+        if seq is None or self._seen is None or not (
+            0 < seq - self._seen <= self._log_size
+        ):
+            self._local_clear()
+            self._seen = seq
+            return
+        log_keys = [LOG_KEY.format(n) for n in range(self._seen + 1, seq + 1)]
+        messages = self.shared.get_many(log_keys)
+        if len(messages) < len(log_keys):
+            self._local_clear()
+        else:
+            dropped = {key for keys in messages.values() for key in keys}
+            if CLEAR_ALL in dropped:
+                self._local_clear()
+            else:
+                self._local_delete(*dropped)
+        self._seen = seq
+
+    # API кеша
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        self._sync()
+        item = self._local_get(local_key)
+        if item is not None:
+            return item[1]
+        value = self.shared.get(key, self, version)
+        if value is self:
+            return default
+        self._local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            item = self._local_get(self.make_key(key, version))
+            if item is None:
+                missing.append(key)
+            else:
+                found[key] = item[1]
+        if missing:
+            shared = self.shared.get_many(missing, version)
+            for key, value in shared.items():
+                self._local_set(self.make_key(key, version), value)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self._local_set(self.make_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(self.make_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self._local_set(self.make_key(key, version), value, timeout)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_key(key, version)
+        value = self.shared.incr(key, delta, version)
+        self._publish(local_key)
+        self._local_set(local_key, value)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        local_key = self.make_key(key, version)
+        self.shared.delete(key, version)
+        self._publish(local_key)
+        self._local_delete(local_key)
+
+    def delete_many(self, keys, version=None):
+        local_keys = [self.make_key(key, version) for key in keys]
+        self.shared.delete_many(keys, version)
+        self._publish(*local_keys)
+        self._local_delete(*local_keys)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version) is not self
+
+    def clear(self):
+        self.shared.clear()
+        self._publish(CLEAR_ALL)
+        self._local_clear()
@@ -0,0 +1,41 @@
+from django.forms.renderers import BaseRenderer
+from django.template.backends.django import DjangoTemplates
+from django.utils.functional import cached_property
+
+
+class FormControlMixin:
+    """
+    Форма один раз объявляет CSS-класс своих виджетов (widget_class),
+    и фильтру addclass в шаблоне не нужно собирать атрибуты виджета
+    заново на каждой отрисовке.
+    """
+    widget_class = 'form-control'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs.setdefault('class', self.widget_class)
+
+
+class CachedWidgetTemplates(BaseRenderer):
+    """
+    Рендерер форм, который держит шаблоны виджетов скомпилированными
+    и при DEBUG: они поставляются с Django (приложение django.forms)
+    и при разработке не меняются, в отличие от шаблонов проекта.
+    """
+
+    @cached_property
+    def engine(self):
+        return DjangoTemplates({
+            'APP_DIRS': False,
+            'DIRS': [],
+            'NAME': 'djangoforms',
+            'OPTIONS': {
+                'loaders': [('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.app_directories.Loader',
+                ])],
+            },
+        })
+
+    def get_template(self, template_name):
+        return self.engine.get_template(template_name)
@@ -0,0 +1,52 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.routers import PRIMARY
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплики из REPLICA_DATABASES. '
+        'С --interval копирует по кругу и заменяет репликацию '
+        'при локальной разработке'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Копировать каждые столько секунд, пока не прервут',
+        )
+
+    def handle(self, *args, **options):
+        replicas = settings.REPLICA_DATABASES
+        if not replicas:
+            raise CommandError(
+                'Реплики не настроены, задайте DATABASE_REPLICAS'
+            )
+        for alias in (PRIMARY, *replicas):
+            if 'sqlite3' not in settings.DATABASES[alias]['ENGINE']:
+                raise CommandError(
+                    f'{alias}: копировать можно только базы SQLite'
+                )
+        while True:
+            for alias in replicas:
+                self.copy(PRIMARY, alias)
+            self.stdout.write(f'Реплики обновлены: {", ".join(replicas)}')
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
+
+    def copy(self, source_alias, target_alias):
+        # Резервное копирование SQLite даёт согласованный снимок
+        # даже во время записи в основную базу
+        source = sqlite3.connect(settings.DATABASES[source_alias]['NAME'])
+        target = sqlite3.connect(settings.DATABASES[target_alias]['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
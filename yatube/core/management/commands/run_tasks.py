@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди фоновых задач core.tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и выйти',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Сколько секунд ждать, когда очередь пуста',
+        )
+
+    def handle(self, *args, **options):
+        report = self.stdout.write if options['verbosity'] > 1 else None
+        try:
+            done = tasks.work(options['once'], options['sleep'], report)
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f'Выполнено задач: {done}')
@@ -0,0 +1,95 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import routers
+from .querystats import QueryBudgetExceeded, QueryCollector, stats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStatsMiddleware:
+    """
+    Считает SQL-запросы и время БД каждого запроса, копит статистику
+    по имени view, отдаёт её в заголовке Server-Timing и проверяет
+    бюджет запросов, объявленный через core.querystats.query_budget.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        response['Server-Timing'] = (
+            f'db;dur={collector.duration * 1000:.1f};'
+            f'desc="{collector.count} queries", '
+            f'total;dur={elapsed * 1000:.1f}'
+        )
+        match = request.resolver_match
+        if match is not None:
+            stats.record(match.view_name, collector, elapsed)
+            self.check_budget(request, match.view_name, collector)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Бюджет описывает чтение: стоимость записи с её сигналами,
+        # счётчиками и лентами подписок зависит от данных
+        if request.method in ('GET', 'HEAD'):
+            request.query_budget = getattr(view_func, 'query_budget', None)
+
+    def check_budget(self, request, view_name, collector):
+        budget = getattr(request, 'query_budget', None)
+        if budget is None or collector.count <= budget:
+            return
+        message = (
+            f'{view_name}: {collector.count} SQL-запросов '
+            f'при бюджете {budget}'
+        )
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class ReplicaMiddleware:
+    """
+    Отправляет чтения view, отмеченных core.routers.replica_reads,
+    в реплику. После записи в базу ставит cookie, и ещё
+    REPLICA_LAG_SECONDS секунд пользователь читает из основной
+    базы, чтобы видеть свои изменения, пока они идут до реплик.
+    """
+    cookie_name = 'read_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tokens = routers.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.finish(tokens)
+        if wrote and settings.REPLICA_DATABASES:
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.REPLICA_LAG_SECONDS,
+                httponly=True,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            getattr(view_func, 'replica_reads', False)
+            and request.method in ('GET', 'HEAD')
+            and self.cookie_name not in request.COOKIES
+        ):
+            routers.use_replica()
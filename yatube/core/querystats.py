@@ -0,0 +1,140 @@
+import re
+import threading
+import time
+from collections import Counter
+
+# Границы корзин гистограмм времени, мс
+BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, float('inf'))
+# Сколько самых медленных запросов помнить для каждого view
+SLOWEST_LIMIT = 5
+# Сколько повторяющихся отпечатков запросов помнить для каждого view
+DUPLICATES_LIMIT = 10
+
+_NUMBERS = re.compile(r'\b\d+\b')
+_IN_LISTS = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+
+
+class QueryBudgetExceeded(Exception):
+    """View выполнило больше SQL-запросов, чем разрешает его бюджет."""
+
+
+def query_budget(limit):
+    """
+    Декоратор: объявляет, сколько SQL-запросов может выполнить view
+    на запрос GET или HEAD.
+    """
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def fingerprint(sql):
+    """Текст запроса без чисел и с одинаковыми списками IN (...)."""
+    return _IN_LISTS.sub('IN (...)', _NUMBERS.sub('?', sql))
+
+
+class QueryCollector:
+    """Собирает SQL-запросы через connection.execute_wrapper()."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def slowest(self, limit=SLOWEST_LIMIT):
+        return sorted(self.queries, key=lambda query: -query[1])[:limit]
+
+    def duplicates(self):
+        """Отпечатки запросов, выполненных больше одного раза."""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+def _bucket(milliseconds):
+    for bound in BUCKETS:
+        if milliseconds <= bound:
+            return bound
+
+
+class ViewStats:
+    """Накопленная статистика одного view в этом процессе."""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.db_histogram = Counter()
+        self.time_histogram = Counter()
+        self.slowest = []
+        self.duplicates = Counter()
+
+    def add(self, collector, elapsed):
+        self.requests += 1
+        self.queries += collector.count
+        self.db_time += collector.duration
+        self.db_histogram[_bucket(collector.duration * 1000)] += 1
+        self.time_histogram[_bucket(elapsed * 1000)] += 1
+        self.slowest = sorted(
+            self.slowest + collector.slowest(), key=lambda query: -query[1]
+        )[:SLOWEST_LIMIT]
+        self.duplicates.update(collector.duplicates())
+
+    def as_dict(self):
+        def histogram(counter):
+            return {str(bound): counter[bound] for bound in BUCKETS}
+
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'queries_per_request': self.queries / self.requests,
+            'db_time_ms': round(self.db_time * 1000, 3),
+            'db_time_histogram_ms': histogram(self.db_histogram),
+            'time_histogram_ms': histogram(self.time_histogram),
+            'slowest': [
+                {'sql': sql, 'ms': round(duration * 1000, 3)}
+                for sql, duration in self.slowest
+            ],
+            'duplicates': dict(self.duplicates.most_common(DUPLICATES_LIMIT)),
+        }
+
+
+class StatsRegistry:
+    """Статистика по всем view, потокобезопасная."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view_name, collector, elapsed):
+        with self._lock:
+            self._views.setdefault(view_name, ViewStats()).add(
+                collector, elapsed
+            )
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                name: stats.as_dict()
+                for name, stats in sorted(self._views.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+stats = StatsRegistry()
@@ -0,0 +1,97 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from django.template.base import Node, Template, TextNode, VariableNode
+
+# Время вложенных отрисовок для каждого уровня текущей отрисовки
+_children = ContextVar('render_children', default=None)
+
+
+class RenderStats:
+    """
+    Время отрисовки по шаблонам, тегам и фильтрам в этом процессе,
+    потокобезопасное. Для каждого имени - число отрисовок, полное
+    время и собственное время без вложенных шаблонов и тегов.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, total, own):
+        with self._lock:
+            item = self._items.setdefault(name, [0, 0.0, 0.0])
+            item[0] += 1
+            item[1] += total
+            item[2] += own
+
+    def as_dict(self):
+        with self._lock:
+            items = sorted(self._items.items(), key=lambda item: -item[1][2])
+            return {
+                name: {
+                    'renders': renders,
+                    'total_ms': round(total * 1000, 3),
+                    'self_ms': round(own * 1000, 3),
+                }
+                for name, (renders, total, own) in items
+            }
+
+    def reset(self):
+        with self._lock:
+            self._items.clear()
+
+
+stats = RenderStats()
+
+
+def _timed(name, render, node, context):
+    children = _children.get()
+    if children is None:
+        children = []
+        _children.set(children)
+    children.append(0.0)
+    start = time.perf_counter()
+    try:
+        return render(node, context)
+    finally:
+        total = time.perf_counter() - start
+        own = total - children.pop()
+        if children:
+            children[-1] += total
+        stats.record(name, total, own)
+
+
+def node_name(node):
+    """Имя узла в статистике: тег по классу, переменная по фильтрам."""
+    if isinstance(node, VariableNode):
+        return 'var' + ''.join(
+            f'|{func.__name__}'
+            for func, _ in node.filter_expression.filters
+        )
+    return f'tag:{type(node).__name__}'
+
+
+def install():
+    """
+    Подменяет отрисовку шаблонов и узлов версиями с замером времени.
+    Включается настройкой TEMPLATE_PROFILING, в бою замеры не нужны.
+    """
+    if getattr(Template.render, 'profiled', False):
+        return
+    template_render = Template.render
+    node_render = Node.render_annotated
+
+    def render(self, context):
+        name = self.origin.template_name or self.name or '<строка>'
+        return _timed(f'template:{name}', template_render, self, context)
+
+    def render_annotated(self, context):
+        if isinstance(self, TextNode):
+            return node_render(self, context)
+        return _timed(node_name(self), node_render, self, context)
+
+    render.profiled = True
+    Template.render = render
+    Node.render_annotated = render_annotated
@@ -0,0 +1,65 @@
+import contextvars
+import random
+
+from django.conf import settings
+
+PRIMARY = 'default'
+# Куда текущий запрос отправляет чтения: алиас реплики или None,
+# если читать нужно из основной базы
+_read_db = contextvars.ContextVar('read_db', default=None)
+# Писал ли текущий запрос в базу
+_wrote = contextvars.ContextVar('wrote', default=False)
+
+
+def replica_reads(view_func):
+    """Декоратор: view только читает, и читать можно из реплики."""
+    view_func.replica_reads = True
+    return view_func
+
+
+def start():
+    """Начинает запрос: пока он читает из основной базы."""
+    return _read_db.set(None), _wrote.set(False)
+
+
+def use_replica():
+    """Все дальнейшие чтения запроса идут в одну случайную реплику."""
+    replicas = settings.REPLICA_DATABASES
+    if replicas and not _wrote.get():
+        _read_db.set(random.choice(replicas))
+
+
+def reading_from_replica():
+    return _read_db.get() is not None
+
+
+def finish(tokens):
+    """Заканчивает запрос и сообщает, писал ли он в базу."""
+    read_token, wrote_token = tokens
+    wrote = _wrote.get()
+    _read_db.reset(read_token)
+    _wrote.reset(wrote_token)
+    return wrote
+
+
+class ReplicaRouter:
+    """
+    Чтения запросов, отмеченных replica_reads, идут в реплику,
+    остальные чтения и все записи - в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_db.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        # После записи запрос должен видеть свои изменения
+        _read_db.set(None)
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными от основной базы
+        return db == PRIMARY
@@ -0,0 +1,148 @@
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Сколько готовых задач перебирает воркер в поисках свободной
+CLAIM_BATCH = 10
+
+_registry = {}
+
+
+def task(func):
+    """Декоратор: функцию можно ставить в очередь через enqueue()."""
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    _registry[func.task_name] = func
+    return func
+
+
+def enqueue(func, *args, delay=0):
+    """
+    Ставит вызов func(*args) в очередь. Аргументы хранятся в JSON.
+    Задача пишется в той же транзакции, что и изменения запроса,
+    и воркер не увидит её, пока транзакция не закончится.
+    С TASKS_EAGER задача выполняется сразу.
+    """
+    if settings.TASKS_EAGER:
+        func(*args)
+        return None
+    return Task.objects.create(
+        name=func.task_name,
+        args=json.dumps(args),
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def release_stuck():
+    """
+    Возвращает в очередь задачи, которые выполняются дольше
+    TASK_TIMEOUT: их воркер, скорее всего, упал.
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.TASK_TIMEOUT)
+    stuck = Task.objects.filter(status=Task.RUNNING, started__lt=deadline)
+    stuck.filter(attempts__gte=settings.TASK_MAX_ATTEMPTS).update(
+        status=Task.FAILED, finished=timezone.now(), error='Таймаут'
+    )
+    return stuck.update(status=Task.PENDING, error='Таймаут')
+
+
+def claim():
+    """
+    Берёт следующую готовую задачу. Статус меняется условным UPDATE,
+    поэтому два воркера одну задачу не возьмут.
+    """
+    now = timezone.now()
+    candidates = Task.objects.filter(
+        status=Task.PENDING, run_after__lte=now
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)
+    for task_id in candidates[:CLAIM_BATCH]:
+        if Task.objects.filter(pk=task_id, status=Task.PENDING).update(
+            status=Task.RUNNING, started=now, attempts=F('attempts') + 1
+        ):
+            return Task.objects.get(pk=task_id)
+    return None
+
+
+def execute(task):
+    """
+    Выполняет задачу и записывает её длительность. Упавшая задача
+    повторяется через TASK_RETRY_DELAY секунд, каждый раз вдвое
+    позже, пока не кончатся TASK_MAX_ATTEMPTS попыток.
+    """
+    start = time.perf_counter()
+    changes = {'error': ''}
+    try:
+        func = _registry.get(task.name)
+        if func is None:
+            raise LookupError(f'Неизвестная задача {task.name}')
+        func(*json.loads(task.args))
+    except Exception:
+        logger.exception('Задача %s упала', task)
+        changes['error'] = traceback.format_exc()
+        if task.attempts < settings.TASK_MAX_ATTEMPTS:
+            delay = settings.TASK_RETRY_DELAY * 2 ** (task.attempts - 1)
+            changes['status'] = Task.PENDING
+            changes['run_after'] = timezone.now() + timedelta(seconds=delay)
+        else:
+            changes['status'] = Task.FAILED
+    else:
+        changes['status'] = Task.DONE
+    changes['duration'] = time.perf_counter() - start
+    changes['finished'] = timezone.now()
+    Task.objects.filter(pk=task.pk).update(**changes)
+    return changes['status']
+
+
+def purge():
+    """Удаляет выполненные задачи старше TASK_KEEP_DONE секунд."""
+    deadline = timezone.now() - timedelta(seconds=settings.TASK_KEEP_DONE)
+    deleted, _ = Task.objects.filter(
+        status=Task.DONE, finished__lt=deadline
+    ).delete()
+    return deleted
+
+
+def work(once=False, sleep=1.0, report=None):
+    """
+    Цикл воркера: берёт и выполняет задачи по одной. С once
+    заканчивается, когда готовых задач не осталось.
+    """
+    done = 0
+    while True:
+        close_old_connections()
+        release_stuck()
+        task = claim()
+        if task is None:
+            if once:
+                return done
+            purge()
+            time.sleep(sleep)
+            continue
+        status = execute(task)
+        done += 1
+        if report is not None:
+            report(f'{task.name}: {status}')
+
+
+def stats():
+    """Число задач по состояниям и время выполнения по функциям."""
+    rows = Task.objects.values('name').annotate(
+        pending=Count('pk', filter=Q(status=Task.PENDING)),
+        running=Count('pk', filter=Q(status=Task.RUNNING)),
+        done=Count('pk', filter=Q(status=Task.DONE)),
+        failed=Count('pk', filter=Q(status=Task.FAILED)),
+        retried=Count('pk', filter=Q(attempts__gt=1)),
+        avg_seconds=Avg('duration', filter=Q(status=Task.DONE)),
+        max_seconds=Max('duration', filter=Q(status=Task.DONE)),
+    ).order_by('name')
+    return {row.pop('name'): row for row in rows}
@@ -8,6 +8,10 @@ register = template.Library()
 
 @register.filter
 def addclass(field, css):
+    if field.field.widget.attrs.get('class') == css:
+        # Класс уже объявлен в форме (core.forms.FormControlMixin):
+        # виджет рисуется без сборки новых атрибутов
+        return field.as_widget()
     return field.as_widget(attrs={'class': css})
 
 # синтаксис @register... , под который описана функция addclass()
@@ -1,4 +1,37 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from django.core.management import call_command
+from django.forms.renderers import DjangoTemplates, get_default_renderer
+from django.template import engines
+from django.urls import reverse
+from django.utils import timezone
+
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from core import renderstats, tasks
+from core.forms import CachedWidgetTemplates
+from core.templatetags.user_filters import addclass
+from core.cache import SEQ_KEY, FileBasedCache, TwoTierCache
+from core.middleware import ReplicaMiddleware
+from core.routers import ReplicaRouter, replica_reads
+from core.models import Task
+from core.querystats import QueryBudgetExceeded, fingerprint, stats
+from posts import caching, search, views
+from posts import urls as posts_urls
+from posts.forms import CommentForm, PostForm
+from posts.models import FeedEntry, Follow, Post
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -11,3 +44,370 @@ class ViewTestClass(TestCase):
         """Проверяет, что используется шаблон core/404.html"""
         response = self.client.get('/nonexist-page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'two-tier-tests',
+    },
+})
+class TwoTierCacheTest(SimpleTestCase):
+    def make_worker(self, **options):
+        """Кеш отдельного воркера поверх общего кеша"""
+        options.setdefault('SYNC_INTERVAL', 0)
+        return TwoTierCache('shared', {'OPTIONS': options})
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_value_is_shared_between_workers(self):
+        """Запись одного воркера видна другому"""
+        first, second = self.make_worker(), self.make_worker()
+        first.set('key', 'value')
+        self.assertEqual(second.get('key'), 'value')
+
+    def test_invalidation_reaches_other_workers(self):
+        """incr, удаление и очистка сбрасывают ключ в LRU других воркеров"""
+        first, second = self.make_worker(), self.make_worker()
+        first.set('key', 'old')
+        first.set('version', 1)
+        self.assertEqual(second.get('key'), 'old')
+        self.assertEqual(second.get('version'), 1)
+        first.incr('version')
+        self.assertEqual(second.get('version'), 2)
+        first.delete('key')
+        self.assertIsNone(second.get('key'))
+        first.clear()
+        self.assertIsNone(second.get('version'))
+
+    def test_set_is_not_published(self):
+        """
+        Запись не попадает в журнал: перезаписанный ключ другой воркер
+        отдаёт из LRU, пока не истечёт LOCAL_TIMEOUT
+        """
+        first, second = self.make_worker(), self.make_worker()
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        first.set_many({'other': 1})
+        self.assertIsNone(caches['shared'].get(SEQ_KEY))
+        self.assertEqual(second.get('key'), 'old')
+        self.assertEqual(
+            self.make_worker(LOCAL_TIMEOUT=0).get('key'), 'new'
+        )
+
+    def test_local_tier_is_served_between_syncs(self):
+        """Между синхронизациями значение берётся из памяти процесса"""
+        worker = self.make_worker(SYNC_INTERVAL=60)
+        worker.set('key', 'value')
+        caches['shared'].set('key', 'changed behind the back')
+        self.assertEqual(worker.get('key'), 'value')
+
+    def test_local_tier_is_bounded(self):
+        """LRU в памяти не растёт больше LOCAL_MAX_ENTRIES"""
+        worker = self.make_worker(LOCAL_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            worker.set(key, key)
+        self.assertEqual(len(worker._local), 2)
+        self.assertEqual(worker.get_many(['a', 'b', 'c']),
+                         {'a': 'a', 'b': 'b', 'c': 'c'})
+
+
+class FileBasedCacheTest(SimpleTestCase):
+    def test_incr_is_atomic_between_instances(self):
+        """Одновременные incr разных процессов не теряют приращений"""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        FileBasedCache(location, {}).add('seq', 0)
+
+        def increment():
+            # Отдельный экземпляр - как в другом воркере
+            worker = FileBasedCache(location, {})
+            for _ in range(50):
+                worker.incr('seq')
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(FileBasedCache(location, {}).get('seq'), 400)
+
+
+class QueryStatsTest(TestCase):
+    def setUp(self):
+        stats.reset()
+
+    def test_server_timing_header(self):
+        """Ответ содержит заголовок Server-Timing со временем БД"""
+        response = self.client.get('/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_stats_are_for_staff_only(self):
+        """Статистику запросов видит только staff"""
+        self.client.get('/')
+        url = reverse('core:query_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['posts:index']['requests'], 1)
+
+    def test_query_budget_exceeded(self):
+        """Превышение бюджета запросов роняет запрос или пишется в лог"""
+        with patch.object(views.index, 'query_budget', 0, create=True):
+            cache.clear()
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/')
+            cache.clear()
+            with override_settings(QUERY_BUDGET_RAISE=False):
+                with self.assertLogs('core.middleware', 'WARNING'):
+                    self.client.get('/')
+
+    def test_posts_views_declare_budget(self):
+        """Каждый view чтения posts объявляет бюджет запросов"""
+        # Подписка, отписка и комментарий пишут в базу и сразу
+        # перенаправляют: бюджет чтения к ним не относится
+        writes = {'profile_follow', 'profile_unfollow', 'add_comment'}
+        for pattern in posts_urls.urlpatterns:
+            if pattern.name in writes:
+                continue
+            with self.subTest(view=pattern.name):
+                self.assertIsInstance(
+                    getattr(pattern.callback, 'query_budget', None), int
+                )
+
+    def test_fingerprint_groups_repeated_queries(self):
+        """Запросы, отличающиеся числами и IN-списками, совпадают"""
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id = 1 AND a IN (%s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id = 25 AND a IN (%s)'),
+        )
+
+
+@override_settings(REPLICA_DATABASES=['replica1', 'replica2'])
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.reads = []
+        self.marked = replica_reads(
+            lambda request, **kwargs: self.view(request, **kwargs)
+        )
+
+    def view(self, request, write=False):
+        """View, которое запоминает, откуда читает до и после записи"""
+        self.reads.append(self.router.db_for_read(Post))
+        if write:
+            self.router.db_for_write(Post)
+            self.reads.append(self.router.db_for_read(Post))
+        return HttpResponse()
+
+    def call(self, request, view, **kwargs):
+        def get_response(request):
+            middleware.process_view(request, view, (), kwargs)
+            return view(request, **kwargs)
+
+        middleware = ReplicaMiddleware(get_response)
+        return middleware(request)
+
+    def test_marked_view_reads_from_replica(self):
+        """Отмеченное view читает из реплики, остальные - из основной"""
+        self.call(self.factory.get('/'), self.marked)
+        self.call(self.factory.get('/'), self.view)
+        self.call(self.factory.post('/'), self.marked)
+        self.assertIn(self.reads[0], ('replica1', 'replica2'))
+        self.assertEqual(self.reads[1:], ['default', 'default'])
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_write_sticks_reads_to_primary(self):
+        """После записи запрос и следующие запросы читают из основной"""
+        view = self.marked
+        response = self.call(self.factory.get('/'), view, write=True)
+        self.assertEqual(self.reads[1], 'default')
+        cookie = response.cookies[ReplicaMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 5)
+        request = self.factory.get('/')
+        request.COOKIES[ReplicaMiddleware.cookie_name] = cookie.value
+        self.call(request, view)
+        self.assertEqual(self.reads[2], 'default')
+
+    def test_replica_data_is_cached_briefly(self):
+        """Прочитанное из реплики живёт в кеше не дольше задержки"""
+        timeouts = []
+        view = replica_reads(
+            lambda request: timeouts.append(caching.cache_timeout())
+            or HttpResponse()
+        )
+        self.call(self.factory.get('/'), view)
+        self.call(self.factory.post('/'), view)
+        self.assertEqual(timeouts, [
+            settings.REPLICA_LAG_SECONDS, settings.POSTS_CACHE_TIMEOUT
+        ])
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_everything_uses_primary(self):
+        response = self.call(
+            self.factory.get('/'), self.marked, write=True
+        )
+        self.assertEqual(self.reads, ['default', 'default'])
+        self.assertNotIn(ReplicaMiddleware.cookie_name, response.cookies)
+
+    def test_read_only_posts_views_are_marked(self):
+        for view in (
+            views.index, views.group_posts, views.profile,
+            views.post_detail, views.follow_index, views.popular,
+        ):
+            with self.subTest(view=view.__name__):
+                self.assertTrue(getattr(view, 'replica_reads', False))
+        for view in (
+            views.post_create, views.post_edit, views.add_comment,
+            views.profile_follow, views.profile_unfollow,
+        ):
+            with self.subTest(view=view.__name__):
+                self.assertFalse(getattr(view, 'replica_reads', False))
+
+
+class RenderStatsTest(TestCase):
+    def setUp(self):
+        renderstats.install()
+        renderstats.stats.reset()
+
+    def test_templates_tags_and_filters_are_timed(self):
+        """Время считается по шаблонам, тегам и фильтрам"""
+        template = engines['django'].from_string(
+            "{% url 'posts:index' %}{{ text|upper }}"
+            "{% include 'posts/includes/paginator.html' %}"
+        )
+        template.render({'text': 'текст'})
+        timings = renderstats.stats.as_dict()
+        for name in (
+            'template:<строка>', 'tag:URLNode', 'var|upper',
+            'tag:IncludeNode', 'template:posts/includes/paginator.html',
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(timings[name]['renders'], 1)
+        outer = timings['template:<строка>']
+        self.assertLess(outer['self_ms'], outer['total_ms'])
+
+    def test_stats_are_for_staff_only(self):
+        url = reverse('core:render_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get('/')
+        timings = self.client.get(url).json()
+        self.assertIn('template:posts/index.html', timings)
+
+
+class FormRenderTest(TestCase):
+    def test_forms_declare_css_class(self):
+        """Формы сами ставят класс виджетам, addclass его не дублирует"""
+        for form in (PostForm(), CommentForm()):
+            for field in form:
+                with self.subTest(field=field.name):
+                    html = addclass(field, 'form-control')
+                    self.assertEqual(html.count('class="form-control"'), 1)
+                    self.assertEqual(html, field.as_widget())
+
+    def test_other_class_is_still_applied(self):
+        html = addclass(CommentForm()['text'], 'form-control-lg')
+        self.assertIn('class="form-control-lg"', html)
+
+    def test_widget_templates_are_cached(self):
+        """Шаблон виджета разбирается один раз и при DEBUG"""
+        renderer = get_default_renderer()
+        self.assertIsInstance(renderer, CachedWidgetTemplates)
+        name = 'django/forms/widgets/textarea.html'
+        self.assertIs(
+            renderer.get_template(name).template,
+            renderer.get_template(name).template,
+        )
+        self.assertEqual(
+            CommentForm()['text'].as_widget(),
+            CommentForm(renderer=DjangoTemplates())['text'].as_widget(),
+        )
+
+
+calls = []
+
+
+@tasks.task
+def flaky(fail_times):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError('Сбой')
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+        cache.clear()
+
+    def test_post_side_effects_wait_for_worker(self):
+        """Лента подписчика и поиск обновляются воркером"""
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=author)
+        Task.objects.all().delete()
+        Post.objects.create(text='Про море', author=author)
+        self.assertEqual(
+            set(Task.objects.values_list('name', flat=True)),
+            {'posts.tasks.fan_out_post', 'posts.tasks.index_post'}
+        )
+        self.assertFalse(FeedEntry.objects.exists())
+        out = StringIO()
+        call_command('run_tasks', once=True, stdout=out)
+        self.assertIn('Выполнено задач: 2', out.getvalue())
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 1)
+        self.assertEqual(len(search.ranked(search.query_terms('море'))), 1)
+        self.assertFalse(Task.objects.exclude(status=Task.DONE).exists())
+
+    def test_failed_task_is_retried_later(self):
+        task = tasks.enqueue(flaky, 1)
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertEqual(tasks.execute(tasks.claim()), Task.PENDING)
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 1)
+        self.assertIn('Сбой', task.error)
+        self.assertGreater(task.run_after, timezone.now())
+        self.assertIsNone(tasks.claim())
+        Task.objects.update(run_after=timezone.now())
+        self.assertEqual(tasks.work(once=True), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.error), (Task.DONE, ''))
+        self.assertIsNotNone(task.duration)
+
+    @override_settings(TASK_MAX_ATTEMPTS=2, TASK_RETRY_DELAY=0)
+    def test_task_fails_after_last_attempt(self):
+        tasks.enqueue(flaky, 5)
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertEqual(tasks.work(once=True), 2)
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+        self.assertEqual(tasks.stats()['core.tests.flaky']['failed'], 1)
+
+    def test_stuck_task_returns_to_queue(self):
+        task = tasks.enqueue(flaky, 0)
+        tasks.claim()
+        Task.objects.update(
+            started=timezone.now() - timedelta(seconds=60 * 60)
+        )
+        self.assertEqual(tasks.release_stuck(), 1)
+        self.assertEqual(tasks.claim(), task)
+
+    def test_claimed_task_is_not_claimed_again(self):
+        tasks.enqueue(flaky, 0)
+        self.assertIsNotNone(tasks.claim())
+        self.assertIsNone(tasks.claim())
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode_runs_at_once(self):
+        self.assertIsNone(tasks.enqueue(flaky, 0))
+        self.assertEqual(calls, [0])
+        self.assertFalse(Task.objects.exists())
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('queries/', views.query_stats, name='query_stats'),
+    path('tasks/', views.task_stats, name='task_stats'),
+    path('templates/', views.render_stats, name='render_stats'),
+]
@@ -1,5 +1,10 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from . import renderstats, tasks
+from .querystats import stats
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -18,3 +23,30 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def query_stats(request):
+    """Статистика SQL-запросов по view этого процесса, только для staff."""
+    return JsonResponse(
+        stats.as_dict(), json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@staff_member_required
+def task_stats(request):
+    """Очередь фоновых задач и время их выполнения, только для staff."""
+    return JsonResponse(
+        tasks.stats(), json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@staff_member_required
+def render_stats(request):
+    """
+    Время отрисовки шаблонов, тегов и фильтров этого процесса,
+    самые дорогие по собственному времени первыми, только для staff.
+    """
+    return JsonResponse(
+        renderstats.stats.as_dict(), json_dumps_params={'ensure_ascii': False}
+    )
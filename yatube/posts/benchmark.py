@@ -0,0 +1,224 @@
+import math
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max, Min
+from django.template.loader import render_to_string
+from django.test import Client
+from django.urls import reverse
+
+from core.querystats import QueryCollector
+
+from .forms import CommentForm, PostForm
+from .models import Follow, Group, Post, User
+
+# Сценарии бенчмарка в порядке запуска
+SCENARIOS = (
+    'index',
+    'group_posts',
+    'profile',
+    'post_detail',
+    'follow_index',
+    'post_create',
+    'add_comment',
+)
+# Сколько случайных групп, авторов, постов и читателей берёт бенчмарк
+SAMPLE_SIZE = 100
+# Сколько залогиненных клиентов переиспользуется между запросами
+READERS = 20
+PERCENTILES = (50, 95, 99)
+# Сколько раз бенчмарк форм отрисовывает каждую форму
+FORM_RENDERS = 200
+# Метрики, рост которых считается регрессией
+LATENCY_METRICS = tuple(f'p{percent}_ms' for percent in PERCENTILES)
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def _sample_ids(queryset, rng, size):
+    """
+    Случайные ID без ORDER BY RANDOM(): выбираются числа из диапазона
+    первичного ключа, дыры в нём просто уменьшают выборку.
+    """
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return queryset.none()
+    pks = [rng.randint(bounds['low'], bounds['high']) for _ in range(size)]
+    return queryset.filter(pk__in=pks)
+
+
+class Targets:
+    """Случайные страницы, на которые бенчмарк шлёт запросы."""
+
+    def __init__(self, rng, size=SAMPLE_SIZE):
+        self.rng = rng
+        self.groups = list(Group.objects.values_list('slug', flat=True)[:size])
+        posts = _sample_ids(Post.objects.all(), rng, size)
+        self.post_ids = list(posts.values_list('pk', flat=True))
+        self.authors = sorted(set(
+            posts.values_list('author__username', flat=True)
+        ))
+        reader_ids = _sample_ids(Follow.objects.all(), rng, size).values(
+            'user'
+        )
+        self.readers = []
+        for user in User.objects.filter(pk__in=reader_ids)[:READERS]:
+            client = Client()
+            client.force_login(user)
+            self.readers.append(client)
+        self.anonymous = Client()
+        if not (self.groups and self.post_ids and self.readers):
+            raise ValueError(
+                'Для бенчмарка нужны группы, посты и подписки, '
+                'заполните базу командой seed_posts'
+            )
+
+    def request(self, scenario):
+        """Клиент, метод, адрес и данные очередного запроса сценария."""
+        rng = self.rng
+        if scenario == 'index':
+            return self.anonymous.get, reverse('posts:index'), None
+        if scenario == 'group_posts':
+            slug = rng.choice(self.groups)
+            return self.anonymous.get, reverse(
+                'posts:group_list', args=(slug,)
+            ), None
+        if scenario == 'profile':
+            username = rng.choice(self.authors)
+            return self.anonymous.get, reverse(
+                'posts:profile', args=(username,)
+            ), None
+        if scenario == 'post_detail':
+            post_id = rng.choice(self.post_ids)
+            return self.anonymous.get, reverse(
+                'posts:post_detail', args=(post_id,)
+            ), None
+        reader = rng.choice(self.readers)
+        if scenario == 'follow_index':
+            return reader.get, reverse('posts:follow_index'), None
+        if scenario == 'post_create':
+            return reader.post, reverse('posts:post_create'), {
+                'text': f'Пост бенчмарка {rng.random()}'
+            }
+        if scenario == 'add_comment':
+            post_id = rng.choice(self.post_ids)
+            return reader.post, reverse(
+                'posts:add_comment', args=(post_id,)
+            ), {'text': f'Комментарий бенчмарка {rng.random()}'}
+        raise ValueError(f'Неизвестный сценарий {scenario}')
+
+
+def run_scenario(targets, scenario, requests, warmup=0, cold=False):
+    """
+    Выполняет сценарий последовательно через тестовый клиент и
+    возвращает пропускную способность, перцентили задержки и среднее
+    число SQL-запросов. Первые warmup запросов не учитываются.
+    С cold=True кеш сбрасывается перед каждым запросом.
+    """
+    durations = []
+    collector = QueryCollector()
+    for number in range(warmup + requests):
+        method, url, data = targets.request(scenario)
+        if cold:
+            cache.clear()
+        measured = number >= warmup
+        start = time.perf_counter()
+        if measured:
+            with connection.execute_wrapper(collector):
+                response = method(url, data)
+        else:
+            response = method(url, data)
+        elapsed = time.perf_counter() - start
+        if response.status_code not in (200, 302):
+            raise ValueError(
+                f'{scenario}: {url} ответил {response.status_code}'
+            )
+        if measured:
+            durations.append(elapsed)
+    result = {
+        'requests': requests,
+        'rps': round(requests / sum(durations), 2),
+        'queries': round(collector.count / requests, 2),
+    }
+    for percent in PERCENTILES:
+        result[f'p{percent}_ms'] = round(
+            percentile(durations, percent) * 1000, 3
+        )
+    return result
+
+
+def run(scenarios=SCENARIOS, requests=100, warmup=10, cold=False, seed=0):
+    targets = Targets(random.Random(seed))
+    return {
+        scenario: run_scenario(targets, scenario, requests, warmup, cold)
+        for scenario in scenarios
+    }
+
+
+def _form_pages(renderer=None):
+    """
+    Шаблон с формой страниц post_create и post_detail и функция,
+    собирающая его контекст: форма создаётся заново на каждую
+    отрисовку, как в запросе.
+    """
+    reader = SimpleNamespace(is_authenticated=True)
+    post = Post(pk=1)
+    return {
+        'post_create': ('includes/form_control.html', lambda: {
+            'form': PostForm(renderer=renderer),
+        }),
+        'post_detail': ('includes/added_comment.html', lambda: {
+            'form': CommentForm(renderer=renderer), 'post': post,
+            'user': reader, 'csrf_token': 'benchmark',
+        }),
+    }
+
+
+def run_forms(renders=FORM_RENDERS, renderer=None):
+    """
+    Среднее время отрисовки формы страниц post_create и post_detail
+    без запроса и остальной страницы, в миллисекундах. renderer -
+    рендерер форм вместо FORM_RENDERER, чтобы их сравнить.
+    """
+    results = {}
+    for page, (template_name, context) in _form_pages(renderer).items():
+        # Первая отрисовка загружает и компилирует шаблоны
+        render_to_string(template_name, context())
+        start = time.perf_counter()
+        for _ in range(renders):
+            render_to_string(template_name, context())
+        elapsed = time.perf_counter() - start
+        results[page] = round(elapsed / renders * 1000, 3)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Регрессии относительно сохранённых результатов: задержка выросла
+    больше чем на долю tolerance или SQL-запросов стало больше.
+    """
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if base is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f'{scenario}: {metric} {result[metric]} '
+                    f'вместо {base[metric]}'
+                )
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f'{scenario}: {result["queries"]} SQL-запросов '
+                f'вместо {base["queries"]}'
+            )
+    return regressions
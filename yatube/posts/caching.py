@@ -0,0 +1,236 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import routers
+
+from . import links
+from .models import Comment, Follow, Post
+from .utils import (
+    CURSOR_PARAM, KEY, CursorPaginator, POST_LIMIT, comment_page,
+    page_paginator,
+)
+
+INDEX = 'index'
+# До скольких постов число для навигации главной всегда точное
+EXACT_TOTAL_LIMIT = 1000
+# Сколько секунд большая лента показывает одно и то же число постов
+TOTAL_TIMEOUT = 300
+# Список популярных постов: меняется при пересчёте popular
+TRENDING = 'trending'
+# Рекомендации авторов: меняются после расчёта refresh_suggestions
+SUGGESTIONS = 'suggestions'
+# Карточки постов в лентах: меняется при изменении комментариев и групп
+CARDS = 'cards'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def _version_key(scope):
+    return f'posts:version:{scope}'
+
+
+def _initial_version():
+    # Версия, созданная заново после вытеснения из кеша, должна быть
+    # больше любой прежней, иначе оживут устаревшие записи.
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    """Текущие версии областей кеша одним обращением к кешу."""
+    keys = {scope: _version_key(scope) for scope in scopes}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for scope, key in keys.items():
+        if key not in found:
+            cache.add(key, _initial_version(), None)
+            found[key] = cache.get(key)
+        versions[scope] = found[key]
+    return versions
+
+
+def invalidate(*scopes):
+    """Сбрасывает всё, что закешировано в областях scopes."""
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Версию вытеснили из общего кеша. Удаление дойдёт и до LRU
+            # воркеров (перезапись - нет), а get_versions заведёт
+            # версию больше прежней
+            cache.delete(key)
+
+
+def cache_timeout():
+    """
+    Данные, прочитанные из реплики, могут отставать от основной базы,
+    поэтому живут в кеше не дольше, чем идёт репликация, и под
+    отдельными ключами (см. _digest): читающий из основной базы
+    их не увидит.
+    """
+    if routers.reading_from_replica():
+        return settings.REPLICA_LAG_SECONDS
+    return settings.POSTS_CACHE_TIMEOUT
+
+
+def _digest(*parts):
+    parts = (routers.reading_from_replica(), parts)
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def object_key(prefix, *parts):
+    """Ключ записи кеша, собранный из версий областей и других частей."""
+    return prefix + _digest(*parts)
+
+
+def feed_page(queryset, request, *scopes, total=None, key=KEY):
+    """
+    Страница ленты. Список ID постов страницы, курсоры навигации и
+    число постов total (значение или функция, см. CursorPaginator)
+    хранятся в кеше, пока не изменится версия одной из областей scopes.
+    key - поля ключа паджинации в queryset.
+    """
+    versions = get_versions(scopes)
+    position = (
+        request.GET.get(CURSOR_PARAM, ''), request.GET.get('page', '')
+    )
+    cache_key = 'posts:feed:' + _digest(sorted(versions.items()), position)
+    cached = cache.get(cache_key)
+    if cached is None:
+        page = page_paginator(queryset, request, total, key)
+        cache.set(cache_key, (
+            [post.pk for post in page],
+            page.number,
+            page.next_cursor,
+            page.previous_cursor,
+            page.window,
+            page.paginator.total,
+        ), cache_timeout())
+    else:
+        ids, number, next_cursor, previous_cursor, window, total = cached
+        posts = queryset.in_bulk(ids)
+        page = CursorPaginator(queryset, POST_LIMIT, total).make_page(
+            [posts[pk] for pk in ids if pk in posts],
+            number, next_cursor, previous_cursor, window,
+        )
+    attach_cards(page)
+    return page
+
+
+def post_total():
+    """
+    Число постов для навигации главной. COUNT(*) выполняется раз на
+    версию INDEX, а при больших числах - ещё и не чаще раза в
+    TOTAL_TIMEOUT секунд: в большой ленте точное число не нужно.
+    """
+    key = object_key('posts:total:', get_versions([INDEX])[INDEX])
+    total = cache.get(key)
+    if total is None:
+        total = cache.get('posts:total')
+        if total is None:
+            total = Post.objects.count()
+            if total > EXACT_TOTAL_LIMIT:
+                cache.set('posts:total', total, TOTAL_TIMEOUT)
+        cache.set(key, total, cache_timeout())
+    return total
+
+
+def comment_batch(post_id, cursor=None):
+    """
+    Пачка комментариев поста в виде словарей и курсор следующей.
+    Пачка хранится в кеше, пока у поста не изменятся комментарии.
+    """
+    scope = post_scope(post_id)
+    key = 'posts:comments:' + _digest(
+        post_id, get_versions([scope])[scope], cursor or ''
+    )
+    cached = cache.get(key)
+    if cached is None:
+        comments, next_cursor = comment_page(
+            Comment.objects.filter(post_id=post_id).select_related(
+                'author'
+            ).only('text', 'created', 'author', 'author__username'),
+            cursor,
+        )
+        cached = ([
+            {
+                'id': comment.pk,
+                'author': comment.author.username,
+                'author_url': links.url(
+                    'posts:profile', comment.author.username
+                ),
+                'text': comment.text,
+                'created': comment.created,
+            }
+            for comment in comments
+        ], next_cursor)
+        cache.set(key, cached, cache_timeout())
+    return cached
+
+
+def followed_ids(user):
+    """ID авторов, на которых подписан пользователь, из кеша."""
+    scope = follow_scope(user.pk)
+    key = 'posts:following:' + _digest(
+        user.pk, get_versions([scope])[scope]
+    )
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(Follow.objects.filter(
+            user=user
+        ).values_list('author_id', flat=True))
+        cache.set(key, author_ids, cache_timeout())
+    return author_ids
+
+
+def followed_scopes(user):
+    """Области кеша, от которых зависит лента подписок пользователя."""
+    return [follow_scope(user.pk)] + [
+        author_scope(author_id) for author_id in followed_ids(user)
+    ]
+
+
+def attach_cards(posts):
+    """
+    Подставляет постам ключи и готовый HTML карточек из кеша.
+    Карточка зависит от самого поста, его комментариев и группы.
+    """
+    posts = list(posts)
+    scopes = set()
+    for post in posts:
+        scopes.add(post_scope(post.pk))
+        if post.group_id:
+            scopes.add(group_scope(post.group_id))
+    versions = get_versions(scopes)
+    for post in posts:
+        post.card_key = 'posts:card:' + _digest(
+            post.pk,
+            versions[post_scope(post.pk)],
+            versions.get(group_scope(post.group_id)),
+        )
+    found = cache.get_many([post.card_key for post in posts])
+    for post in posts:
+        post.card_html = found.get(post.card_key)
+
+
+def save_card(post, html):
+    key = getattr(post, 'card_key', None)
+    if key is not None:
+        cache.set(key, html, cache_timeout())
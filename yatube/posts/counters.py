@@ -0,0 +1,83 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Comment, Counter, Follow, Post
+
+POSTS = Counter.POSTS
+COMMENTS = Counter.COMMENTS
+FOLLOWERS = Counter.FOLLOWERS
+GROUP_POSTS = Counter.GROUP_POSTS
+
+# Откуда пересчитываются счётчики: модель и поле с ID объекта
+SOURCES = {
+    POSTS: (Post, 'author_id'),
+    COMMENTS: (Comment, 'post_id'),
+    FOLLOWERS: (Follow, 'author_id'),
+    GROUP_POSTS: (Post, 'group_id'),
+}
+BATCH_SIZE = 1000
+
+
+def increment(kind, object_id, delta=1):
+    """Атомарно меняет счётчик через F(), создавая его при необходимости."""
+    counters = Counter.objects.filter(kind=kind, object_id=object_id)
+    if counters.update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            Counter.objects.create(kind=kind, object_id=object_id, value=delta)
+    except IntegrityError:
+        # Счётчик успел создать параллельный запрос
+        counters.update(value=F('value') + delta)
+
+
+def decrement(kind, object_id):
+    increment(kind, object_id, -1)
+
+
+def get_count(kind, object_id):
+    value = Counter.objects.filter(
+        kind=kind, object_id=object_id
+    ).values_list('value', flat=True).first()
+    return value or 0
+
+
+def get_counts(kind, object_ids):
+    """Счётчики сразу для многих объектов одним запросом."""
+    values = dict(Counter.objects.filter(
+        kind=kind, object_id__in=object_ids
+    ).values_list('object_id', 'value'))
+    return {object_id: values.get(object_id, 0) for object_id in object_ids}
+
+
+def total(kind):
+    """Сумма счётчиков одного вида, например число всех постов."""
+    return Counter.objects.filter(kind=kind).aggregate(
+        total=Sum('value')
+    )['total'] or 0
+
+
+def forget(kind, object_id):
+    Counter.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild(kind):
+    """Пересчитывает счётчики одного вида по исходной таблице."""
+    model, field = SOURCES[kind]
+    totals = (
+        model.objects.exclude(**{field: None}).order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values_list(field, 'total')
+    )
+    with transaction.atomic():
+        Counter.objects.filter(kind=kind).delete()
+        batch = []
+        for object_id, total in totals.iterator():
+            batch.append(
+                Counter(kind=kind, object_id=object_id, value=total)
+            )
+            if len(batch) >= BATCH_SIZE:
+                Counter.objects.bulk_create(batch)
+                batch = []
+        Counter.objects.bulk_create(batch)
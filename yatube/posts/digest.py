@@ -0,0 +1,157 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Max
+from django.db.models.functions import Substr
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .models import Digest, Follow, Post, User
+
+# Сколько подписчиков обрабатывается за один проход
+CHUNK_SIZE = 1000
+# Сколько постов перечислять в письме и сколько символов текста
+MAX_POSTS = 10
+TEXT_LENGTH = 200
+SUBJECT = 'Новые посты авторов, на которых вы подписаны'
+# Запас по времени для постов, сохранявшихся, пока начиналась
+# прошлая рассылка
+DATE_MARGIN = timedelta(minutes=5)
+
+
+def _start():
+    """
+    Незаконченная рассылка или новая: посты после последней
+    законченной. Первая рассылка только запоминает последний пост,
+    чтобы не слать подписчикам весь архив.
+    """
+    digest = Digest.objects.filter(finished__isnull=True).first()
+    if digest is not None:
+        return digest
+    newest = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+    previous = Digest.objects.order_by('-pk').first()
+    if previous is None:
+        return Digest.objects.create(
+            first_post_id=newest, last_post_id=newest,
+            finished=timezone.now(),
+        )
+    if newest <= previous.last_post_id:
+        return None
+    return Digest.objects.create(
+        first_post_id=previous.last_post_id, last_post_id=newest
+    )
+
+
+def _since(digest):
+    """
+    Посты рассылки не старше начала прошлой: загрузка и заполнение
+    базы добавляют архивные посты с ключами после последнего поста
+    рассылки, но со старыми датами.
+    """
+    created = Digest.objects.filter(pk__lt=digest.pk).order_by(
+        '-pk'
+    ).values_list('created', flat=True).first()
+    return created - DATE_MARGIN if created is not None else None
+
+
+def _follower_chunks(after_user_id, chunk_size):
+    """Подписки пачками подписчиков по возрастанию ID."""
+    follows = Follow.objects.order_by('user_id')
+    while True:
+        user_ids = list(follows.filter(
+            user_id__gt=after_user_id
+        ).values_list('user_id', flat=True).distinct()[:chunk_size])
+        if not user_ids:
+            return
+        authors = defaultdict(list)
+        for user_id, author_id in Follow.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', 'author_id'):
+            authors[user_id].append(author_id)
+        after_user_id = user_ids[-1]
+        yield after_user_id, authors
+
+
+def _posts_by_author(digest, author_ids, since):
+    """Новые посты авторов, от новых к старым, с началом текста."""
+    posts = defaultdict(list)
+    rows = Post.objects.filter(
+        author_id__in=author_ids,
+        pk__gt=digest.first_post_id,
+        pk__lte=digest.last_post_id,
+    )
+    if since is not None:
+        rows = rows.filter(pub_date__gt=since)
+    rows = rows.order_by('-pk').annotate(
+        preview=Substr('text', 1, TEXT_LENGTH + 1)
+    ).values_list('pk', 'author_id', 'author__username', 'preview')
+    for pk, author_id, username, preview in rows:
+        posts[author_id].append({
+            'pk': pk,
+            'url': settings.SITE_URL + reverse(
+                'posts:post_detail', args=(pk,)
+            ),
+            'author': username,
+            'text': Truncator(preview).chars(TEXT_LENGTH),
+        })
+    return posts
+
+
+def _messages(digest, authors, since):
+    posts = _posts_by_author(
+        digest, {pk for ids in authors.values() for pk in ids}, since
+    )
+    recipients = User.objects.filter(
+        pk__in=[user_id for user_id, ids in authors.items()
+                if any(author_id in posts for author_id in ids)],
+        is_active=True,
+    ).exclude(email='').values_list('pk', 'username', 'email')
+    for user_id, username, email in recipients:
+        user_posts = sorted(
+            (post for author_id in authors[user_id]
+             for post in posts.get(author_id, ())),
+            key=lambda post: post['pk'], reverse=True,
+        )
+        body = render_to_string('posts/digest_email.txt', {
+            'username': username,
+            'posts': user_posts[:MAX_POSTS],
+            'more': len(user_posts) - MAX_POSTS,
+            'site_url': settings.SITE_URL,
+        })
+        yield EmailMessage(SUBJECT, body, to=[email])
+
+
+def send_digests(chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Рассылает подписчикам по одному письму со всеми новыми постами
+    их авторов. Подписки обходятся пачками, письма пачки уходят
+    через одно соединение с почтовым сервером, открытое на всю
+    рассылку. После каждой пачки запоминается последний подписчик,
+    и прерванная рассылка продолжается с него.
+    """
+    digest = _start()
+    if digest is None or digest.finished is not None:
+        return None
+    since = _since(digest)
+    connection = get_connection()
+    connection.open()
+    try:
+        for last_user_id, authors in _follower_chunks(
+            digest.last_user_id, chunk_size
+        ):
+            messages = list(_messages(digest, authors, since))
+            sent = connection.send_messages(messages) if messages else 0
+            digest.last_user_id = last_user_id
+            digest.sent += sent or 0
+            digest.save(update_fields=['last_user_id', 'sent'])
+            if progress is not None:
+                progress(f'Писем отправлено: {digest.sent}')
+    finally:
+        connection.close()
+    digest.finished = timezone.now()
+    digest.save(update_fields=['finished'])
+    return digest
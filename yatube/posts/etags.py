@@ -0,0 +1,132 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from core import routers
+
+from . import caching
+from .models import Group, Post, User
+
+
+def conditional(etag_func):
+    """
+    Декоратор view: condition(etag_func=...) отвечает 304 Not Modified,
+    если ETag страницы не изменился, не выполняя саму view.
+    Страница зависит от пользователя, поэтому хранить её может только
+    браузер, и перед показом он каждый раз сверяет ETag.
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func)(view_func)
+
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return inner
+    return decorator
+
+
+def page_etag(request, *scopes, form=False):
+    """
+    ETag страницы из версий областей кеша, от которых она зависит,
+    и пользователя, от которого зависят шапка и кнопки. Версии
+    меняются сигналами при любом изменении данных, а читаются из
+    кеша без запросов к базе. form - на странице есть форма
+    с токеном CSRF: тогда в ETag входит и кука CSRF.
+    """
+    versions = sorted(caching.get_versions(scopes).items())
+    parts = [request.user.pk, versions]
+    if form:
+        # Вход меняет куку CSRF, и страница с прежним токеном в форме
+        # не должна подходить. Кука создаётся уже здесь, чтобы ETag
+        # первого ответа совпал со следующим запросом
+        get_token(request)
+        parts.append(request.META['CSRF_COOKIE'])
+    if routers.reading_from_replica():
+        # Версии меняются сразу, а реплика может ещё отставать:
+        # страница из реплики со свежим ETag перестаёт совпадать
+        # не позже, чем закончится репликация
+        parts.append(int(time.time() // settings.REPLICA_LAG_SECONDS))
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _viewer_scopes(request):
+    """Подписки читателя: от них зависят отметки на карточках."""
+    if request.user.is_authenticated:
+        return [caching.follow_scope(request.user.pk)]
+    return []
+
+
+def _row(model, fields, **lookup):
+    """Поля одной строки по уникальному ключу или None, если её нет."""
+    try:
+        return model.objects.filter(**lookup).values_list(*fields).get()
+    except model.DoesNotExist:
+        return None
+
+
+def index(request):
+    return page_etag(
+        request, caching.INDEX, caching.CARDS, *_viewer_scopes(request)
+    )
+
+
+def popular(request):
+    # Карточки удалённых и изменённых постов меняются вместе с INDEX
+    return page_etag(
+        request, caching.TRENDING, caching.INDEX, caching.CARDS,
+        *_viewer_scopes(request)
+    )
+
+
+def group_posts(request, slug):
+    group = _row(Group, ['pk'], slug=slug)
+    if group is None:
+        return None
+    return page_etag(
+        request, caching.group_scope(group[0]), caching.CARDS,
+        *_viewer_scopes(request)
+    )
+
+
+def profile(request, username):
+    author = _row(User, ['pk'], username=username)
+    if author is None:
+        return None
+    scopes = [
+        caching.author_scope(author[0]), caching.CARDS, caching.SUGGESTIONS
+    ]
+    if request.user.is_authenticated:
+        # Кнопка «Подписаться» / «Отписаться»
+        scopes.append(caching.follow_scope(request.user.pk))
+    return page_etag(request, *scopes)
+
+
+def post_detail(request, post_id):
+    post = _row(Post, ['author_id', 'group_id'], pk=post_id)
+    if post is None:
+        return None
+    author_id, group_id = post
+    scopes = [
+        caching.post_scope(post_id), caching.author_scope(author_id),
+        *_viewer_scopes(request),
+    ]
+    if group_id is not None:
+        scopes.append(caching.group_scope(group_id))
+    # Форма комментария есть только у вошедших
+    return page_etag(
+        request, *scopes, form=request.user.is_authenticated
+    )
+
+
+def follow_index(request):
+    return page_etag(
+        request, caching.CARDS, caching.SUGGESTIONS,
+        *caching.followed_scopes(request.user)
+    )
@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from . import counters
+from .models import Counter, FeedEntry, Follow, Post
+
+# Сколько записей ленты сохраняется одним INSERT
+BATCH_SIZE = 1000
+# Поля ключа паджинации ленты подписок (см. follow_feed)
+FEED_KEY = ('feed_pub_date', 'feed_post_id')
+
+
+def _save_entries(entries):
+    """Сохраняет записи ленты пачками по BATCH_SIZE."""
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def followers_count(author_id):
+    return counters.get_count(counters.FOLLOWERS, author_id)
+
+
+def is_heavy(author_id):
+    """
+    Автор с очень большим числом подписчиков не рассылает посты по лентам:
+    его посты подмешиваются в ленту при чтении.
+    """
+    return followers_count(author_id) > settings.FEED_FANOUT_LIMIT
+
+
+def heavy_authors(user):
+    """Авторы из подписок пользователя, посты которых читаются без рассылки."""
+    followed = Follow.objects.filter(user=user).values('author')
+    return list(Counter.objects.filter(
+        kind=counters.FOLLOWERS,
+        object_id__in=followed,
+        value__gt=settings.FEED_FANOUT_LIMIT,
+    ).values_list('object_id', flat=True))
+
+
+def fan_out_post(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if is_heavy(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _save_entries(
+        FeedEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for user_id in follower_ids.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту нового подписчика все посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    _save_entries(
+        FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def on_unfollow(user_id, author_id):
+    """Убирает посты автора из ленты бывшего подписчика."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def follower_ids(author_id):
+    return Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).iterator()
+
+
+def rebuild():
+    """
+    Заново раскладывает посты по лентам всех подписчиков.
+    Записи вставляются одним INSERT ... SELECT без выгрузки в Python:
+    лент бывают миллионы строк.
+    """
+    heavy = Counter.objects.filter(
+        kind=counters.FOLLOWERS, value__gt=settings.FEED_FANOUT_LIMIT
+    ).values('object_id')
+    rows = Follow.objects.exclude(author_id__in=heavy).filter(
+        author__posts__isnull=False
+    ).order_by().values_list(
+        'user_id', 'author__posts', 'author__posts__pub_date'
+    )
+    select, params = rows.query.sql_with_params()
+    table = connection.ops.quote_name(FeedEntry._meta.db_table)
+    with transaction.atomic():
+        FeedEntry.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, post_id, pub_date) {select}',
+                params,
+            )
+
+
+def follow_feed(user):
+    """
+    Посты ленты подписок пользователя с полями ключа FEED_KEY. Обычная
+    лента листается по дате и посту записей ленты: страница читается
+    по индексу (user, pub_date, post) без сортировки всех записей
+    читателя. Ленту с постами «тяжёлых» авторов листает индекс постов.
+    """
+    heavy = heavy_authors(user)
+    if not heavy:
+        return Post.objects.filter(feed_entries__user=user).annotate(
+            feed_pub_date=F('feed_entries__pub_date'),
+            feed_post_id=F('feed_entries__post'),
+        )
+    return Post.objects.filter(
+        Q(pk__in=FeedEntry.objects.filter(user=user).values('post'))
+        | Q(author_id__in=heavy)
+    ).annotate(feed_pub_date=F('pub_date'), feed_post_id=F('pk'))
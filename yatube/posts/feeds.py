@@ -0,0 +1,63 @@
+from django.db.models import IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import counters, fanout
+from .models import Counter, Post
+
+# Поля, которые нужны карточке поста в includes/post.html
+CARD_FIELDS = (
+    'text',
+    'pub_date',
+    'image',
+    'thumbnail',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group',
+    'group__slug',
+    'group__title',
+)
+
+
+def feed_queryset(queryset=None):
+    """
+    Посты для карточек ленты: автор и группа подтягиваются одним JOIN,
+    из таблиц выбираются только нужные карточке поля, а число
+    комментариев берётся из счётчика для каждой строки страницы.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    return with_comment_count(
+        queryset.select_related('author', 'group').only(*CARD_FIELDS)
+    )
+
+
+def with_comment_count(queryset):
+    """Число комментариев поста из счётчика подзапросом в той же строке."""
+    comment_count = Counter.objects.filter(
+        kind=counters.COMMENTS, object_id=OuterRef('pk')
+    ).values('value')[:1]
+    return queryset.annotate(comment_count=Coalesce(
+        Subquery(comment_count, output_field=IntegerField()), Value(0)
+    ))
+
+
+def index_feed():
+    return feed_queryset()
+
+
+def group_feed(group):
+    return feed_queryset(Post.objects.filter(group=group))
+
+
+def author_feed(author):
+    return feed_queryset(Post.objects.filter(author=author))
+
+
+# Поля ключа паджинации ленты подписок
+FOLLOW_KEY = fanout.FEED_KEY
+
+
+def follow_feed(user):
+    return feed_queryset(fanout.follow_feed(user))
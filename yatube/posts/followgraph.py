@@ -0,0 +1,366 @@
+import logging
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (
+    DEFAULT_DB_ALIAS, DatabaseError, connection, transaction,
+)
+
+from . import caching, counters
+from .graph import TYPECODE, Adjacency
+from .models import Follow
+
+logger = logging.getLogger(__name__)
+
+# Номер последнего изменения подписок в общем кеше
+SEQ_KEY = 'posts:follows:seq'
+# Изменение с номером N: (user_id, author_id, подписан ли теперь)
+LOG_KEY = 'posts:follows:log:{}'
+# Сколько изменений хранится в журнале
+LOG_SIZE = 10000
+# Поколение журнала: меняется, когда подписки загружены мимо него
+EPOCH_KEY = 'posts:follows:epoch'
+
+
+def _shared():
+    """
+    Журнал пишется мимо локального уровня двухуровневого кеша:
+    номер изменения каждый воркер должен видеть сразу.
+    """
+    return getattr(cache, 'shared', cache)
+
+
+def _epoch(shared):
+    """Текущее поколение журнала; после сброса кеша - новое."""
+    shared.add(EPOCH_KEY, uuid.uuid4().hex, None)
+    return shared.get(EPOCH_KEY)
+
+
+def _insert(values, value):
+    index = bisect_left(values, value)
+    if index == len(values) or values[index] != value:
+        values.insert(index, value)
+
+
+def _remove(values, value):
+    index = bisect_left(values, value)
+    if index < len(values) and values[index] == value:
+        del values[index]
+
+
+def _contains(values, value):
+    index = bisect_left(values, value)
+    return index < len(values) and values[index] == value
+
+
+class FollowGraph:
+    """
+    Все подписки в памяти воркера: списки подписок и подписчиков
+    в массивах Adjacency. Массивы не меняются после загрузки, поэтому
+    загруженный до fork граф делят все воркеры. Подписки и отписки
+    после загрузки хранятся отдельными списками только для затронутых
+    пользователей и рассылаются другим воркерам через журнал в общем
+    кеше, как сбросы двухуровневого кеша. Номер изменения выдаёт
+    атомарный incr общего кеша. Воркер читает журнал не чаще раза
+    в SYNC_INTERVAL секунд и загружает граф заново, если пропустил
+    изменения или граф старше RELOAD_INTERVAL секунд. Загрузка идёт
+    в фоновом потоке, а не в запросе; граф с пропущенными изменениями
+    до её конца помечен устаревшим, и подписки читаются из базы.
+    """
+
+    def __init__(self, sync_interval=None, reload_interval=None,
+                 background=True):
+        options = getattr(settings, 'FOLLOW_GRAPH', {})
+        self._sync_interval = (
+            options.get('SYNC_INTERVAL', 1)
+            if sync_interval is None else sync_interval
+        )
+        self._reload_interval = (
+            options.get('RELOAD_INTERVAL', 3600)
+            if reload_interval is None else reload_interval
+        )
+        self._lock = threading.RLock()
+        self._base_following = None
+        self._base_followers = None
+        self._following = {}
+        self._followers = {}
+        self._seen = None
+        self._epoch = None
+        self._next_sync = 0
+        self._expires = 0
+        self._background = background
+        self._stale = False
+        self._reloading = False
+
+    @property
+    def loaded(self):
+        return self._base_following is not None
+
+    @property
+    def usable(self):
+        """Граф загружен и не пропустил изменений."""
+        return self.loaded and not self._stale
+
+    def load(self):
+        """
+        Читает подписки из базы. Номер журнала запоминается до чтения:
+        изменения во время загрузки будут применены ещё раз, а это
+        безопасно. Читается основная база: реплика может отставать
+        от журнала.
+        """
+        shared = _shared()
+        epoch = _epoch(shared)
+        seq = shared.get(SEQ_KEY) or 0
+        follows = Follow.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'user_id', 'author_id'
+        )
+        following = Adjacency(
+            follows.order_by('user_id', 'author_id').iterator()
+        )
+        followers = Adjacency(
+            (author_id, user_id) for user_id, author_id in
+            follows.order_by('author_id', 'user_id').iterator()
+        )
+        with self._lock:
+            self._base_following = following
+            self._base_followers = followers
+            self._following = {}
+            self._followers = {}
+            self._seen = seq
+            self._epoch = epoch
+            self._stale = False
+            now = time.monotonic()
+            self._next_sync = now + self._sync_interval
+            self._expires = now + self._reload_interval
+
+    def reload(self, stale=False):
+        """
+        Загружает граф заново в фоновом потоке, не дольше одной
+        загрузки за раз. stale - граф пропустил изменения и до конца
+        загрузки не отвечает.
+        """
+        with self._lock:
+            self._stale = self._stale or stale
+            if self._reloading:
+                return
+            self._reloading = True
+        if not self._background:
+            self._reload()
+            return
+        threading.Thread(target=self._reload_in_thread, daemon=True).start()
+
+    def _reload(self):
+        try:
+            self.load()
+        except DatabaseError:
+            logger.exception('Не удалось загрузить граф подписок')
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def _reload_in_thread(self):
+        try:
+            self._reload()
+        finally:
+            # У потока своё соединение с БД
+            connection.close()
+
+    def _list(self, changed, base, key):
+        values = changed.get(key)
+        if values is None:
+            values = base[key]
+        return values
+
+    def _apply(self, user_id, author_id, followed):
+        with self._lock:
+            for changed, base, key, value in (
+                (self._following, self._base_following, user_id, author_id),
+                (self._followers, self._base_followers, author_id, user_id),
+            ):
+                values = changed.get(key)
+                if values is None:
+                    values = changed[key] = array(TYPECODE, base[key])
+                if followed:
+                    _insert(values, value)
+                else:
+                    _remove(values, value)
+
+    def record(self, user_id, author_id, followed):
+        """Подписка или отписка: применяется здесь и уходит в журнал."""
+        shared = _shared()
+        self.sync()
+        try:
+            seq = shared.incr(SEQ_KEY)
+        except ValueError:
+            shared.add(SEQ_KEY, 0, None)
+            seq = shared.incr(SEQ_KEY)
+        shared.set(LOG_KEY.format(seq), (user_id, author_id, followed), None)
+        shared.delete(LOG_KEY.format(seq - LOG_SIZE))
+        with self._lock:
+            if not self.loaded:
+                return
+            self._apply(user_id, author_id, followed)
+            if self._seen == seq - 1:
+                # Своё изменение перечитывать не нужно
+                self._seen = seq
+
+    def sync(self):
+        """
+        Применяет чужие изменения из журнала. Пропуск в журнале
+        делает граф устаревшим до фоновой загрузки.
+        """
+        now = time.monotonic()
+        if not self.loaded or now < self._next_sync:
+            return
+        self._next_sync = now + self._sync_interval
+        if self._stale:
+            # Прошлая загрузка могла не удаться
+            self.reload(stale=True)
+            return
+        if now >= self._expires:
+            # Граф верен, пока грузится новый
+            self._expires = now + self._reload_interval
+            self.reload()
+        shared = _shared()
+        values = shared.get_many([SEQ_KEY, EPOCH_KEY])
+        if values.get(EPOCH_KEY) != self._epoch:
+            # Сброшенный общий кеш или загрузка мимо журнала
+            self.reload(stale=True)
+            return
+        seq = values.get(SEQ_KEY) or 0
+        if seq == self._seen:
+            return
+        if not 0 < seq - self._seen <= LOG_SIZE:
+            self.reload(stale=True)
+            return
+        log_keys = [LOG_KEY.format(n) for n in range(self._seen + 1, seq + 1)]
+        messages = shared.get_many(log_keys)
+        if len(messages) < len(log_keys):
+            self.reload(stale=True)
+            return
+        with self._lock:
+            for key in log_keys:
+                self._apply(*messages[key])
+            self._seen = seq
+
+    def sync_next(self):
+        """Следующий sync() прочитает журнал, не дожидаясь интервала."""
+        self._next_sync = 0
+
+    def is_following(self, user_id, author_id):
+        return _contains(
+            self._list(self._following, self._base_following, user_id),
+            author_id,
+        )
+
+    def following(self, user_id):
+        """Отсортированные ID авторов, на которых подписан user_id."""
+        return list(
+            self._list(self._following, self._base_following, user_id)
+        )
+
+    def follower_count(self, author_id):
+        return len(
+            self._list(self._followers, self._base_followers, author_id)
+        )
+
+
+graph = FollowGraph()
+
+
+def _ready():
+    """
+    Граф годится для ответа вне транзакции: внутри неё запрос может
+    видеть собственные ещё не подтверждённые подписки, а граф узнаёт
+    о них только после фиксации. Пока граф не загружен или пропустил
+    изменения, отвечает база, а граф загружается в фоне.
+    """
+    if connection.in_atomic_block:
+        return False
+    if not graph.loaded:
+        graph.reload()
+        return False
+    graph.sync()
+    return graph.usable
+
+
+def preload():
+    """
+    Загрузка при старте воркера; до миграций граф загрузится позже,
+    при первом запросе.
+    """
+    try:
+        graph.load()
+    except DatabaseError:
+        pass
+
+
+def reset():
+    """
+    Подписки загружены в базу мимо журнала (bulk_create): все
+    воркеры загрузят граф заново, а до того читают базу.
+    """
+    _shared().set(EPOCH_KEY, uuid.uuid4().hex, None)
+
+
+def on_request_started():
+    """
+    Запрос видит все изменения, сделанные до него: после подписки
+    редирект может попасть в другой воркер, и тот прочитает журнал
+    при первом обращении к графу, а не через SYNC_INTERVAL.
+    """
+    graph.sync_next()
+
+
+def on_change(user_id, author_id, followed):
+    """Изменение попадает в граф после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: graph.record(user_id, author_id, followed)
+    )
+
+
+def is_following(user, author):
+    if not user.is_authenticated:
+        return False
+    if _ready():
+        return graph.is_following(user.pk, author.pk)
+    return Follow.objects.filter(user=user, author=author).exists()
+
+
+def following(user):
+    """ID авторов, на которых подписан пользователь."""
+    if _ready():
+        return graph.following(user.pk)
+    return sorted(caching.followed_ids(user))
+
+
+def annotate(user, posts):
+    """
+    Отмечает у каждого поста author_followed: подписан ли user на его
+    автора. Подписки берутся из графа без запросов к базе, а в
+    транзакции - из списка подписок в кеше, один запрос на версию
+    подписок читателя, но не запрос на карточку. Карточки в кеше
+    общие для всех читателей, поэтому отметка выводится рядом.
+    """
+    if not user.is_authenticated:
+        followed = ()
+    elif _ready():
+        followed = {
+            author_id for author_id in {post.author_id for post in posts}
+            if graph.is_following(user.pk, author_id)
+        }
+    else:
+        followed = set(caching.followed_ids(user))
+    for post in posts:
+        post.author_followed = post.author_id in followed
+
+
+def follower_count(author):
+    if _ready():
+        return graph.follower_count(author.pk)
+    return counters.get_count(counters.FOLLOWERS, author.pk)
@@ -1,9 +1,13 @@
 from django import forms
 
+from core.forms import FormControlMixin
+from core.tasks import enqueue
+
+from . import tasks
 from .models import Comment, Post
 
 
-class PostForm(forms.ModelForm):
+class PostForm(FormControlMixin, forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
@@ -12,8 +16,19 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост',
         }
 
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            # Миниатюра прежней картинки больше не подходит: пока
+            # не построена новая, страницы покажут саму картинку
+            self.instance.thumbnail = ''
+        post = super().save(commit)
+        if commit and 'image' in self.changed_data:
+            # Миниатюра строится в фоне, страницы только читают её имя
+            enqueue(tasks.generate_thumbnail, post.pk)
+        return post
+
 
-class CommentForm(forms.ModelForm):
+class CommentForm(FormControlMixin, forms.ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
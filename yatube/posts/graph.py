@@ -0,0 +1,55 @@
+from array import array
+from bisect import bisect_left
+
+# Тип элементов массивов: знаковое 32-битное целое, как AutoField
+TYPECODE = 'i'
+
+
+class Adjacency:
+    """
+    Списки смежности в формате CSR: отсортированные ключи, смещения
+    их списков и все значения подряд в трёх массивах array. Ребро
+    занимает 4 байта вместо объекта Python, ключ ищется бинарным
+    поиском.
+    """
+
+    def __init__(self, pairs):
+        """pairs - пары (ключ, значение) по возрастанию ключа и значения."""
+        self.keys = array(TYPECODE)
+        self.offsets = array('q', [0])
+        self.values = array(TYPECODE)
+        last = None
+        for key, value in pairs:
+            if key != last:
+                if last is not None:
+                    self.offsets.append(len(self.values))
+                self.keys.append(key)
+                last = key
+            self.values.append(value)
+        if last is not None:
+            self.offsets.append(len(self.values))
+
+    def _index(self, key):
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return None
+
+    def __getitem__(self, key):
+        """Отсортированный список значений ключа, пустой для чужого."""
+        index = self._index(key)
+        if index is None:
+            return self.values[:0]
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def degree(self, key):
+        index = self._index(key)
+        if index is None:
+            return 0
+        return self.offsets[index + 1] - self.offsets[index]
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
@@ -0,0 +1,100 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.forms.renderers import DjangoTemplates
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет пропускную способность и перцентили задержки страниц '
+        'постов через тестовый клиент и сравнивает их с сохранёнными'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            dest='scenarios',
+            choices=benchmark.SCENARIOS,
+            help='Какие сценарии запустить, по умолчанию все',
+        )
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=10,
+            help='Сколько первых запросов сценария не учитывать',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Сбрасывать кеш перед каждым запросом',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--forms',
+            action='store_true',
+            help='Измерить только отрисовку форм страниц post_create '
+                 'и post_detail',
+        )
+        parser.add_argument(
+            '--output',
+            help='Куда сохранить результаты в JSON, например как новый '
+                 'эталон',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON с эталонными результатами для сравнения',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Допустимый рост задержки относительно эталона, доля',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('Нужен хотя бы один запрос')
+        if options['forms']:
+            default = benchmark.run_forms(renderer=DjangoTemplates())
+            for page, duration in benchmark.run_forms().items():
+                self.stdout.write(
+                    f'{page}: форма за {duration} мс, '
+                    f'с рендерером Django по умолчанию {default[page]} мс'
+                )
+            return
+        try:
+            results = benchmark.run(
+                scenarios=options['scenarios'] or benchmark.SCENARIOS,
+                requests=options['requests'],
+                warmup=options['warmup'],
+                cold=options['cold'],
+                seed=options['seed'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        for scenario, result in results.items():
+            self.stdout.write(
+                f'{scenario}: {result["rps"]} запросов/с, '
+                f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, '
+                f'p99 {result["p99_ms"]} мс, '
+                f'{result["queries"]} SQL-запросов'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            regressions = benchmark.compare(
+                results, baseline, options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессии производительности:\n'
+                    + '\n'.join(regressions)
+                )
+            self.stdout.write('Регрессий нет')
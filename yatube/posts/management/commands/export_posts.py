@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в каталог '
+        'файлами JSON Lines или CSV. Прерванная выгрузка продолжается '
+        'с последней сохранённой пачки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default=transfer.JSONL
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        try:
+            transfer.export_data(
+                options['directory'],
+                fmt=options['format'],
+                batch_size=options['batch_size'],
+                progress=self.stdout.write,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(f'Данные выгружены в {options["directory"]}')
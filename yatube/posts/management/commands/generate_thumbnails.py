@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры картинок постов, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить миниатюры всех постов с картинками',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько миниатюр строить параллельно, 0 - без потоков',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(thumbnail='')
+        post_ids = posts.order_by('pk').values_list('pk', flat=True)
+        done = 0
+        if options['workers'] > 0:
+            pool = ThreadPoolExecutor(max_workers=options['workers'])
+            results = pool.map(
+                thumbnails.generate_in_worker, post_ids.iterator()
+            )
+        else:
+            pool = None
+            results = map(thumbnails.generate, post_ids.iterator())
+        for _ in results:
+            done += 1
+            if done % 100 == 0:
+                self.stdout.write(f'Готово миниатюр: {done}')
+        if pool is not None:
+            pool.shutdown()
+        self.stdout.write(f'Готово миниатюр: {done}')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии и подписки, выгруженные '
+        'командой export_posts. Прерванная загрузка продолжается '
+        'с последней сохранённой пачки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default=transfer.JSONL
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        try:
+            transfer.import_data(
+                options['directory'],
+                fmt=options['format'],
+                batch_size=options['batch_size'],
+                progress=self.stdout.write,
+            )
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        self.stdout.write(f'Данные загружены из {options["directory"]}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Counter
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики по исходным таблицам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            dest='kinds',
+            choices=[kind for kind, _ in Counter.KINDS],
+            help='Какие счётчики пересчитать, по умолчанию все',
+        )
+
+    def handle(self, *args, **options):
+        for kind in options['kinds'] or counters.SOURCES:
+            counters.rebuild(kind)
+            self.stdout.write(f'Счётчики {kind} пересчитаны')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации авторов по общим подписчикам для '
+        'пользователей, чьи подписки изменились. Запускается по '
+        'расписанию, например cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать рекомендации всем пользователям',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=recommendations.CHUNK_SIZE,
+            help='Сколько пользователей обрабатывать за проход',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным')
+        users = recommendations.refresh(
+            options['full'], options['chunk_size'],
+            progress=self.stdout.write,
+        )
+        self.stdout.write(f'Рекомендации пересчитаны: {users} пользователей')
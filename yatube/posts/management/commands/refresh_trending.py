@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счета популярности постов на текущий момент и '
+        'список популярных. Запускается по расписанию, например cron'
+    )
+
+    def handle(self, *args, **options):
+        top = trending.refresh()
+        self.stdout.write(f'Популярных постов: {len(top)}')
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу воспроизводимым набором пользователей, групп, '
+        'постов, подписок и комментариев для бенчмарка. Объёмы как '
+        'в продакшене: --users 100000 --posts 1000000 --follows 5000000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора: одно зерно - одни и те же данные',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя')
+        if seeding.seeded_users().exists() or seeding.seeded_groups().exists():
+            raise CommandError(
+                'База уже заполнена сгенерированными данными, '
+                'используйте чистую базу'
+            )
+        seeding.seed(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            follows=options['follows'],
+            comments=options['comments'],
+            seed=options['seed'],
+            progress=self.stdout.write,
+        )
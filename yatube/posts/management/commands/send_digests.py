@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import digest
+
+
+class Command(BaseCommand):
+    help = (
+        'Рассылает подписчикам письма с новыми постами их авторов '
+        'с прошлой рассылки. Запускается по расписанию, например cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=digest.CHUNK_SIZE,
+            help='Сколько подписчиков обрабатывать за проход',
+        )
+
+    def handle(self, *args, **options):
+        result = digest.send_digests(
+            options['chunk_size'], progress=self.stdout.write
+        )
+        if result is None:
+            self.stdout.write('Новых постов для рассылки нет')
+        else:
+            self.stdout.write(f'Рассылка закончена: {result.sent} писем')
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:15
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Счётчик и источник: модель и поле с ID объекта
+SOURCES = (
+    ('posts', 'Post', 'author_id'),
+    ('comments', 'Comment', 'post_id'),
+    ('followers', 'Follow', 'author_id'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    """Считает счётчики по уже существующим данным."""
+    Counter = apps.get_model('posts', 'Counter')
+    for kind, model_name, field in SOURCES:
+        model = apps.get_model('posts', model_name)
+        totals = (
+            model.objects.order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values_list(field, 'total')
+        )
+        Counter.objects.bulk_create(
+            Counter(kind=kind, object_id=object_id, value=total)
+            for object_id, total in totals.iterator()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('posts', 'Посты автора'), ('comments', 'Комментарии к посту'), ('followers', 'Подписчики автора')], max_length=20, verbose_name='Счётчик')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID автора или поста')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Счётчик',
+                'verbose_name_plural': 'Счётчики',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='counter',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_counter'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:44
+
+from django.db import OperationalError, migrations, models
+import django.db.models.deletion
+
+# Таблица и её DDL зафиксированы здесь: миграция не должна зависеть
+# от текущего кода posts.search
+FTS_TABLE = 'posts_search'
+
+
+def create_fts_table(apps, schema_editor):
+    """
+    Создаёт таблицу FTS5, если база её поддерживает.
+    Уже существующие посты индексирует команда rebuild_search_index.
+    """
+    db_connection = schema_editor.connection
+    if db_connection.vendor != 'sqlite':
+        return
+    try:
+        with db_connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f'USING fts5(text, comments)'
+            )
+    except OperationalError:
+        # SQLite собран без FTS5, поиск пойдёт через SearchTerm
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Основа слова')),
+                ('weight', models.PositiveIntegerField(verbose_name='Вес')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Слово поискового индекса',
+                'verbose_name_plural': 'Слова поискового индекса',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_search_term'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
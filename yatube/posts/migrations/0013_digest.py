@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_comment_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Digest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_post_id', models.PositiveIntegerField(verbose_name='После поста')),
+                ('last_post_id', models.PositiveIntegerField(verbose_name='По пост')),
+                ('last_user_id', models.PositiveIntegerField(default=0, verbose_name='Разослано до')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Отправлено писем')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Начата')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Закончена')),
+            ],
+            options={
+                'verbose_name': 'Дайджест',
+                'verbose_name_plural': 'Дайджесты',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:15
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_group_counters(apps, schema_editor):
+    """Считает посты уже существующих групп."""
+    Counter = apps.get_model('posts', 'Counter')
+    Post = apps.get_model('posts', 'Post')
+    totals = (
+        Post.objects.exclude(group=None).order_by()
+        .values('group_id')
+        .annotate(total=Count('pk'))
+        .values_list('group_id', 'total')
+    )
+    Counter.objects.bulk_create(
+        Counter(kind='group_posts', object_id=group_id, value=total)
+        for group_id, total in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_digest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='counter',
+            name='kind',
+            field=models.CharField(choices=[('posts', 'Посты автора'), ('comments', 'Комментарии к посту'), ('followers', 'Подписчики автора'), ('group_posts', 'Посты группы')], max_length=20, verbose_name='Счётчик'),
+        ),
+        migrations.AlterField(
+            model_name='counter',
+            name='object_id',
+            field=models.PositiveIntegerField(verbose_name='ID автора, поста или группы'),
+        ),
+        migrations.RunPython(fill_group_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('user_id', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='ID пользователя')),
+                ('for_reader', models.TextField(default='[]', verbose_name='Кого почитать, JSON')),
+                ('similar', models.TextField(default='[]', verbose_name='Похожие авторы, JSON')),
+                ('stale', models.BooleanField(db_index=True, default=True, verbose_name='Устарели')),
+                ('updated', models.DateTimeField(blank=True, null=True, verbose_name='Посчитаны')),
+            ],
+            options={
+                'verbose_name': 'Рекомендации',
+                'verbose_name_plural': 'Рекомендации',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_feedentry_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendation',
+            name='marked',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Помечены устаревшими'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.db import models
 
+from . import links
+
 User = get_user_model()
 
 
@@ -52,15 +55,60 @@ class Post(models.Model):
     )
     # Аргумент upload_to указывает директориюб
     # в которую будут загружаться пользовательские файлы
+    # Миниатюра картинки для карточки, её строит posts.thumbnails
+    thumbnail = models.CharField(
+        'Миниатюра',
+        max_length=255,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы под ключ паджинации (pub_date, id) каждой ленты
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def thumbnail_url(self):
+        """Миниатюра, а пока её нет - исходная картинка."""
+        if self.thumbnail:
+            return default_storage.url(self.thumbnail)
+        return self.image.url if self.image else ''
+
+    @property
+    def url(self):
+        return links.url('posts:post_detail', self.pk)
+
+    @property
+    def author_url(self):
+        return links.url('posts:profile', self.author.username)
+
+    @property
+    def follow_url(self):
+        return links.url('posts:profile_follow', self.author.username)
+
+    @property
+    def group_url(self):
+        return links.url('posts:group_list', self.group.slug)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -83,6 +131,15 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    class Meta:
+        # Индекс под ключ паджинации комментариев поста (created, id)
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -96,3 +153,185 @@ class Follow(models.Model):
         verbose_name='Автор поста',
         related_name='following'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+        # Подписчики автора без обращения к таблице, для рассылки постов
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Читатель',
+        related_name='feed_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='feed_entries'
+    )
+    # Копия Post.pub_date: лента листается по индексу этой таблицы,
+    # без сортировки всех записей читателя
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            ),
+        ]
+        # Ключ паджинации ленты подписок (pub_date, post)
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feedentry_user_pub_date_idx'
+            ),
+        ]
+
+
+class Counter(models.Model):
+    """Денормализованный счётчик, который не нужно считать через COUNT(*)."""
+    POSTS = 'posts'
+    COMMENTS = 'comments'
+    FOLLOWERS = 'followers'
+    GROUP_POSTS = 'group_posts'
+    KINDS = (
+        (POSTS, 'Посты автора'),
+        (COMMENTS, 'Комментарии к посту'),
+        (FOLLOWERS, 'Подписчики автора'),
+        (GROUP_POSTS, 'Посты группы'),
+    )
+    kind = models.CharField('Счётчик', max_length=20, choices=KINDS)
+    object_id = models.PositiveIntegerField('ID автора, поста или группы')
+    value = models.IntegerField('Значение', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'object_id'],
+                name='unique_counter'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}={self.value}'
+
+
+class SearchTerm(models.Model):
+    """
+    Запись инвертированного индекса поиска: основа слова и пост,
+    в тексте или комментариях которого она встречается.
+    """
+    term = models.CharField('Основа слова', max_length=64)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='search_terms'
+    )
+    weight = models.PositiveIntegerField('Вес')
+
+    class Meta:
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = 'Слова поискового индекса'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'post'],
+                name='unique_search_term'
+            ),
+        ]
+
+
+class Digest(models.Model):
+    """
+    Рассылка дайджеста новых постов подписчикам: посты с ключами
+    от first_post_id (не включая) до last_post_id, опубликованные
+    после начала прошлой рассылки (см. posts.digest). last_user_id -
+    последний подписчик, которому письмо уже ушло, с него
+    продолжается прерванная рассылка.
+    """
+    first_post_id = models.PositiveIntegerField('После поста')
+    last_post_id = models.PositiveIntegerField('По пост')
+    last_user_id = models.PositiveIntegerField('Разослано до', default=0)
+    sent = models.PositiveIntegerField('Отправлено писем', default=0)
+    created = models.DateTimeField('Начата', auto_now_add=True)
+    finished = models.DateTimeField('Закончена', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Дайджест'
+        verbose_name_plural = 'Дайджесты'
+
+    def __str__(self):
+        return f'Посты {self.first_post_id + 1}-{self.last_post_id}'
+
+
+class Trending(models.Model):
+    """
+    Счёт популярности поста с затуханием во времени на момент base
+    (см. posts.trending). Моменты хранятся Unix-временем, чтобы
+    затухание считалось в UPDATE одинаково в любой базе.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Пост',
+    )
+    score = models.FloatField('Счёт', default=0, db_index=True)
+    base = models.FloatField('Счёт на момент')
+
+    class Meta:
+        verbose_name = 'Популярность поста'
+        verbose_name_plural = 'Популярность постов'
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score:.2f}'
+
+
+class Recommendation(models.Model):
+    """
+    Готовые рекомендации пользователю (см. posts.recommendations):
+    авторы, которых ему стоит почитать, и авторы, похожие на него
+    самого по общим подписчикам. Списки хранятся в JSON вместе с
+    именами авторов и читаются одной строкой по ключу. Как и у
+    счётчиков, ключ - просто ID: строку пересоздаёт сигнал подписки,
+    в том числе пока пользователь удаляется.
+    """
+    user_id = models.PositiveIntegerField('ID пользователя', primary_key=True)
+    for_reader = models.TextField('Кого почитать, JSON', default='[]')
+    similar = models.TextField('Похожие авторы, JSON', default='[]')
+    # Подписки пользователя или на него изменились с прошлого расчёта
+    stale = models.BooleanField('Устарели', default=True, db_index=True)
+    # Когда stale поставлен в последний раз: отметку, поставленную
+    # во время расчёта, сохранение результата не снимает
+    marked = models.DateTimeField(
+        'Помечены устаревшими', null=True, blank=True
+    )
+    updated = models.DateTimeField('Посчитаны', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Рекомендации'
+        verbose_name_plural = 'Рекомендации'
+
+    def __str__(self):
+        return f'Рекомендации {self.user_id}'
@@ -0,0 +1,8 @@
+def can_edit(user, post):
+    """Править и удалять пост может только его автор."""
+    return user.is_authenticated and post.author_id == user.pk
+
+
+def can_follow(user, author):
+    """Подписаться можно на любого автора, кроме самого себя."""
+    return user.is_authenticated and author.pk != user.pk
@@ -0,0 +1,236 @@
+import functools
+import heapq
+import json
+import math
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching
+from .graph import Adjacency
+from .models import Follow, Recommendation, User
+
+# Сколько пользователей обрабатывается за проход
+CHUNK_SIZE = 1000
+# Сколько авторов в каждом списке рекомендаций
+TOP_SIZE = 5
+# Сколько похожих авторов запоминается для каждого автора
+NEIGHBOURS = 20
+# Меньше стольких общих подписчиков сходство считается случайным
+MIN_COMMON = 2
+# Пользователи с большим числом подписок (боты, коллекционеры)
+# не учитываются в сходстве авторов
+MAX_FOLLOWING = 1000
+# Сколько подписчиков автора берётся для расчёта его сходства
+MAX_FOLLOWERS = 10000
+
+
+class Graph:
+    """
+    Граф подписок в компактных массивах: кто на кого подписан и кто
+    подписан на кого. Подписки читаются из базы потоком, в памяти
+    остаются только массивы, 8 байт на подписку.
+    """
+
+    def __init__(self):
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        self.following = Adjacency(
+            follows.order_by('user_id', 'author_id').iterator()
+        )
+        self.followers = Adjacency(
+            (author_id, user_id) for user_id, author_id in
+            follows.order_by('author_id', 'user_id').iterator()
+        )
+
+    def similar(self, author_id):
+        """
+        Авторы, на которых подписаны подписчики author_id, по
+        косинусной мере: общие подписчики, делённые на корень из
+        произведения числа подписчиков. Подсчёт общих идёт через
+        Counter.update целыми массивами подписок, без цикла Python
+        по каждой подписке.
+        """
+        counts = Counter()
+        for user_id in self.followers[author_id][:MAX_FOLLOWERS]:
+            following = self.following[user_id]
+            if len(following) <= MAX_FOLLOWING:
+                counts.update(following)
+        counts.pop(author_id, None)
+        size = self.followers.degree(author_id)
+        return heapq.nlargest(NEIGHBOURS, (
+            (common / math.sqrt(size * self.followers.degree(other)), other)
+            for other, common in counts.items()
+            if common >= MIN_COMMON
+        ))
+
+    def for_reader(self, user_id, similar):
+        """
+        Авторы, похожие на тех, кого читает user_id: сходства
+        складываются по всем его подпискам. similar - функция
+        похожих авторов с запоминанием.
+        """
+        following = self.following[user_id]
+        scores = Counter()
+        for author_id in following:
+            for score, other in similar(author_id):
+                scores[other] += score
+        for author_id in following:
+            scores.pop(author_id, None)
+        scores.pop(user_id, None)
+        return [other for other, _ in scores.most_common(TOP_SIZE)]
+
+
+def _stale_users():
+    """
+    ID пользователей, чьи подписки изменились. Флаг снимает _save()
+    только после записи рекомендаций: прерванный расчёт повторится.
+    """
+    return sorted(Recommendation.objects.filter(stale=True).values_list(
+        'user_id', flat=True
+    ).iterator())
+
+
+def _names(user_ids):
+    """Имя для ссылки на каждого пользователя: username и полное имя."""
+    names = {}
+    for pk, username, first_name, last_name in User.objects.filter(
+        pk__in=user_ids
+    ).values_list('pk', 'username', 'first_name', 'last_name'):
+        names[pk] = {
+            'id': pk,
+            'username': username,
+            'name': f'{first_name} {last_name}'.strip(),
+        }
+    return names
+
+
+def _save(chunk, now):
+    """
+    Записывает списки пачки вместе с именами авторов, чтобы страницы
+    читали их одной строкой, и снимает флаг stale. now - начало
+    расчёта: флаг, поставленный подпиской позже, остаётся.
+    """
+    names = _names({
+        author_id
+        for _, for_reader, similar in chunk
+        for author_id in for_reader + similar
+    })
+    with transaction.atomic():
+        Recommendation.objects.bulk_create(
+            [Recommendation(user_id=user_id, stale=False)
+             for user_id, _, _ in chunk],
+            ignore_conflicts=True,
+        )
+        rows = Recommendation.objects.in_bulk(
+            [user_id for user_id, _, _ in chunk]
+        )
+        for user_id, for_reader, similar in chunk:
+            row = rows[user_id]
+            row.for_reader = json.dumps(
+                [names[pk] for pk in for_reader if pk in names]
+            )
+            row.similar = json.dumps(
+                [names[pk] for pk in similar if pk in names]
+            )
+            row.updated = now
+        Recommendation.objects.bulk_update(
+            rows.values(), ['for_reader', 'similar', 'updated']
+        )
+        _clear_stale(list(rows), now)
+
+
+def _clear_stale(user_ids, now):
+    Recommendation.objects.filter(
+        user_id__in=user_ids, stale=True
+    ).exclude(marked__gte=now).update(stale=False)
+
+
+def refresh(full=False, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Пересчитывает рекомендации и возвращает число пользователей.
+    С full - всем, кто подписан или у кого есть подписчики, иначе
+    только тем, чьи подписки изменились с прошлого расчёта (и у
+    кого изменились подписчики). Похожие авторы считаются по мере
+    надобности и запоминаются в пределах пачки пользователей,
+    поэтому сверх графа в памяти только одна пачка.
+    """
+    now = timezone.now()
+    if full:
+        graph = Graph()
+        user_ids = sorted(set(graph.following) | set(graph.followers))
+    else:
+        user_ids = _stale_users()
+        graph = Graph()
+    for start in range(0, len(user_ids), chunk_size):
+        neighbours = functools.lru_cache(maxsize=None)(graph.similar)
+        chunk = [
+            (
+                user_id,
+                graph.for_reader(user_id, neighbours),
+                [other for _, other in neighbours(user_id)][:TOP_SIZE],
+            )
+            for user_id in user_ids[start:start + chunk_size]
+        ]
+        _save(chunk, now)
+        if progress is not None:
+            progress(f'Рекомендации: {start + len(chunk)} пользователей')
+    if full:
+        # Удалённые пользователи и те, у кого не осталось ни подписок,
+        # ни подписчиков
+        Recommendation.objects.exclude(
+            user_id__in=User.objects.values('pk')
+        ).delete()
+        empty = Recommendation.objects.filter(
+            Q(updated__lt=now) | Q(updated=None)
+        )
+        _clear_stale(empty.values('user_id'), now)
+        empty.update(for_reader='[]', similar='[]', updated=now)
+    caching.invalidate(caching.SUGGESTIONS)
+    return len(user_ids)
+
+
+def mark_stale(*user_ids):
+    """Подписки этих пользователей изменились: пересчитать их."""
+    now = timezone.now()
+    Recommendation.objects.bulk_create(
+        [Recommendation(user_id=user_id, marked=now) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    Recommendation.objects.filter(user_id__in=user_ids).update(
+        stale=True, marked=now
+    )
+
+
+def _authors(user_id, field):
+    """
+    Авторы из готового списка field пользователя user_id. Список
+    хранится в кеше до следующего расчёта.
+    """
+    key = caching.object_key(
+        'posts:suggestions:', field, user_id,
+        caching.get_versions([caching.SUGGESTIONS]),
+    )
+    authors = cache.get(key)
+    if authors is None:
+        authors = json.loads(Recommendation.objects.filter(
+            user_id=user_id
+        ).values_list(field, flat=True).first() or '[]')
+        cache.set(key, authors, caching.cache_timeout())
+    return authors
+
+
+def similar_authors(author):
+    """Кого ещё читают подписчики author."""
+    return _authors(author.pk, 'similar')
+
+
+def who_to_follow(user):
+    """Кого почитать user: без тех, на кого он подписался после расчёта."""
+    followed = set(caching.followed_ids(user))
+    return [
+        author for author in _authors(user.pk, 'for_reader')
+        if author['id'] not in followed
+    ]
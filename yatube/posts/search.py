@@ -0,0 +1,398 @@
+import binascii
+import itertools
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, FloatField, Q, Sum, Value, When
+)
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from . import caching, counters, feeds
+from .models import Comment, Post, SearchTerm
+from .utils import CURSOR_PARAM, NEXT, POST_LIMIT, PREVIOUS, CursorPaginator
+
+# Таблица SQLite FTS5 с основами слов постов, rowid - ID поста
+FTS_TABLE = 'posts_search'
+# Слова текста поста важнее слов его комментариев
+TEXT_WEIGHT = 2
+COMMENT_WEIGHT = 1
+MAX_TERM_LENGTH = 64
+# Сколько слов запроса учитывается
+MAX_QUERY_TERMS = 10
+BATCH_SIZE = 1000
+
+_WORD = re.compile(r'[^\W_]+')
+
+# Стеммер Портера для русского языка (Snowball)
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DERIVATIONAL_SUFFIX = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word):
+    """Основа русского слова, остальные слова не меняются."""
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if match is None:
+        return word
+    prefix, rv = match.groups()
+    stripped = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        stripped = _ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = _PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if _DERIVATIONAL.match(rv):
+        rv = _DERIVATIONAL_SUFFIX.sub('', rv, 1)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return prefix + rv
+
+
+def terms(text):
+    """Основы всех слов текста в порядке появления."""
+    return [stem(word)[:MAX_TERM_LENGTH] for word in _WORD.findall(text)]
+
+
+def query_terms(query):
+    """Различные основы слов запроса, не больше MAX_QUERY_TERMS."""
+    return list(dict.fromkeys(terms(query)))[:MAX_QUERY_TERMS]
+
+
+# Хранение индекса
+
+_fts_tables = {}
+
+
+def use_fts():
+    """
+    Искать через FTS5 или через таблицу SearchTerm.
+    Наличие таблицы FTS5 проверяется один раз для каждой базы.
+    """
+    if not settings.POST_SEARCH_FTS or connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = (
+            FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_tables[name]
+
+
+def documents(posts, comments):
+    """
+    Документы индекса: (ID поста, текст, тексты комментариев).
+    Комментарии выбираются одним запросом на BATCH_SIZE постов.
+    """
+    batch = []
+    for post in posts.order_by('pk').values_list('pk', 'text').iterator():
+        batch.append(post)
+        if len(batch) >= BATCH_SIZE:
+            yield from _with_comments(batch, comments)
+            batch = []
+    yield from _with_comments(batch, comments)
+
+
+def _with_comments(batch, comments):
+    texts = {}
+    for post_id, text in comments.filter(
+        post_id__in=[post_id for post_id, _ in batch]
+    ).order_by('pk').values_list('post_id', 'text'):
+        texts.setdefault(post_id, []).append(text)
+    for post_id, text in batch:
+        yield post_id, text, texts.get(post_id, [])
+
+
+def index_documents(docs, fts, term_model=SearchTerm):
+    """Добавляет документы в индекс FTS5 или в таблицу term_model."""
+    rows = []
+    for post_id, text, comment_texts in docs:
+        text_terms = terms(text)
+        comment_terms = terms(' '.join(comment_texts))
+        if fts:
+            rows.append(
+                (post_id, ' '.join(text_terms), ' '.join(comment_terms))
+            )
+        else:
+            weights = Counter()
+            for term in text_terms:
+                weights[term] += TEXT_WEIGHT
+            for term in comment_terms:
+                weights[term] += COMMENT_WEIGHT
+            rows.extend(
+                term_model(term=term, post_id=post_id, weight=weight)
+                for term, weight in weights.items()
+            )
+        if len(rows) >= BATCH_SIZE:
+            _save_rows(rows, fts, term_model)
+            rows = []
+    _save_rows(rows, fts, term_model)
+
+
+def _save_rows(rows, fts, term_model):
+    if not rows:
+        return
+    if not fts:
+        term_model.objects.bulk_create(rows)
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text, comments) '
+            f'VALUES (%s, %s, %s)',
+            rows,
+        )
+
+
+def remove_post(post_id):
+    if use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+    else:
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+
+def index_post(post_id):
+    """Переиндексирует пост вместе с его комментариями."""
+    with transaction.atomic():
+        remove_post(post_id)
+        index_documents(
+            documents(Post.objects.filter(pk=post_id), Comment.objects),
+            use_fts(),
+        )
+
+
+def index_comment(comment_id):
+    """
+    Добавляет в индекс поста только слова нового комментария: пост
+    и прежние комментарии не перечитываются.
+    """
+    comment = Comment.objects.filter(pk=comment_id).values_list(
+        'post_id', 'text'
+    ).first()
+    if comment is None:
+        return
+    post_id, text = comment
+    comment_terms = terms(text)
+    if not comment_terms:
+        return
+    if use_fts():
+        # FTS5 не дописывает колонку: основы добавляются к строке
+        # в самой базе, без выборки и разбора остальных комментариев
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {FTS_TABLE} SET comments = comments || ' ' || %s "
+                f"WHERE rowid = %s",
+                [' '.join(comment_terms), post_id],
+            )
+        return
+    try:
+        with transaction.atomic():
+            _add_weights(post_id, Counter(comment_terms))
+    except IntegrityError:
+        # Пост успел переиндексироваться вместе с этим комментарием
+        index_post(post_id)
+
+
+def _add_weights(post_id, counts):
+    """Прибавляет веса основ комментария, запрос на каждое число вхождений."""
+    existing = set(SearchTerm.objects.filter(
+        post_id=post_id, term__in=counts
+    ).values_list('term', flat=True))
+    by_count = {}
+    for term in existing:
+        by_count.setdefault(counts[term], []).append(term)
+    for count, same in by_count.items():
+        SearchTerm.objects.filter(post_id=post_id, term__in=same).update(
+            weight=F('weight') + count * COMMENT_WEIGHT
+        )
+    SearchTerm.objects.bulk_create(
+        SearchTerm(term=term, post_id=post_id, weight=count * COMMENT_WEIGHT)
+        for term, count in counts.items() if term not in existing
+    )
+
+
+def rebuild(progress=None):
+    """Строит индекс заново по всем постам и комментариям."""
+    fts = use_fts()
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        if fts:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        docs = documents(Post.objects.all(), Comment.objects)
+        done = 0
+        while True:
+            batch = list(itertools.islice(docs, BATCH_SIZE))
+            if not batch:
+                break
+            index_documents(batch, fts)
+            done += len(batch)
+            if progress is not None:
+                progress(f'Проиндексировано постов: {done}')
+
+
+# Поиск
+
+def encode_cursor(direction, post_id, score, number):
+    payload = f'{direction}|{score!r}|{post_id}|{number}'
+    return urlsafe_base64_encode(force_bytes(payload))
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор. Для испорченного курсора возвращает None."""
+    try:
+        payload = urlsafe_base64_decode(cursor).decode()
+        direction, score, post_id, number = payload.split('|')
+        score, post_id, number = float(score), int(post_id), int(number)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or number < 1:
+        return None
+    return direction, score, post_id, number
+
+
+def _fts_ranked(query, position, limit):
+    """(ID поста, score) по bm25: чем меньше score, тем выше пост."""
+    match = ' '.join(f'"{term}"' for term in query)
+    where, params, order = '', [match], 'score, post_id DESC'
+    if position is not None:
+        direction, score, post_id = position
+        if direction == NEXT:
+            where = 'WHERE score > %s OR (score = %s AND post_id < %s)'
+        else:
+            where = 'WHERE score < %s OR (score = %s AND post_id > %s)'
+            order = 'score DESC, post_id'
+        params += [score, score, post_id]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT post_id, score FROM ('
+            f'SELECT rowid AS post_id, bm25({FTS_TABLE}, {TEXT_WEIGHT}, '
+            f'{COMMENT_WEIGHT}) AS score FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s) {where} '
+            f'ORDER BY {order} LIMIT %s',
+            params + [limit],
+        )
+        return cursor.fetchall()
+
+
+def _index_ranked(query, position, limit):
+    """
+    (ID поста, score) по TF-IDF из таблицы SearchTerm. Score взят со
+    знаком минус, чтобы порядок совпадал с bm25 из FTS5.
+    """
+    frequencies = dict(SearchTerm.objects.filter(term__in=query).values(
+        'term'
+    ).annotate(posts=Count('pk')).values_list('term', 'posts'))
+    if len(frequencies) < len(query):
+        return []
+    total = counters.total(counters.POSTS)
+    score = Sum(Case(*[
+        When(term=term, then=ExpressionWrapper(
+            F('weight') * Value(-math.log(1 + total / frequency)),
+            output_field=FloatField(),
+        ))
+        for term, frequency in frequencies.items()
+    ], output_field=FloatField()))
+    rows = SearchTerm.objects.filter(term__in=query).values(
+        'post_id'
+    ).annotate(matched=Count('pk'), score=score).filter(matched=len(query))
+    order = ('score', '-post_id')
+    if position is not None:
+        direction, score, post_id = position
+        if direction == NEXT:
+            rows = rows.filter(
+                Q(score__gt=score) | Q(score=score, post_id__lt=post_id)
+            )
+        else:
+            rows = rows.filter(
+                Q(score__lt=score) | Q(score=score, post_id__gt=post_id)
+            )
+            order = ('-score', 'post_id')
+    return list(
+        rows.order_by(*order).values_list('post_id', 'score')[:limit]
+    )
+
+
+def ranked(query, position=None, limit=POST_LIMIT):
+    """
+    Посты, в которых есть все основы query, по убыванию релевантности.
+    position - (направление, score, ID поста), после которого начать.
+    """
+    if not query:
+        return []
+    if use_fts():
+        return _fts_ranked(query, position, limit)
+    return _index_ranked(query, position, limit)
+
+
+def search_page(query, request):
+    """Страница результатов поиска с курсорами по (score, id)."""
+    query = query_terms(query)
+    decoded = decode_cursor(request.GET.get(CURSOR_PARAM, ''))
+    direction, number, position = NEXT, 1, None
+    if decoded is not None:
+        direction, score, post_id, number = decoded
+        position = (direction, score, post_id)
+    rows = ranked(query, position, POST_LIMIT + 1)
+    has_more = len(rows) > POST_LIMIT
+    rows = rows[:POST_LIMIT]
+    if direction == PREVIOUS:
+        rows.reverse()
+        if not has_more:
+            # Дошли до начала выдачи: показываем полную первую страницу
+            rows, number = ranked(query, None, POST_LIMIT + 1), 1
+            has_next, has_previous = len(rows) > POST_LIMIT, False
+            rows = rows[:POST_LIMIT]
+        else:
+            has_next, has_previous = True, True
+    else:
+        has_next, has_previous = has_more, number > 1
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(NEXT, *rows[-1], number + 1)
+    if rows and has_previous:
+        previous_cursor = encode_cursor(PREVIOUS, *rows[0], number - 1)
+    posts = feeds.feed_queryset().in_bulk([post_id for post_id, _ in rows])
+    page = CursorPaginator(Post.objects.none(), POST_LIMIT).make_page(
+        [posts[post_id] for post_id, _ in rows if post_id in posts],
+        number, next_cursor, previous_cursor,
+    )
+    caching.attach_cards(page)
+    return page
@@ -0,0 +1,165 @@
+import itertools
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from . import caching, counters, fanout, followgraph, search
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Префиксы имён сгенерированных объектов, по ним их можно найти и удалить
+USERNAME_PREFIX = 'seed_'
+GROUP_SLUG_PREFIX = 'seed-group-'
+BATCH_SIZE = 5000
+# Популярность авторов распределена по закону Ципфа с этим показателем
+ZIPF_EXPONENT = 1.1
+# Доля постов без группы
+NO_GROUP_SHARE = 0.3
+WORDS = (
+    'пост', 'лента', 'подписка', 'автор', 'группа', 'комментарий',
+    'новость', 'утро', 'вечер', 'город', 'дорога', 'книга', 'музыка',
+    'фильм', 'кофе', 'погода', 'работа', 'отпуск', 'море', 'горы',
+    'лес', 'река', 'друг', 'семья', 'проект', 'код', 'релиз', 'идея',
+    'вопрос', 'ответ', 'сегодня', 'вчера', 'завтра', 'очень', 'немного',
+    'хороший', 'новый', 'первый', 'последний', 'интересный',
+)
+
+
+def seeded_users():
+    return User.objects.filter(username__startswith=USERNAME_PREFIX)
+
+
+def seeded_groups():
+    return Group.objects.filter(slug__startswith=GROUP_SLUG_PREFIX)
+
+
+def _bulk_create(model, objects, ignore_conflicts=False):
+    """Сохраняет объекты из генератора пачками по BATCH_SIZE."""
+    created = 0
+    while True:
+        batch = list(itertools.islice(objects, BATCH_SIZE))
+        if not batch:
+            return created
+        model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+        created += len(batch)
+
+
+def _text(rng, min_words, max_words):
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return ' '.join(words).capitalize()
+
+
+def _popularity(rng, ids):
+    """
+    Перемешанные ID и накопленные веса для random.choices():
+    немногие авторы получают большую часть подписчиков и постов.
+    """
+    ids = list(ids)
+    rng.shuffle(ids)
+    weights = itertools.accumulate(
+        1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(ids))
+    )
+    return ids, list(weights)
+
+
+def _users(count):
+    # Один хеш на всех: пароль бенчмарку не нужен, а хеширование дорогое
+    password = make_password(None)
+    for number in range(count):
+        yield User(username=f'{USERNAME_PREFIX}{number}', password=password)
+
+
+def _groups(count):
+    for number in range(count):
+        yield Group(
+            title=f'Группа {number}',
+            slug=f'{GROUP_SLUG_PREFIX}{number}',
+            description=f'Сгенерированная группа {number}',
+        )
+
+
+def _posts(rng, count, authors, weights, group_ids):
+    for author_id in rng.choices(authors, cum_weights=weights, k=count):
+        group_id = None
+        if group_ids and rng.random() >= NO_GROUP_SHARE:
+            group_id = rng.choice(group_ids)
+        yield Post(
+            text=_text(rng, 5, 60),
+            author_id=author_id,
+            group_id=group_id,
+        )
+
+
+def _follows(rng, count, user_ids, authors, weights):
+    """У каждого пользователя примерно count / len(user_ids) подписок."""
+    per_user, extra = divmod(count, len(user_ids))
+    for index, user_id in enumerate(user_ids):
+        wanted = min(per_user + (index < extra), len(authors) - 1)
+        followed = set()
+        for _ in range(wanted * 10):
+            if len(followed) >= wanted:
+                break
+            author_id = rng.choices(authors, cum_weights=weights)[0]
+            if author_id != user_id:
+                followed.add(author_id)
+        for author_id in sorted(followed):
+            yield Follow(user_id=user_id, author_id=author_id)
+
+
+def _comments(rng, count, post_ids, user_ids):
+    for _ in range(count):
+        yield Comment(
+            post_id=rng.choice(post_ids),
+            author_id=rng.choice(user_ids),
+            text=_text(rng, 2, 20),
+        )
+
+
+def seed(users, groups, posts, follows, comments, seed=0, progress=None):
+    """
+    Заполняет базу воспроизводимым набором данных: при одном и том же
+    seed получаются одни и те же тексты, авторы и подписки.
+
+    Объекты сохраняются через bulk_create в обход сигналов, поэтому
+    счётчики, ленты подписок и поисковый индекс после этого
+    пересобираются целиком.
+    """
+    def report(message):
+        if progress is not None:
+            progress(message)
+
+    rng = random.Random(seed)
+    _bulk_create(User, _users(users))
+    user_ids = list(seeded_users().order_by('pk').values_list('pk', flat=True))
+    report(f'Пользователей: {len(user_ids)}')
+    _bulk_create(Group, _groups(groups))
+    group_ids = list(
+        seeded_groups().order_by('pk').values_list('pk', flat=True)
+    )
+    report(f'Групп: {len(group_ids)}')
+    authors, weights = _popularity(rng, user_ids)
+    _bulk_create(Post, _posts(rng, posts, authors, weights, group_ids))
+    post_ids = list(Post.objects.filter(
+        author_id__in=seeded_users().values('pk')
+    ).order_by('pk').values_list('pk', flat=True))
+    report(f'Постов: {len(post_ids)}')
+    created = _bulk_create(
+        Follow,
+        _follows(rng, follows, user_ids, authors, weights),
+        ignore_conflicts=True,
+    )
+    report(f'Подписок: {created}')
+    if post_ids:
+        _bulk_create(Comment, _comments(rng, comments, post_ids, user_ids))
+        report(f'Комментариев: {comments}')
+    for kind in counters.SOURCES:
+        counters.rebuild(kind)
+    report('Счётчики пересчитаны')
+    fanout.rebuild()
+    report('Ленты подписок собраны')
+    search.rebuild()
+    report('Поисковый индекс построен')
+    followgraph.reset()
+    caching.invalidate(caching.INDEX)
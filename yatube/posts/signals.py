@@ -0,0 +1,130 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.tasks import enqueue
+
+from . import (
+    caching, counters, fanout, followgraph, recommendations, search, tasks,
+)
+from .models import Comment, Follow, Group, Post
+
+
+def post_scopes(post, *group_ids):
+    """Области кеша, которые меняются вместе с постом."""
+    scopes = [
+        caching.INDEX,
+        caching.author_scope(post.author_id),
+        caching.post_scope(post.pk),
+    ]
+    for group_id in {post.group_id, *group_ids} - {None}:
+        scopes.append(caching.group_scope(group_id))
+    return scopes
+
+
+def follow_scopes(follow):
+    """Подписки пользователя и число подписчиков в профиле автора."""
+    return [
+        caching.follow_scope(follow.user_id),
+        caching.author_scope(follow.author_id),
+    ]
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    # Запоминаем прежнюю группу: её лента тоже изменится
+    if instance.pk is not None:
+        instance.previous_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    previous_group_id = getattr(instance, 'previous_group_id', None)
+    if created:
+        counters.increment(counters.POSTS, instance.author_id)
+        enqueue(tasks.fan_out_post, instance.pk)
+    if created or previous_group_id != instance.group_id:
+        if previous_group_id is not None:
+            counters.decrement(counters.GROUP_POSTS, previous_group_id)
+        if instance.group_id is not None:
+            counters.increment(counters.GROUP_POSTS, instance.group_id)
+    enqueue(tasks.index_post, instance.pk)
+    caching.invalidate(*post_scopes(instance, previous_group_id))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.decrement(counters.POSTS, instance.author_id)
+    if instance.group_id is not None:
+        counters.decrement(counters.GROUP_POSTS, instance.group_id)
+    counters.forget(counters.COMMENTS, instance.pk)
+    search.remove_post(instance.pk)
+    caching.invalidate(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.COMMENTS, instance.post_id)
+        enqueue(
+            tasks.trend_comment, instance.post_id,
+            instance.created.timestamp(),
+        )
+        enqueue(tasks.index_comment, instance.pk)
+    else:
+        enqueue(tasks.index_post, instance.post_id)
+    caching.invalidate(caching.post_scope(instance.post_id), caching.CARDS)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.decrement(counters.COMMENTS, instance.post_id)
+    enqueue(tasks.index_post, instance.post_id)
+    caching.invalidate(caching.post_scope(instance.post_id), caching.CARDS)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    caching.invalidate(caching.group_scope(instance.pk), caching.CARDS)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # Посты остаются без группы через SET NULL, без сигналов постов
+    counters.forget(counters.GROUP_POSTS, instance.pk)
+    caching.invalidate(caching.group_scope(instance.pk), caching.CARDS)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.FOLLOWERS, instance.author_id)
+        enqueue(tasks.backfill, instance.user_id, instance.author_id)
+        enqueue(tasks.trend_follow, instance.author_id, time.time())
+        recommendations.mark_stale(instance.user_id, instance.author_id)
+        followgraph.on_change(instance.user_id, instance.author_id, True)
+    caching.invalidate(*follow_scopes(instance))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.decrement(counters.FOLLOWERS, instance.author_id)
+    enqueue(tasks.unfollow, instance.user_id, instance.author_id)
+    if fanout.followers_count(instance.author_id) == (
+        settings.FEED_FANOUT_LIMIT
+    ):
+        # Автор только что перестал быть «тяжёлым»
+        enqueue(tasks.spread_author, instance.author_id)
+    recommendations.mark_stale(instance.user_id, instance.author_id)
+    followgraph.on_change(instance.user_id, instance.author_id, False)
+    caching.invalidate(*follow_scopes(instance))
+
+
+@receiver(request_started)
+def request_starting(sender, **kwargs):
+    followgraph.on_request_started()
@@ -0,0 +1,81 @@
+from django.db import transaction
+
+from core.tasks import enqueue, task
+
+from . import caching, fanout, search, thumbnails, trending
+from .models import Follow, Post
+
+
+@task
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).only(
+        'author_id', 'pub_date'
+    ).first()
+    if post is None:
+        return
+    fanout.fan_out_post(post)
+    # Пост попал в ленты подписчиков только сейчас
+    caching.invalidate(caching.author_scope(post.author_id))
+
+
+@task
+def backfill(user_id, author_id):
+    """
+    Задачи выполняют несколько воркеров, и подписка к этому времени
+    могла уже отмениться. Строка подписки блокируется до конца
+    записи: отписка дождётся её, и чистка ленты пойдёт после.
+    """
+    if fanout.is_heavy(author_id):
+        return
+    with transaction.atomic():
+        follow = Follow.objects.select_for_update().filter(
+            user_id=user_id, author_id=author_id
+        ).first()
+        if follow is None:
+            return
+        fanout.backfill(user_id, author_id)
+    caching.invalidate(caching.follow_scope(user_id))
+
+
+@task
+def unfollow(user_id, author_id):
+    # Читатель успел подписаться снова: ленту заполнит его backfill
+    if Follow.objects.filter(user_id=user_id, author_id=author_id).exists():
+        return
+    fanout.on_unfollow(user_id, author_id)
+    caching.invalidate(caching.follow_scope(user_id))
+
+
+@task
+def spread_author(author_id):
+    """
+    Автор перестал быть «тяжёлым»: его посты больше не подмешиваются
+    при чтении, поэтому они разносятся по лентам, задача на подписчика.
+    """
+    for user_id in fanout.follower_ids(author_id):
+        enqueue(backfill, user_id, author_id)
+
+
+@task
+def index_post(post_id):
+    search.index_post(post_id)
+
+
+@task
+def index_comment(comment_id):
+    search.index_comment(comment_id)
+
+
+@task
+def generate_thumbnail(post_id):
+    thumbnails.generate(post_id)
+
+
+@task
+def trend_comment(post_id, at):
+    trending.on_comment(post_id, at)
+
+
+@task
+def trend_follow(author_id, at):
+    trending.on_follow(author_id, at)
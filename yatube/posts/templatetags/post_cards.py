@@ -0,0 +1,17 @@
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.caching import save_card
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_card(post):
+    """Карточка поста из includes/post.html, по возможности из кеша."""
+    html = getattr(post, 'card_html', None)
+    if html is None:
+        html = render_to_string('includes/post.html', {'post': post})
+        save_card(post, html)
+    return mark_safe(html)
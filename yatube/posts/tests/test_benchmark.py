@@ -0,0 +1,116 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from io import StringIO
+import json
+import os
+import tempfile
+
+from posts import benchmark, counters, seeding
+from posts.models import Comment, FeedEntry, Follow, Post
+
+SEED_OPTIONS = {
+    'users': 20,
+    'groups': 3,
+    'posts': 100,
+    'follows': 60,
+    'comments': 50,
+    'stdout': StringIO(),
+}
+
+
+class SeedPostsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def seeded_posts(self):
+        return list(Post.objects.order_by('pk').values_list(
+            'author__username', 'group__slug', 'text'
+        ))
+
+    def test_seed_creates_requested_volumes(self):
+        """seed_posts создаёт данные, счётчики и ленты подписок."""
+        call_command('seed_posts', **SEED_OPTIONS)
+        self.assertEqual(seeding.seeded_users().count(), 20)
+        self.assertEqual(seeding.seeded_groups().count(), 3)
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertEqual(Follow.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 50)
+        post = Post.objects.first()
+        self.assertEqual(
+            counters.get_count(counters.POSTS, post.author_id),
+            Post.objects.filter(author_id=post.author_id).count()
+        )
+        follow = Follow.objects.first()
+        self.assertEqual(
+            FeedEntry.objects.filter(user_id=follow.user_id).count(),
+            Post.objects.filter(
+                author__following__user_id=follow.user_id
+            ).count()
+        )
+
+    def test_seed_is_reproducible(self):
+        """Одно и то же зерно даёт одни и те же данные."""
+        call_command('seed_posts', seed=7, **SEED_OPTIONS)
+        first = self.seeded_posts()
+        seeding.seeded_users().delete()
+        seeding.seeded_groups().delete()
+        call_command('seed_posts', seed=7, **SEED_OPTIONS)
+        self.assertEqual(self.seeded_posts(), first)
+
+    def test_seed_refuses_to_run_twice(self):
+        call_command('seed_posts', **SEED_OPTIONS)
+        with self.assertRaises(CommandError):
+            call_command('seed_posts', **SEED_OPTIONS)
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command('seed_posts', **SEED_OPTIONS)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([3], 95), 3)
+
+    def test_benchmark_saves_results_for_every_scenario(self):
+        """Бенчмарк проходит все сценарии и сохраняет результаты."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark', requests=3, warmup=1, output=output,
+                stdout=StringIO()
+            )
+            with open(output) as file:
+                results = json.load(file)
+        self.assertEqual(set(results), set(benchmark.SCENARIOS))
+        for result in results.values():
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries'], 0)
+
+    def test_benchmark_detects_regressions(self):
+        """Рост задержки или числа запросов относительно эталона - ошибка."""
+        baseline = {
+            'index': {
+                'p50_ms': 0.001, 'p95_ms': 0.001, 'p99_ms': 0.001,
+                'queries': 0,
+            }
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            with open(path, 'w') as file:
+                json.dump(baseline, file)
+            with self.assertRaisesMessage(CommandError, 'index: p95_ms'):
+                call_command(
+                    'benchmark', scenarios=['index'], requests=2,
+                    warmup=0, baseline=path, stdout=StringIO()
+                )
@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from io import StringIO
+
+from posts import counters
+from posts.models import Comment, Counter, Follow, Group, Post
+
+User = get_user_model()
+
+
+class CounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_post_counter_follows_creates_and_deletes(self):
+        """Счётчик постов автора меняется при создании и удалении поста."""
+        post = Post.objects.create(text='Тестовый пост', author=self.author)
+        Post.objects.create(text='Второй пост', author=self.author)
+        self.assertEqual(
+            counters.get_count(counters.POSTS, self.author.pk), 2)
+        post.delete()
+        self.assertEqual(
+            counters.get_count(counters.POSTS, self.author.pk), 1)
+
+    def test_total_sums_counters(self):
+        """Сумма счётчиков постов авторов равна числу всех постов."""
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        Post.objects.create(text='Второй пост', author=self.reader)
+        self.assertEqual(counters.total(counters.POSTS), Post.objects.count())
+
+    def test_comment_and_follower_counters(self):
+        """Счётчики комментариев и подписчиков."""
+        post = Post.objects.create(text='Тестовый пост', author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Ого')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(counters.get_count(counters.COMMENTS, post.pk), 1)
+        self.assertEqual(
+            counters.get_count(counters.FOLLOWERS, self.author.pk), 1)
+        follow.delete()
+        self.assertEqual(
+            counters.get_count(counters.FOLLOWERS, self.author.pk), 0)
+        post.delete()
+        self.assertFalse(Counter.objects.filter(
+            kind=counters.COMMENTS, object_id=post.pk).exists())
+
+    def test_group_counter_follows_group_changes(self):
+        """Счётчик постов группы следит за сменой группы и её удалением."""
+        first = Group.objects.create(title='Первая', slug='first')
+        second = Group.objects.create(title='Вторая', slug='second')
+        post = Post.objects.create(
+            text='Тестовый пост', author=self.author, group=first
+        )
+        Post.objects.create(text='Без группы', author=self.author)
+        post.group = second
+        post.save()
+        self.assertEqual(counters.get_counts(
+            counters.GROUP_POSTS, [first.pk, second.pk]
+        ), {first.pk: 0, second.pk: 1})
+        second.delete()
+        self.assertFalse(Counter.objects.filter(
+            kind=counters.GROUP_POSTS, object_id=second.pk).exists())
+
+    def test_rebuild_counters_fixes_drift(self):
+        """Команда rebuild_counters исправляет рассинхронизацию."""
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        Counter.objects.filter(kind=counters.POSTS).update(value=100)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(
+            counters.get_count(counters.POSTS, self.author.pk), 1)
+
+    def test_profile_does_not_count_posts(self):
+        """Профиль берёт число постов из счётчика."""
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        response = self.client.get(f'/profile/{self.author.username}/')
+        self.assertEqual(response.context['amount'], 1)
+        self.assertEqual(response.context['followers_count'], 0)
@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from posts import digest
+from posts.models import Digest, Follow, Post
+
+User = get_user_model()
+
+
+class DigestTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.other = User.objects.create_user(username='other')
+        self.readers = [
+            User.objects.create_user(
+                username=f'reader{number}', email=f'reader{number}@ya.ru'
+            )
+            for number in range(5)
+        ]
+        for reader in self.readers:
+            Follow.objects.create(user=reader, author=self.author)
+        Follow.objects.create(user=self.readers[0], author=self.other)
+        Post.objects.create(text='Старый пост', author=self.author)
+        # Первая рассылка только отмечает, с какого поста начинать
+        self.assertIsNone(digest.send_digests())
+
+    def test_one_letter_per_follower(self):
+        """Каждый подписчик получает одно письмо со всеми постами"""
+        Post.objects.create(text='Первый новый пост', author=self.author)
+        Post.objects.create(text='Пост другого автора', author=self.other)
+        call_command('send_digests', chunk_size=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        letters = {message.to[0]: message.body for message in mail.outbox}
+        body = letters['reader0@ya.ru']
+        self.assertIn('Первый новый пост', body)
+        self.assertIn('Пост другого автора', body)
+        self.assertNotIn('Старый пост', body)
+        self.assertNotIn('Пост другого автора', letters['reader1@ya.ru'])
+
+    def test_archived_posts_are_not_new(self):
+        """Загруженные старые посты с новыми ключами не рассылаются"""
+        archived = Post.objects.create(
+            text='Архивный пост', author=self.author
+        )
+        Post.objects.filter(pk=archived.pk).update(
+            pub_date=archived.pub_date - timedelta(days=30)
+        )
+        Post.objects.create(text='Новый пост', author=self.author)
+        digest.send_digests()
+        self.assertIn('Новый пост', mail.outbox[0].body)
+        self.assertNotIn('Архивный пост', mail.outbox[0].body)
+
+    def test_nothing_new_sends_nothing(self):
+        self.assertIsNone(digest.send_digests())
+        self.assertEqual(mail.outbox, [])
+
+    def test_followers_without_email_are_skipped(self):
+        User.objects.filter(pk=self.readers[0].pk).update(email='')
+        Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(digest.send_digests().sent, 4)
+
+    def test_long_digest_is_shortened(self):
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.author)
+            for number in range(digest.MAX_POSTS + 3)
+        )
+        digest.send_digests()
+        self.assertIn('И ещё постов: 3', mail.outbox[0].body)
+
+    def test_interrupted_run_resumes(self):
+        """Прерванная рассылка продолжается со следующего подписчика"""
+        Post.objects.create(text='Новый пост', author=self.author)
+        messages = digest._messages
+        chunks = []
+
+        def failing(run, authors, since):
+            chunks.append(authors)
+            if len(chunks) > 1:
+                raise ConnectionError('Почтовый сервер недоступен')
+            return messages(run, authors, since)
+
+        with mock.patch.object(digest, '_messages', failing):
+            with self.assertRaises(ConnectionError):
+                digest.send_digests(chunk_size=2)
+        self.assertEqual(len(mail.outbox), 2)
+        digest.send_digests(chunk_size=2)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [reader.email for reader in self.readers]
+        )
+        self.assertFalse(Digest.objects.filter(finished__isnull=True))
+
+    def test_queries_per_chunk_are_constant(self):
+        Post.objects.create(text='Новый пост', author=self.author)
+        # Начало рассылки с датой прошлой, пачка (подписчики, подписки,
+        # посты, получатели, запись о ходе) и пустая пачка с концом
+        with self.assertNumQueries(5 + 5 + 2):
+            digest.send_digests(chunk_size=10)
@@ -0,0 +1,223 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import followgraph
+from posts.followgraph import FollowGraph
+from posts.models import Follow, Post
+
+User = get_user_model()
+
+
+class FollowGraphTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.leo, self.anna, self.olga = (
+            User.objects.create_user(username=name)
+            for name in ('leo', 'anna', 'olga')
+        )
+        Follow.objects.create(user=self.anna, author=self.leo)
+        Follow.objects.create(user=self.olga, author=self.leo)
+        Follow.objects.create(user=self.anna, author=self.olga)
+
+    def loaded(self, sync_interval=0):
+        graph = FollowGraph(
+            sync_interval=sync_interval, reload_interval=60,
+            background=False,
+        )
+        graph.load()
+        return graph
+
+    def test_answers_from_memory(self):
+        """Граф отвечает без запросов к базе."""
+        graph = self.loaded()
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.anna.pk, self.leo.pk))
+            self.assertFalse(graph.is_following(self.leo.pk, self.anna.pk))
+            self.assertEqual(graph.follower_count(self.leo.pk), 2)
+            self.assertEqual(graph.follower_count(self.anna.pk), 0)
+            self.assertEqual(
+                graph.following(self.anna.pk),
+                sorted([self.leo.pk, self.olga.pk]),
+            )
+
+    def test_changes_reach_other_workers(self):
+        """Подписки и отписки расходятся по журналу."""
+        graph, other = self.loaded(), self.loaded()
+        Follow.objects.create(user=self.leo, author=self.anna)
+        graph.record(self.leo.pk, self.anna.pk, True)
+        Follow.objects.filter(user=self.anna, author=self.leo).delete()
+        graph.record(self.anna.pk, self.leo.pk, False)
+        for worker in (graph, other):
+            worker.sync()
+            self.assertTrue(worker.is_following(self.leo.pk, self.anna.pk))
+            self.assertFalse(worker.is_following(self.anna.pk, self.leo.pk))
+            self.assertEqual(worker.follower_count(self.leo.pk), 1)
+            self.assertEqual(worker.following(self.anna.pk), [self.olga.pk])
+
+    def test_reload_after_lost_journal(self):
+        """Потерянный журнал - повод загрузить граф из базы заново."""
+        graph = self.loaded()
+        graph.record(self.leo.pk, self.anna.pk, True)
+        Follow.objects.create(user=self.olga, author=self.anna)
+        cache.clear()
+        graph.sync()
+        self.assertFalse(graph.is_following(self.leo.pk, self.anna.pk))
+        self.assertTrue(graph.is_following(self.olga.pk, self.anna.pk))
+
+    def test_request_reads_journal(self):
+        """Запрос видит подписку, сделанную в другом воркере до него."""
+        graph, other = self.loaded(), self.loaded(sync_interval=60)
+        Follow.objects.create(user=self.leo, author=self.anna)
+        graph.record(self.leo.pk, self.anna.pk, True)
+        other.sync()
+        self.assertFalse(other.is_following(self.leo.pk, self.anna.pk))
+        with patch.object(followgraph, 'graph', other):
+            self.client.get(reverse('about:author'))
+        other.sync()
+        self.assertTrue(other.is_following(self.leo.pk, self.anna.pk))
+
+    def test_reset_reloads_graph(self):
+        """Подписки, загруженные мимо журнала, попадают в граф."""
+        graph = self.loaded()
+        Follow.objects.bulk_create([Follow(user=self.leo, author=self.anna)])
+        graph.sync()
+        self.assertFalse(graph.is_following(self.leo.pk, self.anna.pk))
+        followgraph.reset()
+        graph.sync()
+        self.assertTrue(graph.is_following(self.leo.pk, self.anna.pk))
+
+    def test_stale_graph_yields_to_database(self):
+        """Пока граф грузится в фоне после пропуска, отвечает база."""
+        graph = FollowGraph(sync_interval=0, reload_interval=60)
+        graph.load()
+        graph.record(self.leo.pk, self.anna.pk, True)
+        cache.clear()
+        with patch('posts.followgraph.threading.Thread') as thread:
+            for _ in range(2):
+                graph.sync()
+                self.assertFalse(graph.usable)
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once_with()
+
+    def test_expired_graph_answers_while_reloading(self):
+        """Устаревший по времени граф отвечает, пока грузится новый."""
+        graph = FollowGraph(sync_interval=0, reload_interval=0)
+        graph.load()
+        with patch('posts.followgraph.threading.Thread') as thread:
+            graph.sync()
+        thread.return_value.start.assert_called_once_with()
+        self.assertTrue(graph.usable)
+
+    def test_database_inside_transaction(self):
+        """В транзакции подписка проверяется по базе."""
+        with self.assertNumQueries(1):
+            self.assertTrue(followgraph.is_following(self.anna, self.leo))
+        Follow.objects.create(user=self.leo, author=self.anna)
+        self.assertTrue(followgraph.is_following(self.leo, self.anna))
+        self.assertEqual(followgraph.following(self.leo), [self.anna.pk])
+
+
+class FollowAnnotationTest(TestCase):
+    """Карточки лент отмечают, подписан ли читатель на автора"""
+    def setUp(self):
+        cache.clear()
+        self.reader, self.leo, self.olga = (
+            User.objects.create_user(username=name)
+            for name in ('reader', 'leo', 'olga')
+        )
+        Follow.objects.create(user=self.reader, author=self.leo)
+        self.followed = Post.objects.create(author=self.leo, text='Лев')
+        self.other = Post.objects.create(author=self.olga, text='Ольга')
+        self.client.force_login(self.reader)
+
+    def test_annotate(self):
+        posts = [self.followed, self.other]
+        followgraph.annotate(self.reader, posts)
+        self.assertEqual(
+            [post.author_followed for post in posts], [True, False]
+        )
+        followgraph.annotate(AnonymousUser(), posts)
+        self.assertEqual(
+            [post.author_followed for post in posts], [False, False]
+        )
+
+    def test_feeds_show_follow_state(self):
+        """Отметка выводится в лентах и на странице поста"""
+        follow_olga = reverse('posts:profile_follow', args=('olga',))
+        for url, followed, unfollowed in (
+            (reverse('posts:index'), 1, 1),
+            (reverse('posts:popular'), 0, 0),
+            (reverse('posts:post_detail', args=(self.followed.pk,)), 1, 0),
+            (reverse('posts:post_detail', args=(self.other.pk,)), 0, 1),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(
+                    response, 'Вы подписаны на автора', count=followed
+                )
+                self.assertContains(response, follow_olga, count=unfollowed)
+
+    def test_own_posts_are_not_marked(self):
+        self.client.force_login(self.olga)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Вы подписаны на автора')
+        self.assertNotContains(
+            response, reverse('posts:profile_follow', args=('olga',))
+        )
+
+    def test_follow_changes_etag(self):
+        """После подписки лента не отдаётся ответом 304"""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.olga)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Вы подписаны на автора', count=2)
+
+
+class FollowGraphPagesTest(TransactionTestCase):
+    """Вне транзакции тестов страницы читают подписки из графа"""
+    def setUp(self):
+        cache.clear()
+        self.graph = FollowGraph(sync_interval=0, background=False)
+        patcher = patch.object(followgraph, 'graph', self.graph)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.reader = User.objects.create_user(username='reader')
+        for name in ('leo', 'olga', 'ivan'):
+            author = User.objects.create_user(username=name)
+            Post.objects.create(author=author, text=name)
+        self.leo = User.objects.get(username='leo')
+        # Как wsgi.py при старте воркера
+        followgraph.preload()
+        self.client.force_login(self.reader)
+
+    def count_queries(self, url):
+        cache.clear()
+        # Сброс кеша стирает и журнал: граф загрузился бы заново
+        self.graph.load()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return len(queries), response
+
+    def test_annotation_adds_no_queries(self):
+        self.client.get(reverse('posts:profile_follow', args=('leo',)))
+        self.assertTrue(self.graph.is_following(self.reader.pk, self.leo.pk))
+        post = Post.objects.filter(author=self.leo).first()
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=(post.pk,)),
+        ):
+            with self.subTest(url=url):
+                with patch.object(followgraph, 'annotate'):
+                    expected, _ = self.count_queries(url)
+                count, response = self.count_queries(url)
+                self.assertEqual(count, expected)
+                self.assertContains(response, 'Вы подписаны на автора')
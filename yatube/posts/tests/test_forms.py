@@ -1,10 +1,13 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, override_settings, TestCase
 from django.urls import reverse
 
 from http import HTTPStatus
+from io import StringIO
 import shutil
 import tempfile
 
@@ -16,6 +19,14 @@ User = get_user_model()
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -88,6 +99,86 @@ class PostFormTests(TestCase):
         first_object = response.context['page_obj'].object_list[0]
         self.body_test(first_object, form_data)
 
+    def test_create_post_builds_thumbnail(self):
+        """Картинка поста из формы сразу получает миниатюру."""
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertTrue(post.thumbnail)
+        self.assertTrue(default_storage.exists(post.thumbnail))
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, post.thumbnail_url)
+
+    def test_post_without_thumbnail_shows_image(self):
+        """Пока миниатюры нет, карточка показывает исходную картинку."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост без миниатюры',
+            image=SimpleUploadedFile(
+                name='full.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+        self.assertFalse(post.thumbnail)
+        for url in (reverse('posts:index'), post.url):
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, post.image.url)
+
+    @override_settings(TASKS_EAGER=False)
+    def test_new_image_drops_old_thumbnail(self):
+        """Замена или удаление картинки сбрасывает прежнюю миниатюру."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image='posts/old.gif',
+            thumbnail='cache/old_thumb.gif',
+        )
+        url = reverse('posts:post_edit', args=(post.pk,))
+        for image in (
+            SimpleUploadedFile(
+                name='new.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+            None,
+        ):
+            Post.objects.filter(pk=post.pk).update(
+                image='posts/old.gif', thumbnail='cache/old_thumb.gif'
+            )
+            data = {'text': post.text}
+            if image is None:
+                data['image-clear'] = 'on'
+            else:
+                data['image'] = image
+            self.authorized_client.post(url, data=data)
+            post.refresh_from_db()
+            with self.subTest(image=image):
+                self.assertEqual(post.thumbnail, '')
+                self.assertNotEqual(post.image.name, 'posts/old.gif')
+
+    def test_generate_thumbnails_backfills_posts(self):
+        """Команда generate_thumbnails строит недостающие миниатюры."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост без миниатюры',
+            image=SimpleUploadedFile(
+                name='old.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            )
+        )
+        self.assertFalse(post.thumbnail)
+        call_command('generate_thumbnails', workers=0, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail)
+
     def test_cant_create_post_without_text(self):
         """Проверим, что пост не создастся, если не вводить текст"""
         posts_count = Post.objects.count()
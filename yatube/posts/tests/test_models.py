@@ -1,7 +1,11 @@
+from unittest import skipUnless
+
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
 
-from ..models import Group, Post
+from .. import fanout
+from ..models import Follow, Group, Post
 
 User = get_user_model()
 
@@ -31,3 +35,46 @@ class PostModelTest(TestCase):
             with self.subTest(model=model):
                 self.assertEqual(model.__str__(), expected_values, (
                     f'Ошибка метода __str__ в модели {type(model).__name__}'))
+
+    def test_follow_is_unique(self):
+        """Нельзя дважды подписаться на одного автора."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Follow.objects.create(user=reader, author=self.user)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+class FeedIndexTest(TestCase):
+    """Страницы лент читаются по индексам без сортировки всей выборки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_feeds_use_indexes(self):
+        feeds = {
+            'index': Post.objects.order_by('-pub_date', '-pk'),
+            'profile': Post.objects.filter(author=self.user).order_by(
+                '-pub_date', '-pk'
+            ),
+            'group': Post.objects.filter(group=self.group).order_by(
+                '-pub_date', '-pk'
+            ),
+            'follow': fanout.follow_feed(self.user).order_by(
+                '-feed_pub_date', '-feed_post_id'
+            ),
+        }
+        for name, queryset in feeds.items():
+            with self.subTest(feed=name):
+                plan = self.plan(queryset[:11])
+                self.assertIn('INDEX', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,138 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from io import StringIO
+from unittest import mock
+
+from posts import recommendations
+from posts.graph import Adjacency
+from posts.models import Follow, Recommendation
+
+User = get_user_model()
+
+
+class AdjacencyTest(TestCase):
+    def test_lists_by_key(self):
+        graph = Adjacency([(1, 2), (1, 5), (3, 1), (7, 2), (7, 3), (7, 9)])
+        self.assertEqual(list(graph), [1, 3, 7])
+        self.assertEqual(list(graph[7]), [2, 3, 9])
+        self.assertEqual(list(graph[4]), [])
+        self.assertEqual(graph.degree(1), 2)
+        self.assertEqual(graph.degree(8), 0)
+
+
+class RecommendationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = {
+            name: User.objects.create_user(username=name)
+            for name in ('leo', 'fedor', 'anna', 'olga', 'ivan', 'petr')
+        }
+        # Читатели Толстого почти все читают и Достоевского
+        for reader in ('anna', 'olga', 'ivan'):
+            self.follow(reader, 'leo')
+            self.follow(reader, 'fedor')
+        self.follow('petr', 'leo')
+
+    def follow(self, user, author):
+        return Follow.objects.create(
+            user=self.users[user], author=self.users[author]
+        )
+
+    def usernames(self, authors):
+        return [author['username'] for author in authors]
+
+    def test_co_followed_authors(self):
+        """Читателю Толстого советуют Достоевского, и наоборот"""
+        call_command('refresh_suggestions', full=True, stdout=StringIO())
+        self.assertEqual(self.usernames(
+            recommendations.who_to_follow(self.users['petr'])
+        ), ['fedor'])
+        self.assertEqual(self.usernames(
+            recommendations.similar_authors(self.users['leo'])
+        ), ['fedor'])
+        self.assertEqual(
+            recommendations.who_to_follow(self.users['anna']), []
+        )
+
+    def test_incremental_refresh_handles_only_changed_users(self):
+        recommendations.refresh(full=True)
+        self.assertFalse(Recommendation.objects.filter(stale=True).exists())
+        leo = self.users['leo']
+        leo.first_name, leo.last_name = 'Лев', 'Толстой'
+        leo.save()
+        self.follow('olga', 'petr')
+        self.follow('anna', 'petr')
+        self.assertEqual(recommendations.refresh(), 3)
+        self.assertCountEqual(
+            recommendations.similar_authors(self.users['petr']), [
+                {'id': leo.pk, 'username': 'leo', 'name': 'Лев Толстой'},
+                {'id': self.users['fedor'].pk, 'username': 'fedor',
+                 'name': ''},
+            ]
+        )
+        # Толстого не пересчитывали: его список прежний
+        self.assertEqual(self.usernames(
+            recommendations.similar_authors(self.users['leo'])
+        ), ['fedor'])
+
+    def test_interrupted_refresh_keeps_stale_flags(self):
+        """Флаг снимается только вместе с записью рекомендаций."""
+        with mock.patch.object(
+            recommendations, '_save', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                recommendations.refresh()
+        self.assertEqual(
+            Recommendation.objects.filter(stale=True).count(), 6
+        )
+        self.assertEqual(recommendations.refresh(), 6)
+        self.assertFalse(Recommendation.objects.filter(stale=True).exists())
+
+    def test_follow_during_refresh_stays_stale(self):
+        """Подписка во время расчёта не теряется."""
+        similar = recommendations.Graph.similar
+
+        def follow_once(graph, author_id):
+            Follow.objects.get_or_create(
+                user=self.users['petr'], author=self.users['ivan']
+            )
+            return similar(graph, author_id)
+
+        with mock.patch.object(
+            recommendations.Graph, 'similar', follow_once
+        ):
+            recommendations.refresh(full=True)
+        self.assertCountEqual(
+            Recommendation.objects.filter(stale=True).values_list(
+                'user_id', flat=True
+            ),
+            [self.users['petr'].pk, self.users['ivan'].pk],
+        )
+
+    def test_followed_author_is_not_suggested(self):
+        recommendations.refresh(full=True)
+        petr = self.users['petr']
+        self.follow('petr', 'fedor')
+        self.assertEqual(recommendations.who_to_follow(petr), [])
+
+    def test_pages_show_suggestions(self):
+        recommendations.refresh(full=True)
+        self.client.force_login(self.users['petr'])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Кого почитать')
+        self.assertContains(
+            response, reverse('posts:profile', args=('fedor',))
+        )
+        response = self.client.get(reverse('posts:profile', args=('leo',)))
+        self.assertContains(response, 'Подписчики автора также читают')
+
+    def test_deleted_user_leaves_no_suggestions(self):
+        self.users['anna'].delete()
+        recommendations.refresh(full=True)
+        self.assertFalse(Recommendation.objects.filter(
+            user_id=self.users['anna'].pk
+        ).exists())
@@ -0,0 +1,159 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from io import StringIO
+
+from posts import search
+from posts.models import Comment, Post, SearchTerm
+
+User = get_user_model()
+
+
+class StemTest(TestCase):
+    def test_word_forms_share_stem(self):
+        """Формы одного слова сводятся к одной основе."""
+        for forms in (
+            ('книга', 'книги', 'книгой', 'книгах'),
+            ('красивый', 'красивая', 'красивые', 'красивого'),
+            ('читать', 'читали', 'читает'),
+            ('ёлка', 'елки'),
+        ):
+            with self.subTest(forms=forms):
+                self.assertEqual(len({search.stem(word) for word in forms}), 1)
+
+    def test_other_words_are_lowercased(self):
+        self.assertEqual(search.terms('Django 2.2'), ['django', '2', '2'])
+
+    def test_query_terms_are_unique(self):
+        self.assertEqual(
+            search.query_terms('Книга книги КНИГОЙ море'),
+            [search.stem('книга'), search.stem('море')]
+        )
+
+
+class SearchViewMixin:
+    """Одни и те же проверки для FTS5 и для таблицы SearchTerm."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def found(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response, [post.pk for post in response.context['page_obj']]
+
+    def test_finds_posts_by_word_forms(self):
+        """Поиск находит пост по другой форме слова."""
+        post = Post.objects.create(
+            text='Читали интересные книги у моря', author=self.author
+        )
+        Post.objects.create(text='Про горы', author=self.author)
+        self.assertEqual(self.found('книга море')[1], [post.pk])
+        self.assertEqual(self.found('книга горы')[1], [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении постов и комментариев."""
+        post = Post.objects.create(text='Про горы', author=self.author)
+        post.text = 'Про реки'
+        post.save()
+        self.assertEqual(self.found('горы')[1], [])
+        self.assertEqual(self.found('река')[1], [post.pk])
+        comment = Comment.objects.create(
+            post=post, author=self.author, text='Был в лесу'
+        )
+        self.assertEqual(self.found('лес')[1], [post.pk])
+        comment.delete()
+        self.assertEqual(self.found('лес')[1], [])
+        post.delete()
+        self.assertEqual(self.found('река')[1], [])
+
+    def test_new_comments_add_to_index(self):
+        """Новый комментарий дописывается к индексу поста."""
+        post = Post.objects.create(text='Про горы', author=self.author)
+        Comment.objects.create(post=post, author=self.author, text='Лес')
+        Comment.objects.create(post=post, author=self.author, text='Река')
+        for query in ('горы', 'лес', 'река', 'лес река'):
+            with self.subTest(query=query):
+                self.assertEqual(self.found(query)[1], [post.pk])
+
+    def test_text_ranks_above_comments(self):
+        """Совпадение в тексте поста важнее совпадения в комментарии."""
+        in_comment = Post.objects.create(text='Про горы', author=self.author)
+        Comment.objects.create(
+            post=in_comment, author=self.author, text='Кофе'
+        )
+        in_text = Post.objects.create(text='Про кофе', author=self.author)
+        self.assertEqual(self.found('кофе')[1], [in_text.pk, in_comment.pk])
+
+    def test_cursor_pagination(self):
+        """Выдача листается курсорами без повторов и пропусков."""
+        posts = Post.objects.bulk_create(
+            Post(text=f'Пост номер {number} про кофе', author=self.author)
+            for number in range(15)
+        )
+        search.rebuild()
+        response, first = self.found('кофе')
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertEqual(len(first), 10)
+        self.assertContains(response, 'q=%D0%BA%D0%BE%D1%84%D0%B5&amp;cursor')
+        response, second = self.found('кофе', cursor=next_cursor)
+        self.assertEqual(len(second), len(posts) - 10)
+        self.assertFalse(set(first) & set(second))
+        self.assertIsNone(response.context['page_obj'].next_cursor)
+        previous = response.context['page_obj'].previous_cursor
+        self.assertEqual(self.found('кофе', cursor=previous)[1], first)
+
+    def test_empty_query_shows_only_form(self):
+        response = self.client.get(reverse('posts:search'))
+        self.assertIsNone(response.context['page_obj'])
+        self.assertTemplateUsed(response, 'posts/search.html')
+
+    def test_rebuild_command(self):
+        """Команда rebuild_search_index индексирует посты без сигналов."""
+        Post.objects.bulk_create([Post(text='Про море', author=self.author)])
+        self.assertEqual(self.found('море')[1], [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.found('море')[1]), 1)
+
+
+class FTSSearchTest(SearchViewMixin, TestCase):
+    def test_uses_fts(self):
+        self.assertTrue(search.use_fts())
+        Post.objects.create(text='Про море', author=self.author)
+        self.assertFalse(SearchTerm.objects.exists())
+
+
+@override_settings(POST_SEARCH_FTS=False)
+class InvertedIndexSearchTest(SearchViewMixin, TestCase):
+    def test_uses_search_terms(self):
+        self.assertFalse(search.use_fts())
+        post = Post.objects.create(text='Про море и море', author=self.author)
+        self.assertEqual(
+            SearchTerm.objects.get(post=post, term=search.stem('море')).weight,
+            2 * search.TEXT_WEIGHT
+        )
+
+    def test_comment_adds_weight(self):
+        """Комментарий прибавляет вес к основам, уже найденным в посте."""
+        post = Post.objects.create(text='Про море', author=self.author)
+        Comment.objects.create(
+            post=post, author=self.author, text='Море, море и горы'
+        )
+        weights = dict(SearchTerm.objects.filter(post=post).values_list(
+            'term', 'weight'
+        ))
+        self.assertEqual(
+            weights[search.stem('море')],
+            search.TEXT_WEIGHT + 2 * search.COMMENT_WEIGHT
+        )
+        self.assertEqual(weights[search.stem('горы')], search.COMMENT_WEIGHT)
@@ -0,0 +1,168 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from io import StringIO
+from unittest import mock
+import datetime as dt
+import os
+import tempfile
+
+from posts import counters, search, tasks, transfer
+from posts.models import (
+    Comment, FeedEntry, Follow, Group, Post, Recommendation,
+)
+
+User = get_user_model()
+
+
+class TransferTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = self.directory.name
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(
+            title='Тестовая группа', slug='test', description='Описание'
+        )
+        self.old_date = dt.datetime(
+            2020, 1, 2, 3, 4, 5, tzinfo=dt.timezone.utc
+        )
+        for number in range(5):
+            post = Post.objects.create(
+                text=f'Пост {number}\nв две строки, "с кавычками"',
+                author=author,
+                group=group if number % 2 else None,
+            )
+            Comment.objects.create(
+                post=post, author=reader, text=f'Комментарий {number}'
+            )
+        Post.objects.update(pub_date=self.old_date)
+        Follow.objects.create(user=reader, author=author)
+
+    def snapshot(self):
+        return {
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'author__username', 'group__slug', 'text', 'pub_date'
+            )),
+            'comments': list(Comment.objects.order_by('pk').values_list(
+                'post__text', 'author__username', 'text'
+            )),
+            'follows': list(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+            'groups': list(Group.objects.values_list(
+                'slug', 'title', 'description'
+            )),
+        }
+
+    def clear_database(self):
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        User.objects.all().delete()
+
+    def test_round_trip(self):
+        """Выгруженные данные загружаются в пустую базу без потерь."""
+        for fmt in transfer.FORMATS:
+            with self.subTest(format=fmt):
+                before = self.snapshot()
+                call_command(
+                    'export_posts', self.path, format=fmt, batch_size=2,
+                    stdout=StringIO()
+                )
+                self.assertTrue(os.path.exists(
+                    transfer.table_path(self.path, 'posts', fmt)
+                ))
+                self.clear_database()
+                call_command(
+                    'import_posts', self.path, format=fmt, batch_size=2,
+                    stdout=StringIO()
+                )
+                self.assertEqual(self.snapshot(), before)
+
+    def test_import_rebuilds_derived_data(self):
+        """После загрузки пересобраны счётчики, ленты, поиск и граф."""
+        transfer.export_data(self.path)
+        self.clear_database()
+        with mock.patch('posts.followgraph.reset') as reset:
+            transfer.import_data(self.path)
+        reset.assert_called_once_with()
+        author = User.objects.get(username='author')
+        reader = User.objects.get(username='reader')
+        self.assertEqual(counters.get_count(counters.POSTS, author.pk), 5)
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 5)
+        self.assertEqual(len(search.ranked(search.query_terms('кавычки'))), 5)
+        self.assertFalse(reader.has_usable_password())
+
+    def test_import_marks_suggestions_stale(self):
+        """Рекомендации участников загруженных подписок устарели."""
+        transfer.export_data(self.path)
+        self.clear_database()
+        # Рекомендации хранят ID без внешнего ключа
+        Recommendation.objects.all().delete()
+        User.objects.create_user(username='bystander')
+        transfer.import_data(self.path)
+        self.assertCountEqual(
+            Recommendation.objects.filter(stale=True).values_list(
+                'user_id', flat=True
+            ),
+            User.objects.filter(
+                username__in=('reader', 'author')
+            ).values_list('pk', flat=True),
+        )
+
+    def test_import_enqueues_thumbnails(self):
+        """Загруженным постам с картинками строятся миниатюры."""
+        Post.objects.filter(text__startswith='Пост 1').update(
+            image='posts/picture.gif', thumbnail='posts/cache/old.gif'
+        )
+        transfer.export_data(self.path)
+        with mock.patch('posts.transfer.enqueue') as enqueue:
+            transfer.import_data(self.path)
+        imported = Post.objects.get(
+            text__startswith='Пост 1', thumbnail='', image='posts/picture.gif'
+        )
+        enqueue.assert_called_once_with(
+            tasks.generate_thumbnail, imported.pk
+        )
+
+    def test_import_into_filled_database_remaps_keys(self):
+        """Ключи загруженных постов сдвигаются, комментарии идут за ними."""
+        transfer.export_data(self.path)
+        transfer.import_data(self.path)
+        self.assertEqual(Post.objects.count(), 10)
+        self.assertEqual(Comment.objects.count(), 10)
+        for comment in Comment.objects.select_related('post'):
+            self.assertEqual(
+                comment.text[-1], comment.post.text.split()[1]
+            )
+
+    def test_interrupted_import_resumes(self):
+        """Прерванная загрузка продолжается без дублей."""
+        transfer.export_data(self.path)
+        self.clear_database()
+        build_comments = transfer.BUILDERS['comments']
+        calls = []
+
+        def failing(rows, offsets):
+            calls.append(rows)
+            if len(calls) > 1:
+                raise RuntimeError('Обрыв загрузки')
+            return build_comments(rows, offsets)
+
+        with mock.patch.dict(transfer.BUILDERS, comments=failing):
+            with self.assertRaises(RuntimeError):
+                transfer.import_data(self.path, batch_size=2)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.path, transfer.IMPORT_CHECKPOINT)
+        ))
+        transfer.import_data(self.path, batch_size=2)
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Comment.objects.count(), 5)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.path, transfer.IMPORT_CHECKPOINT)
+        ))
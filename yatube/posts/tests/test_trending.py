@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from io import StringIO
+import time
+
+from posts import trending
+from posts.models import Comment, Follow, Post, Trending
+
+User = get_user_model()
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.author)
+            for number in range(3)
+        ]
+
+    def score(self, post):
+        return Trending.objects.get(post=post).score
+
+    def test_comments_raise_score(self):
+        """Комментарий к посту сразу поднимает его счёт"""
+        post = self.posts[0]
+        Comment.objects.create(post=post, author=self.reader, text='Ого')
+        Comment.objects.create(post=post, author=self.reader, text='Ага')
+        self.assertAlmostEqual(
+            self.score(post), 2 * trending.COMMENT_WEIGHT, places=3
+        )
+
+    def test_scores_decay_with_time(self):
+        """За период полураспада старое событие весит вдвое меньше"""
+        now = time.time()
+        half_life = settings.TRENDING_HALF_LIFE
+        trending.on_comment(self.posts[0].pk, now - half_life)
+        trending.on_comment(self.posts[1].pk, now)
+        trending.on_comment(self.posts[1].pk, now)
+        trending.refresh(now)
+        self.assertAlmostEqual(self.score(self.posts[0]), 0.5, places=3)
+        self.assertAlmostEqual(self.score(self.posts[1]), 2, places=3)
+        trending.refresh(now + 10 * half_life)
+        self.assertFalse(Trending.objects.exists())
+
+    def test_follow_raises_recent_posts_of_author(self):
+        old = self.posts[0]
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=old.pub_date.replace(year=2000)
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(Trending.objects.filter(post=old).exists())
+        self.assertAlmostEqual(
+            self.score(self.posts[1]), trending.FOLLOW_WEIGHT, places=3
+        )
+
+    def test_popular_page_shows_top_list(self):
+        """Вкладка «Популярное» показывает готовый список по убыванию"""
+        now = time.time()
+        for post, comments in zip(self.posts, (1, 3, 2)):
+            for _ in range(comments):
+                trending.on_comment(post.pk, now)
+        call_command('refresh_trending', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:popular'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [self.posts[1].pk, self.posts[2].pk, self.posts[0].pk],
+        )
+        # Только сами посты: порядок уже посчитан
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('trending', queries[0]['sql'])
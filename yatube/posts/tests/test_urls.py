@@ -1,9 +1,11 @@
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
 
 from http import HTTPStatus
 
+from posts import links
 from posts.models import Group, Post
 
 User = get_user_model()
@@ -117,3 +119,18 @@ class TaskURLTests(TestCase):
             with self.subTest(address=user):
                 response = user.get(self.NOTFOUND[0]).status_code
                 self.assertEqual(response, HTTPStatus.NOT_FOUND)
+
+
+class LinksTest(SimpleTestCase):
+    def test_links_match_reverse(self):
+        """Готовые адреса совпадают с reverse()"""
+        for name, value in (
+            ('posts:post_detail', 15),
+            ('posts:profile', 'user.name+tag@mail'),
+            ('posts:profile', 'пользователь'),
+            ('posts:group_list', 'test-slug'),
+        ):
+            with self.subTest(name=name, value=value):
+                self.assertEqual(
+                    links.url(name, value), reverse(name, args=[value])
+                )
@@ -2,14 +2,22 @@ from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
-from posts.models import Group, Follow, Post
+from core import tasks as core_tasks
+from core.models import Task
+from posts import caching
+from posts.models import Comment, FeedEntry, Group, Follow, Post
 
 
 User = get_user_model()
@@ -229,7 +237,7 @@ class TaskPagesTests(TestCase):
         self.assertNotIn(self.post, context)
 
     def test_cache(self):
-        """Тестируем работу кеша"""
+        """Тестируем работу кеша: удалённый пост сразу пропадает с главной"""
         test_post = Post.objects.create(
             text='Тестируем кэш',
             group=self.group,
@@ -237,17 +245,37 @@ class TaskPagesTests(TestCase):
         )
         var_test_cache = reverse('posts:index')
         post_content = self.post_author.get(var_test_cache).content
+        cached_content = self.post_author.get(var_test_cache).content
         test_post.delete()
-        delete_post_but_in_cache = self.post_author.get(var_test_cache).content
-        cache.clear()
-        content_after_cache_clear = self.post_author.get(
-            var_test_cache).content
-        self.assertEqual(
-            post_content, delete_post_but_in_cache
-        )
-        self.assertNotEqual(
-            post_content, content_after_cache_clear
-        )
+        content_after_delete = self.post_author.get(var_test_cache).content
+        self.assertEqual(post_content, cached_content)
+        self.assertNotEqual(post_content, content_after_delete)
+        self.assertNotIn(test_post.text, content_after_delete.decode())
+
+    def test_cached_card_follows_post_and_group_changes(self):
+        """Карточка поста в кеше обновляется при правке поста и группы"""
+        var_test_cache = reverse('posts:index')
+        self.post_author.get(var_test_cache)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Отредактированный пост'
+        post.save()
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'new-slug'
+        group.save()
+        content = self.post_author.get(var_test_cache).content.decode()
+        self.assertIn('Отредактированный пост', content)
+        self.assertIn('/group/new-slug/', content)
+
+    def test_feed_ids_are_cached(self):
+        """Повторный запрос ленты не строит страницу заново"""
+        var_test_cache = reverse('posts:group_list', args=(self.group.slug,))
+        self.post_author.get(var_test_cache)
+        with CaptureQueriesContext(connection) as queries:
+            self.post_author.get(var_test_cache)
+        self.assertFalse(any(
+            'ORDER BY' in query['sql'] and 'LIMIT' in query['sql']
+            for query in queries.captured_queries
+        ))
 
 
 class FollowTest(TestCase):
@@ -339,6 +367,117 @@ class FollowTest(TestCase):
         first_object = response.context['page_obj'].object_list[0]
         self.body_test(first_object, post)
 
+    def test_new_post_lands_in_follower_feed(self):
+        """Новый пост автора сразу попадает в ленту подписчика."""
+        Follow.objects.create(user=self.user_user, author=self.user_author)
+        post = Post.objects.create(
+            text='Тестовый пост ленты',
+            author=self.user_author
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_user, post=post).exists())
+
+    def test_follow_backfills_and_unfollow_prunes_feed(self):
+        """Подписка добавляет в ленту старые посты, отписка их убирает."""
+        post = Post.objects.create(
+            text='Старый пост автора',
+            author=self.user_author
+        )
+        self.user.get(self.PROFILE_FOLLOW_AUTHOR)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_user, post=post).exists())
+        self.user.get(self.PROFILE_UNFOLLOW_AUTHOR)
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_user).exists())
+
+    def test_follow_feed_pages_by_feed_entries(self):
+        """Лента подписок листается по дате, скопированной в записи."""
+        Follow.objects.create(user=self.user_user, author=self.user_author)
+        posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.user_author)
+            for i in range(15)
+        ]
+        for post in posts:
+            self.assertEqual(FeedEntry.objects.get(
+                user=self.user_user, post=post).pub_date, post.pub_date)
+        response = self.user.get(self.FOLLOW_INDEX)
+        page = response.context['page_obj']
+        second = self.user.get(
+            self.FOLLOW_INDEX, {'cursor': page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(page) + list(second), posts[::-1]
+        )
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_author_below_limit_is_spread_to_feeds(self):
+        """После отписки «лёгкий» автор разносит посты по лентам."""
+        Follow.objects.create(user=self.user_user, author=self.user_author)
+        other = User.objects.create_user(username='other_reader')
+        Follow.objects.create(user=other, author=self.user_author)
+        post = Post.objects.create(
+            text='Пост автора', author=self.user_author
+        )
+        self.assertFalse(FeedEntry.objects.exists())
+        Follow.objects.filter(user=other).delete()
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_user, post=post).exists())
+
+    @override_settings(TASKS_EAGER=False)
+    def test_unfollow_prunes_feed_in_background(self):
+        """Отписка не чистит ленту в запросе, а ставит задачу."""
+        Follow.objects.create(user=self.user_user, author=self.user_author)
+        post = Post.objects.create(text='Пост', author=self.user_author)
+        FeedEntry.objects.create(
+            user=self.user_user, post=post, pub_date=post.pub_date
+        )
+        Follow.objects.filter(user=self.user_user).delete()
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_user).exists())
+        call_command('run_tasks', once=True, stdout=StringIO())
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_user).exists())
+
+    def run_feed_tasks(self, *names):
+        """Выполняет задачи ленты в порядке names, как разные воркеры."""
+        for name in names:
+            task = Task.objects.filter(
+                name=f'posts.tasks.{name}', status=Task.PENDING
+            ).first()
+            core_tasks.execute(task)
+
+    @override_settings(TASKS_EAGER=False)
+    def test_late_prune_keeps_feed_of_new_follow(self):
+        """Чистка после повторной подписки не опустошает ленту."""
+        post = Post.objects.create(text='Пост', author=self.user_author)
+        Follow.objects.create(user=self.user_user, author=self.user_author)
+        Follow.objects.filter(user=self.user_user).delete()
+        Follow.objects.create(user=self.user_user, author=self.user_author)
+        self.run_feed_tasks('backfill', 'backfill', 'unfollow')
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_user, post=post).exists())
+
+    @override_settings(TASKS_EAGER=False)
+    def test_late_backfill_after_unfollow_adds_nothing(self):
+        Post.objects.create(text='Пост', author=self.user_author)
+        Follow.objects.create(user=self.user_user, author=self.user_author)
+        Follow.objects.filter(user=self.user_user).delete()
+        self.run_feed_tasks('unfollow', 'backfill')
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_user).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_heavy_author_posts_are_merged_on_read(self):
+        """Посты автора без рассылки подмешиваются в ленту при чтении."""
+        self.user.get(self.PROFILE_FOLLOW_AUTHOR)
+        post = Post.objects.create(
+            text='Пост популярного автора',
+            author=self.user_author
+        )
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.user.get(self.FOLLOW_INDEX)
+        self.assertIn(post, response.context['page_obj'].object_list)
+
 
 class PaginatorViewsTest(TestCase):
     """Тест паджинатора"""
@@ -371,3 +510,340 @@ class PaginatorViewsTest(TestCase):
     def test_second_page_contains_three_records(self):
         response = self.post_author.get(reverse('posts:index') + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_next_cursor_leads_to_second_page(self):
+        """Курсор следующей страницы ведёт на оставшиеся посты"""
+        first_page = self.post_author.get(
+            reverse('posts:index')).context['page_obj']
+        response = self.post_author.get(
+            reverse('posts:index'), {'cursor': first_page.next_cursor})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 3)
+        self.assertEqual(page.number, 2)
+        self.assertIsNone(page.next_cursor)
+        self.assertFalse(set(page) & set(first_page))
+
+    def test_previous_cursor_returns_first_page(self):
+        """Курсор предыдущей страницы возвращает на первую страницу"""
+        second_page = self.post_author.get(
+            reverse('posts:index'), {'page': 2}).context['page_obj']
+        response = self.post_author.get(
+            reverse('posts:index'), {'cursor': second_page.previous_cursor})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 10)
+        self.assertEqual(page.number, 1)
+        self.assertIsNone(page.previous_cursor)
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор не ломает страницу"""
+        response = self.post_author.get(
+            reverse('posts:group_list', args=(self.group.slug,)),
+            {'cursor': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_cursor_page_skips_count_and_offset(self):
+        """Страница по курсору не выполняет COUNT(*) и OFFSET"""
+        first_page = self.post_author.get(
+            reverse('posts:index')).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.post_author.get(
+                reverse('posts:index'), {'cursor': first_page.next_cursor})
+        for query in queries.captured_queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('COUNT(', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
+
+
+class PageWindowTest(TestCase):
+    """Окно номеров страниц и число страниц в навигации"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='slug-test'
+        )
+        for i in range(65):
+            Post.objects.create(
+                author=cls.user, text=f'{i}й пост', group=cls.group
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def page(self, url=reverse('posts:index'), **params):
+        return self.client.get(url, params).context['page_obj']
+
+    def test_window_cursors_lead_to_numbered_pages(self):
+        """Курсоры окна ведут на те же посты, что и номера страниц"""
+        page = self.page()
+        for _ in range(3):
+            page = self.page(cursor=page.next_cursor)
+        self.assertEqual(page.number, 4)
+        self.assertEqual(
+            [number for number, _ in page.window], [2, 3, 4, 5, 6]
+        )
+        for number, cursor in page.window:
+            with self.subTest(number=number):
+                expected = list(self.page(page=number))
+                if number != page.number:
+                    self.assertEqual(list(self.page(cursor=cursor)), expected)
+
+    def test_window_near_edges(self):
+        page = self.page()
+        self.assertEqual([number for number, _ in page.window], [1, 2, 3])
+        while page.next_cursor:
+            page = self.page(cursor=page.next_cursor)
+        self.assertEqual([number for number, _ in page.window], [5, 6, 7])
+        self.assertEqual(len(page), 5)
+
+    def test_navigation_size_does_not_grow_with_feed(self):
+        """Навигация показывает окно страниц и их число"""
+        response = self.client.get(
+            reverse('posts:group_list', args=(self.group.slug,))
+        )
+        self.assertContains(response, 'class="page-link"', count=5)
+        self.assertContains(response, 'из 7')
+
+    def test_index_total_is_approximate_for_big_feeds(self):
+        """Большая главная показывает число постов из кеша"""
+        with mock.patch.object(caching, 'EXACT_TOTAL_LIMIT', 10):
+            self.assertEqual(caching.post_total(), 65)
+            Post.objects.create(author=self.user, text='Новый пост')
+            self.assertEqual(caching.post_total(), 65)
+        Post.objects.create(author=self.user, text='Ещё пост')
+        cache.delete('posts:total')
+        self.assertEqual(caching.post_total(), 67)
+
+
+class FeedQueriesTest(TestCase):
+    """Число запросов ленты не зависит от числа постов на странице"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Имя', last_name='Фамилия')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug-test',
+            description='Тестовое описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        cls.pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(cls.group.slug,)),
+            reverse('posts:profile', args=(cls.user.username,)),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def create_posts(self, amount):
+        for i in range(amount):
+            post = Post.objects.create(
+                author=self.user,
+                text=f'{i}й тестовый пост',
+                group=self.group
+            )
+            Comment.objects.create(post=post, author=self.reader, text='Ок')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.create_posts(2)
+        small_pages = [self.count_queries(url) for url in self.pages]
+        self.create_posts(8)
+        for url, expected in zip(self.pages, small_pages):
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), expected)
+                # Один из запросов - проверка ETag страницы, ещё один -
+                # готовые рекомендации авторов
+                self.assertLessEqual(expected, 9)
+
+
+class CommentPaginationTest(TestCase):
+    """Комментарии поста выводятся пачками по курсору"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for i in range(25):
+            commentator = User.objects.create_user(username=f'reader{i}')
+            Comment.objects.create(
+                post=cls.post, author=commentator, text=f'Комментарий {i}')
+        cls.detail = reverse('posts:post_detail', args=(cls.post.pk,))
+        cls.fragment = reverse('posts:comments', args=(cls.post.pk,))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_shows_first_batch(self):
+        """На странице поста первые комментарии и ссылка на следующие"""
+        response = self.client.get(self.detail)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0]['text'], 'Комментарий 0')
+        self.assertContains(response, 'Показать ещё комментарии')
+
+    def test_fragment_returns_next_batch(self):
+        """Фрагмент отдаёт следующую пачку в HTML и JSON"""
+        next_cursor = self.client.get(self.detail).context['next_cursor']
+        response = self.client.get(self.fragment, {'cursor': next_cursor})
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertContains(response, 'Комментарий 24')
+        self.assertNotContains(response, 'Комментарий 19')
+        self.assertNotContains(response, 'Показать ещё комментарии')
+        data = self.client.get(
+            self.fragment, {'cursor': next_cursor, 'format': 'json'}
+        ).json()
+        self.assertEqual(
+            [comment['author'] for comment in data['comments']],
+            [f'reader{i}' for i in range(20, 25)]
+        )
+        self.assertIsNone(data['next_cursor'])
+
+    def test_fragment_of_missing_post(self):
+        response = self.client.get(reverse('posts:comments', args=(0,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_comment_authors_are_not_queried_one_by_one(self):
+        """Авторы комментариев выбираются одним запросом с пачкой"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.fragment)
+        self.assertEqual(len(queries), 2)
+
+    def test_new_comment_resets_cached_batch(self):
+        Comment.objects.filter(post=self.post).delete()
+        self.assertEqual(self.client.get(self.detail).context['comments'], [])
+        Comment.objects.create(post=self.post, author=self.author, text='Ещё')
+        self.assertEqual(
+            len(self.client.get(self.detail).context['comments']), 1
+        )
+
+
+class ConditionalGetTest(TestCase):
+    """Неизменившиеся страницы отдаются ответом 304 без ленты и шаблона"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug-test',
+            description='Тестовое описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(cls.group.slug,)),
+            reverse('posts:profile', args=(cls.author.username,)),
+            reverse('posts:post_detail', args=(cls.post.pk,)),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def etags(self):
+        return [self.client.get(url)['ETag'] for url in self.pages]
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Повторный запрос с тем же ETag получает 304 за один запрос"""
+        for url, etag in zip(self.pages, self.etags()):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.revalidate(url, etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.content)
+                # Сессия, пользователь и не больше одного запроса ETag
+                self.assertLessEqual(len(queries), 3)
+
+    def test_pages_are_private_and_revalidated(self):
+        response = self.client.get(self.pages[0])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_etag_follows_changes(self):
+        """ETag меняется вместе с тем, что показывает страница"""
+        changes = (
+            lambda: Post.objects.create(
+                author=self.author, text='Новый', group=self.group
+            ),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'
+            ),
+            lambda: Group.objects.filter(pk=self.group.pk).first().save(),
+        )
+        for change in changes:
+            before = self.etags()
+            change()
+            for url, old, new in zip(self.pages, before, self.etags()):
+                with self.subTest(url=url, change=change):
+                    self.assertNotEqual(old, new)
+
+    def test_etag_depends_on_user(self):
+        """У каждого пользователя свой ETag: шапка и кнопки у всех разные"""
+        url = self.pages[0]
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_etag_depends_on_csrf_cookie(self):
+        """Страница со старым токеном CSRF в формах не отдаётся 304"""
+        url = self.pages[3]
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        # Вход и выход меняют куку CSRF
+        self.client.logout()
+        self.client.force_login(self.reader)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 64
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_pages_without_forms_revalidate_without_cookies(self):
+        """Клиент без кук, например робот, тоже получает 304"""
+        for url in self.pages[:4]:
+            with self.subTest(url=url):
+                response = Client().get(url)
+                self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+                response = Client().get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_unfollow_changes_profile_and_feed(self):
+        profile, feed = self.pages[2], self.pages[4]
+        before = [self.client.get(url)['ETag'] for url in (profile, feed)]
+        Follow.objects.filter(user=self.reader).delete()
+        for url, etag in zip((profile, feed), before):
+            with self.subTest(url=url):
+                response = self.revalidate(url, etag)
+                self.assertEqual(response.status_code, 200)
+        self.assertNotIn(
+            self.post, self.client.get(feed).context['page_obj']
+        )
+
+    def test_missing_objects_are_not_found(self):
+        for url in (
+            reverse('posts:group_list', args=('missing',)),
+            reverse('posts:profile', args=('missing',)),
+            reverse('posts:post_detail', args=(0,)),
+        ):
+            with self.subTest(url=url):
+                response = self.revalidate(url, '"anything"')
+                self.assertEqual(response.status_code, 404)
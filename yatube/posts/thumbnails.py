@@ -0,0 +1,41 @@
+import logging
+
+from django.db import connection
+from sorl.thumbnail import get_thumbnail
+
+from . import caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Размер миниатюры карточки поста, общий для лент и страницы поста
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def generate(post_id):
+    """Строит миниатюру картинки поста и запоминает её в посте."""
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is None:
+        return
+    name = ''
+    if post.image:
+        try:
+            name = get_thumbnail(
+                post.image, CARD_GEOMETRY, **CARD_OPTIONS
+            ).name
+        except (OSError, ValueError):
+            logger.exception('Не удалось построить миниатюру %s', post.image)
+    # Картинку могли заменить, пока строилась миниатюра
+    Post.objects.filter(pk=post_id, image=post.image.name).update(
+        thumbnail=name
+    )
+    caching.invalidate(caching.post_scope(post_id))
+
+
+def generate_in_worker(post_id):
+    try:
+        generate(post_id)
+    finally:
+        # У потока пула своё соединение с БД
+        connection.close()
@@ -0,0 +1,366 @@
+import csv
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from core.tasks import enqueue
+
+from . import (
+    counters, fanout, followgraph, recommendations, search, tasks,
+)
+from .models import Comment, Follow, Group, Post, User
+
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSONL, CSV)
+BATCH_SIZE = 1000
+EXPORT_CHECKPOINT = 'export.checkpoint.json'
+IMPORT_CHECKPOINT = 'import.checkpoint.json'
+# Как выгружается каждая таблица: имя файла, модель и пары
+# (колонка, поле). Авторы и группы хранятся по username и slug,
+# поэтому не зависят от первичных ключей базы.
+TABLES = (
+    ('groups', Group, (
+        ('slug', 'slug'),
+        ('title', 'title'),
+        ('description', 'description'),
+    )),
+    ('posts', Post, (
+        ('id', 'pk'),
+        ('author', 'author__username'),
+        ('group', 'group__slug'),
+        ('text', 'text'),
+        ('pub_date', 'pub_date'),
+        ('image', 'image'),
+    )),
+    ('comments', Comment, (
+        ('id', 'pk'),
+        ('post', 'post_id'),
+        ('author', 'author__username'),
+        ('text', 'text'),
+        ('created', 'created'),
+    )),
+    ('follows', Follow, (
+        ('user', 'user__username'),
+        ('author', 'author__username'),
+    )),
+)
+
+
+def table_path(directory, name, fmt):
+    return os.path.join(directory, f'{name}.{fmt}')
+
+
+def _load_checkpoint(path, fmt):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        checkpoint = json.load(file)
+    if checkpoint['format'] != fmt:
+        raise ValueError(
+            f'Контрольная точка {path} записана для формата '
+            f'{checkpoint["format"]}'
+        )
+    return checkpoint
+
+
+def _save_checkpoint(path, checkpoint):
+    # Через временный файл, чтобы точка не оказалась записана наполовину
+    with open(path + '.tmp', 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(path + '.tmp', path)
+
+
+class Progress:
+    """Печатает число обработанных строк и скорость в строках в секунду."""
+
+    def __init__(self, name, report, done=0):
+        self.name = name
+        self.report = report
+        self.done = done
+        self.rows = 0
+        self.start = time.monotonic()
+
+    def add(self, rows):
+        self.done += rows
+        self.rows += rows
+        if self.report is not None:
+            rate = self.rows / max(time.monotonic() - self.start, 1e-6)
+            self.report(f'{self.name}: {self.done} строк, {rate:.0f} строк/с')
+
+
+# Выгрузка
+
+def _value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _chunks(model, lookups, last_pk, batch_size):
+    """
+    Строки таблицы пачками по первичному ключу: каждая пачка -
+    отдельный запрос с LIMIT, память не растёт с размером таблицы.
+    """
+    while True:
+        rows = list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk'
+        ).values_list('pk', *lookups)[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield last_pk, [[_value(value) for value in row[1:]] for row in rows]
+
+
+def export_data(directory, fmt=JSONL, batch_size=BATCH_SIZE, progress=None):
+    """
+    Выгружает группы, посты, комментарии и подписки в файлы directory.
+    После каждой пачки запоминается последний выгруженный ключ, и
+    прерванная выгрузка продолжается с того же места.
+    """
+    os.makedirs(directory, exist_ok=True)
+    checkpoint_path = os.path.join(directory, EXPORT_CHECKPOINT)
+    checkpoint = _load_checkpoint(checkpoint_path, fmt) or {
+        'format': fmt, 'last': {},
+    }
+    for name, model, columns in TABLES:
+        header = [column for column, _ in columns]
+        last_pk = checkpoint['last'].get(name, 0)
+        path = table_path(directory, name, fmt)
+        append = last_pk > 0 and os.path.exists(path)
+        counter = Progress(name, progress)
+        with open(path, 'a' if append else 'w', newline='',
+                  encoding='utf-8') as file:
+            writer = csv.writer(file)
+            if fmt == CSV and not append:
+                writer.writerow(header)
+            for last_pk, rows in _chunks(
+                model, [lookup for _, lookup in columns], last_pk, batch_size
+            ):
+                for row in rows:
+                    if fmt == CSV:
+                        writer.writerow(row)
+                    else:
+                        file.write(json.dumps(
+                            dict(zip(header, row)), ensure_ascii=False
+                        ) + '\n')
+                file.flush()
+                checkpoint['last'][name] = last_pk
+                _save_checkpoint(checkpoint_path, checkpoint)
+                counter.add(len(rows))
+    os.remove(checkpoint_path)
+
+
+# Загрузка
+
+def _read(path, fmt):
+    with open(path, newline='', encoding='utf-8') as file:
+        if fmt == CSV:
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+@contextmanager
+def _keep_dates():
+    """
+    bulk_create подставляет текущее время в поля с auto_now_add,
+    а при загрузке даты нужно сохранить как есть.
+    """
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Comment._meta.get_field('created'),
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _user_ids(usernames):
+    """
+    ID пользователей по username. Недостающие пользователи
+    создаются без пароля: войти они смогут после сброса пароля.
+    """
+    usernames = set(usernames)
+    found = dict(User.objects.filter(
+        username__in=usernames
+    ).values_list('username', 'pk'))
+    missing = usernames - found.keys()
+    if missing:
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=username, password=password)
+             for username in missing],
+            ignore_conflicts=True,
+        )
+        found.update(User.objects.filter(
+            username__in=missing
+        ).values_list('username', 'pk'))
+    return found
+
+
+def _group_ids(slugs):
+    return dict(Group.objects.filter(
+        slug__in=set(slugs) - {None, ''}
+    ).values_list('slug', 'pk'))
+
+
+def _groups(rows, offsets):
+    return [
+        Group(
+            slug=row['slug'],
+            title=row['title'],
+            description=row['description'],
+        )
+        for row in rows
+    ]
+
+
+def _posts(rows, offsets):
+    users = _user_ids(row['author'] for row in rows)
+    groups = _group_ids(row['group'] for row in rows)
+    return [
+        Post(
+            pk=int(row['id']) + offsets['posts'],
+            author_id=users[row['author']],
+            group_id=groups.get(row['group']),
+            text=row['text'],
+            pub_date=parse_datetime(row['pub_date']),
+            image=row['image'] or '',
+        )
+        for row in rows
+    ]
+
+
+def _comments(rows, offsets):
+    users = _user_ids(row['author'] for row in rows)
+    post_ids = {int(row['post']) + offsets['posts'] for row in rows}
+    # Пост мог появиться уже после выгрузки постов: такие
+    # комментарии пропускаются
+    existing = set(Post.objects.filter(
+        pk__in=post_ids
+    ).values_list('pk', flat=True))
+    comments = []
+    for row in rows:
+        post_id = int(row['post']) + offsets['posts']
+        if post_id in existing:
+            comments.append(Comment(
+                pk=int(row['id']) + offsets['comments'],
+                post_id=post_id,
+                author_id=users[row['author']],
+                text=row['text'],
+                created=parse_datetime(row['created']),
+            ))
+    return comments
+
+
+def _follows(rows, offsets):
+    users = _user_ids(
+        itertools.chain.from_iterable(
+            (row['user'], row['author']) for row in rows
+        )
+    )
+    return [
+        Follow(user_id=users[row['user']], author_id=users[row['author']])
+        for row in rows
+        if row['user'] != row['author']
+    ]
+
+
+BUILDERS = {
+    'groups': _groups,
+    'posts': _posts,
+    'comments': _comments,
+    'follows': _follows,
+}
+
+
+def _offsets():
+    """
+    Сдвиги ключей загружаемых постов и комментариев: новый ключ -
+    старый плюс наибольший ключ в базе до загрузки. В пустую базу
+    ключи переносятся как есть, соответствие старых и новых ключей
+    не нужно держать в памяти.
+    """
+    return {
+        'posts': Post.objects.aggregate(last=Max('pk'))['last'] or 0,
+        'comments': Comment.objects.aggregate(last=Max('pk'))['last'] or 0,
+    }
+
+
+def import_data(directory, fmt=JSONL, batch_size=BATCH_SIZE, progress=None):
+    """
+    Загружает файлы export_data() пачками через bulk_create.
+    После каждой пачки запоминается число загруженных строк, и
+    прерванная загрузка продолжается с того же места. Повторно
+    загруженная пачка не создаёт дублей. Счётчики, ленты подписок
+    и поисковый индекс в конце пересобираются, кеш сбрасывается,
+    а для картинок загруженных постов ставятся задачи миниатюр.
+    Рекомендации пользователей с загруженными подписками помечаются
+    устаревшими.
+    """
+    checkpoint_path = os.path.join(directory, IMPORT_CHECKPOINT)
+    checkpoint = _load_checkpoint(checkpoint_path, fmt) or {
+        'format': fmt, 'done': {}, 'offsets': _offsets(),
+    }
+    _save_checkpoint(checkpoint_path, checkpoint)
+    with _keep_dates():
+        for name, model, _ in TABLES:
+            path = table_path(directory, name, fmt)
+            if not os.path.exists(path):
+                continue
+            done = checkpoint['done'].get(name, 0)
+            counter = Progress(name, progress, done)
+            rows = itertools.islice(_read(path, fmt), done, None)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                objects = BUILDERS[name](batch, checkpoint['offsets'])
+                with transaction.atomic():
+                    model.objects.bulk_create(objects, ignore_conflicts=True)
+                    if model is Follow:
+                        # Сигналы не срабатывают: рекомендации этих
+                        # пользователей пересчитает refresh_suggestions
+                        recommendations.mark_stale(*{
+                            user_id
+                            for follow in objects
+                            for user_id in (follow.user_id, follow.author_id)
+                        })
+                checkpoint['done'][name] = done = done + len(batch)
+                _save_checkpoint(checkpoint_path, checkpoint)
+                counter.add(len(batch))
+    # Ключи задавались явно: последовательности (в PostgreSQL)
+    # нужно передвинуть за них
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+            no_style(), [Post, Comment]
+        ):
+            cursor.execute(sql)
+    for kind in counters.SOURCES:
+        counters.rebuild(kind)
+    fanout.rebuild()
+    search.rebuild()
+    cache.clear()
+    followgraph.reset()
+    # Миниатюры не выгружаются: загруженным картинкам их строят задачи
+    for post_id in Post.objects.filter(
+        pk__gt=checkpoint['offsets']['posts'], thumbnail=''
+    ).exclude(image='').values_list('pk', flat=True).iterator():
+        enqueue(tasks.generate_thumbnail, post_id)
+    os.remove(checkpoint_path)
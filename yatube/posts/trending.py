@@ -0,0 +1,108 @@
+import datetime as dt
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Exp
+
+from . import caching
+from .models import Post, Trending
+
+# Вклад событий в счёт поста
+COMMENT_WEIGHT = 1.0
+FOLLOW_WEIGHT = 2.0
+# Подписка на автора поднимает его посты не старше стольких секунд
+FOLLOW_BOOST_AGE = 60 * 60 * 24 * 7
+# Сколько постов в списке популярных
+TOP_SIZE = 20
+# Посты с меньшим счётом удаляются из таблицы при пересчёте
+MIN_SCORE = 0.01
+TOP_KEY = 'posts:trending'
+
+
+def _growth(since, until):
+    """
+    Выражение exp(rate * (until - since)): во столько раз событие в
+    момент until весомее события в момент since. Считает сама база,
+    сразу для всех строк UPDATE.
+    """
+    rate = math.log(2) / settings.TRENDING_HALF_LIFE
+    return Exp((until - since) * Value(rate), output_field=FloatField())
+
+
+def _bump(post_ids, weight, at):
+    """
+    Прибавляет событие веса weight в момент at к счетам постов.
+    Счёт хранится на момент base своей строки, поэтому событие
+    прибавляется с множителем роста от base до at одним UPDATE,
+    без чтения строк. Недостающие строки создаются с base = at.
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    Trending.objects.bulk_create(
+        [Trending(post_id=post_id, base=at) for post_id in post_ids],
+        ignore_conflicts=True,
+    )
+    Trending.objects.filter(post_id__in=post_ids).update(
+        score=F('score') + Value(weight) * _growth(F('base'), Value(at))
+    )
+
+
+def on_comment(post_id, at):
+    if Post.objects.filter(pk=post_id).exists():
+        _bump([post_id], COMMENT_WEIGHT, at)
+
+
+def on_follow(author_id, at):
+    """Новая подписка поднимает недавние посты автора."""
+    _bump(
+        Post.objects.filter(
+            author_id=author_id,
+            pub_date__gte=dt.datetime.fromtimestamp(
+                at - FOLLOW_BOOST_AGE, dt.timezone.utc
+            ),
+        ).values_list('pk', flat=True),
+        FOLLOW_WEIGHT,
+        at,
+    )
+
+
+def refresh(now=None):
+    """
+    Переносит счета всех постов на момент now: одно UPDATE умножает
+    каждый счёт на затухание от его base, после чего счета снова
+    сравнимы между собой и не растут без предела. Угасшие строки
+    удаляются, а TOP_SIZE лучших постов сохраняются в кеше.
+    """
+    now = time.time() if now is None else now
+    Trending.objects.update(
+        score=F('score') * _growth(Value(now), F('base')), base=now
+    )
+    Trending.objects.filter(score__lt=MIN_SCORE).delete()
+    top = _top()
+    # Перезапись ключа не рассылается по LRU воркеров, удаление - да
+    cache.delete(TOP_KEY)
+    cache.set(TOP_KEY, top, None)
+    caching.invalidate(caching.TRENDING)
+    return top
+
+
+def _top():
+    return list(Trending.objects.order_by('-score').values_list(
+        'post_id', flat=True
+    )[:TOP_SIZE])
+
+
+def top_ids():
+    """
+    Готовый список популярных постов. Если кеш его потерял, список
+    выбирается по индексу score до следующего пересчёта.
+    """
+    top = cache.get(TOP_KEY)
+    if top is None:
+        top = _top()
+        cache.set(TOP_KEY, top, None)
+    return top
@@ -1,11 +1,271 @@
-from django.core.paginator import Paginator
+import binascii
+import math
+from collections import namedtuple
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
 POST_LIMIT = 10
+# Сколько комментариев показывается за раз
+COMMENT_LIMIT = 20
+# Параметр запроса с курсором страницы
+CURSOR_PARAM = 'cursor'
+# Направления перехода по курсору: к более старым и к более новым постам
+NEXT = 'n'
+PREVIOUS = 'p'
+# Сколько соседних страниц навигация показывает с каждой стороны
+PAGE_WINDOW = 2
+# Ключ поста без остальных полей: по нему строится курсор
+Position = namedtuple('Position', 'pub_date pk')
+# Поля ключа паджинации в запросе: дата и ID поста
+KEY = ('pub_date', 'pk')
+
+
+def encode_cursor(direction, post, number, date_field='pub_date'):
+    """Упаковывает позицию поста в непрозрачную строку курсора."""
+    date = getattr(post, date_field).isoformat()
+    payload = f'{direction}|{date}|{post.pk}|{number}'
+    return urlsafe_base64_encode(force_bytes(payload))
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор. Для испорченного курсора возвращает None."""
+    try:
+        payload = urlsafe_base64_decode(cursor).decode()
+        direction, pub_date, pk, number = payload.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk, number = int(pk), int(number)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None or number < 1:
+        return None
+    return direction, pub_date, pk, number
+
+
+class CursorPaginator(Paginator):
+    """
+    Паджинатор по ключу (pub_date, id).
+
+    Страница по курсору выбирается условием по индексу и LIMIT,
+    без COUNT(*) и OFFSET, поэтому любая страница стоит как первая.
+    Навигация показывает окно из window соседних страниц с каждой
+    стороны: курсоры на них берутся из ключей постов за текущей
+    страницей. Число постов для навигации передаётся в total из
+    счётчика или оценки. Номер страницы ?page= поддерживается для
+    старых ссылок.
+
+    key - имена полей даты и ID поста в запросе. Лента может брать их
+    из другой таблицы с подходящим индексом, если значения те же, что
+    у pub_date и pk поста: курсор строится по полям поста.
+    """
+
+    def __init__(self, object_list, per_page, total=None,
+                 window=PAGE_WINDOW, key=KEY, **kwargs):
+        self.date_field, self.pk_field = key
+        super().__init__(
+            object_list.order_by(f'-{self.date_field}', f'-{self.pk_field}'),
+            per_page, **kwargs
+        )
+        self._total = total
+        self.window = window
+
+    @cached_property
+    def total(self):
+        """
+        Число постов для навигации: значение или результат функции
+        total, None - если его не показывают. Точный count нужен
+        только старым ссылкам ?page=.
+        """
+        return self._total() if callable(self._total) else self._total
+
+    @property
+    def total_pages(self):
+        if self.total is None:
+            return None
+        return max(1, math.ceil(self.total / self.per_page))
+
+    def _older(self, queryset, position):
+        date, pk = self.date_field, self.pk_field
+        return queryset.filter(
+            Q(**{f'{date}__lt': position.pub_date})
+            | Q(**{date: position.pub_date, f'{pk}__lt': position.pk})
+        )
 
+    def _newer(self, queryset, position):
+        date, pk = self.date_field, self.pk_field
+        return queryset.filter(
+            Q(**{f'{date}__gt': position.pub_date})
+            | Q(**{date: position.pub_date, f'{pk}__gt': position.pk})
+        ).order_by(date, pk)
 
-def page_paginator(queryset, request):
+    def _fetch(self, queryset):
+        """
+        Выбирает страницу и посты следующих за ней страниц окна,
+        начиная с ближайшего: непустой хвост значит, что дальше есть
+        ещё посты.
+        """
+        rows = list(queryset[:self.per_page * self.window + 1])
+        return rows[:self.per_page], rows[self.per_page:]
+
+    def _positions(self, queryset):
+        """
+        Ключи постов соседних страниц окна без остальных полей - для
+        стороны, в которую основной запрос страницы не смотрел.
+        Соседней странице хватает крайнего поста текущей.
+        """
+        if self.window < 2:
+            return []
+        limit = self.per_page * (self.window - 1) + 1
+        return [
+            Position(*row)
+            for row in queryset.values_list(
+                self.date_field, self.pk_field
+            )[:limit]
+        ]
+
+    def first_page(self):
+        rows, older = self._fetch(self.object_list)
+        return self._cursor_page(rows, 1, older, [])
+
+    def cursor_page(self, cursor):
+        """Возвращает страницу по курсору, испорченный курсор - первую."""
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            return self.first_page()
+        direction, pub_date, pk, number = decoded
+        position = Position(pub_date, pk)
+        if direction == NEXT:
+            rows, older = self._fetch(self._older(self.object_list, position))
+            newer = []
+            if rows and number > self.window + 1:
+                newer = self._positions(self._newer(self.object_list, rows[0]))
+            return self._cursor_page(rows, number, older, newer)
+        rows, newer = self._fetch(self._newer(self.object_list, position))
+        rows.reverse()
+        if not newer:
+            # Дошли до начала ленты: показываем полную первую страницу
+            return self.first_page()
+        older = []
+        if rows:
+            older = self._positions(self._older(self.object_list, rows[-1]))
+        return self._cursor_page(rows, number, older, newer)
+
+    def make_page(self, rows, number, next_cursor=None,
+                  previous_cursor=None, window=None):
+        """
+        Собирает страницу из уже выбранных постов и курсоров. Без
+        window навигация показывает только соседние страницы.
+        """
+        page = Page(rows, number, self)
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        if window is None:
+            window = [(number, None)]
+            if previous_cursor:
+                window.insert(0, (
+                    number - 1, None if number == 2 else previous_cursor
+                ))
+            if next_cursor:
+                window.append((number + 1, next_cursor))
+        page.window = window
+        return page
+
+    def _steps(self, direction, edge, beyond, number):
+        """
+        Номера и курсоры страниц окна в одну сторону от текущей. edge -
+        крайний пост текущей страницы с этой стороны, beyond - посты
+        за ней, начиная с ближайшего. Первая страница открывается без
+        курсора и есть всегда.
+        """
+        step = 1 if direction == NEXT else -1
+        anchors = [edge] + [
+            beyond[index - 1]
+            for index in range(self.per_page, len(beyond), self.per_page)
+        ]
+        steps = []
+        for offset in range(1, self.window + 1):
+            target = number + step * offset
+            if target == 1:
+                steps.append((1, None))
+                break
+            if target < 1 or offset > len(anchors):
+                break
+            steps.append((
+                target, encode_cursor(direction, anchors[offset - 1], target)
+            ))
+        return steps
+
+    def _cursor_page(self, rows, number, older, newer):
+        next_cursor = previous_cursor = None
+        window = [(number, None)]
+        if rows and older:
+            next_cursor = encode_cursor(NEXT, rows[-1], number + 1)
+            window += self._steps(NEXT, rows[-1], older, number)
+        if rows and (number > 1 or newer):
+            previous_cursor = encode_cursor(PREVIOUS, rows[0], number - 1)
+            window[:0] = reversed(
+                self._steps(PREVIOUS, rows[0], newer, number)
+            )
+        return self.make_page(
+            rows, number, next_cursor, previous_cursor, window
+        )
+
+    def get_page(self, number):
+        """
+        Страница по номеру для старых ссылок ?page=. Она выбирается
+        через OFFSET, но без COUNT(*): о следующей странице говорит
+        лишний пост в выборке. Номер за концом ленты даёт первую
+        страницу.
+        """
+        try:
+            number = max(1, int(number))
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = list(self.object_list[offset:offset + self.per_page + 1])
+        if not rows:
+            return self.first_page()
+        next_cursor = previous_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = encode_cursor(NEXT, rows[-1], number + 1)
+        if number > 1:
+            previous_cursor = encode_cursor(PREVIOUS, rows[0], number - 1)
+        return self.make_page(rows, number, next_cursor, previous_cursor)
+
+
+def comment_page(queryset, cursor=None, limit=COMMENT_LIMIT):
+    """
+    Пачка комментариев по возрастанию (created, id) после курсора
+    и курсор следующей пачки.
+    """
+    queryset = queryset.order_by('created', 'pk')
+    decoded = decode_cursor(cursor) if cursor else None
+    number = 1
+    if decoded is not None:
+        _, created, pk, number = decoded
+        queryset = queryset.filter(
+            Q(created__gt=created) | Q(created=created, pk__gt=pk)
+        )
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(NEXT, rows[-1], number + 1, 'created')
+    return rows, next_cursor
+
+
+def page_paginator(queryset, request, total=None, key=KEY):
     """"Функция для паджинации страниц"""
-    paginator = Paginator(queryset, POST_LIMIT)
+    paginator = CursorPaginator(queryset, POST_LIMIT, total, key=key)
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        return paginator.cursor_page(cursor)
     page_number = request.GET.get('page')
-
-    return paginator.get_page(page_number)
+    if page_number:
+        return paginator.get_page(page_number)
+    return paginator.first_page()
@@ -1,73 +1,126 @@
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.querystats import query_budget
+from core.routers import replica_reads
+
+from . import (
+    caching, counters, etags, feeds, followgraph, permissions,
+    recommendations, search, trending,
+)
 from .forms import CommentForm, PostForm
 from .models import Group, Follow, Post, User
-from .utils import page_paginator
+from .utils import CURSOR_PARAM
 
 
-@cache_page(20)
+@query_budget(5)
+@replica_reads
+@etags.conditional(etags.index)
 def index(request):
     """"Выводит шаблон главной страницы"""
-    post = Post.objects.select_related('group', 'author')
+    post = feeds.index_feed()
+    page = caching.feed_page(
+        post, request, caching.INDEX, total=caching.post_total,
+    )
+    followgraph.annotate(request.user, page)
     context = {
         'post': post,
-        'page_obj': page_paginator(post, request)
+        'page_obj': page,
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(7)
+@replica_reads
+@etags.conditional(etags.group_posts)
 def group_posts(request, slug):
     """Выводит шаблон с группами постов"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = feeds.group_feed(group)
+    page = caching.feed_page(
+        posts, request, caching.group_scope(group.pk),
+        total=lambda: counters.get_count(counters.GROUP_POSTS, group.pk),
+    )
+    followgraph.annotate(request.user, page)
     context = {
         'group': group,
-        'posts': posts,
-        'page_obj': page_paginator(posts, request)
+        'page_obj': page,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(9)
+@replica_reads
+@etags.conditional(etags.profile)
 def profile(request, username):
     """Выводит шаблон профайла пользователя"""
     user = get_object_or_404(User, username=username)
-    amount = user.posts.all().count()
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=user
-        ).exists()
-    else:
-        following = False
+    amount = counters.get_count(counters.POSTS, user.pk)
     context = {
         'author': user,
         'amount': amount,
-        'page_obj': page_paginator(user.posts.all(), request),
-        'following': following,
-        'profile': user
+        'followers_count': followgraph.follower_count(user),
+        'page_obj': caching.feed_page(
+            feeds.author_feed(user), request, caching.author_scope(user.pk),
+            total=amount,
+        ),
+        'following': followgraph.is_following(request.user, user),
+        'profile': user,
+        'suggestions': recommendations.similar_authors(user),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(10)
+@replica_reads
+@etags.conditional(etags.post_detail)
 def post_detail(request, post_id):
     """Выводит шаблон поста"""
     post = get_object_or_404(Post.objects.select_related(
         'author',
         'group',
     ), id=post_id)
-    posts_count = post.author.posts.all().count()
+    followgraph.annotate(request.user, [post])
+    posts_count = counters.get_count(counters.POSTS, post.author_id)
     form = CommentForm(request.POST or None)
+    comments, next_cursor = caching.comment_batch(
+        post.pk, request.GET.get(CURSOR_PARAM)
+    )
     context = {
         'post': post,
         'group': post.group,
         'posts_count': posts_count,
+        'comments_count': counters.get_count(counters.COMMENTS, post.pk),
         'form': form,
-        'comments': post.comments.all(),
+        'comments': comments,
+        'next_cursor': next_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(2)
+@replica_reads
+def post_comments(request, post_id):
+    """Отдаёт следующую пачку комментариев поста в HTML или JSON"""
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments, next_cursor = caching.comment_batch(
+        post_id, request.GET.get(CURSOR_PARAM)
+    )
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': comments,
+            'next_cursor': next_cursor,
+        })
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'includes/comments.html', context)
+
+
+@query_budget(3)
 @login_required
 def post_create(request):
     """Выводит шаблон страницы создания поста"""
@@ -83,12 +136,12 @@ def post_create(request):
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@query_budget(4)
 @login_required
 def post_edit(request, post_id):
     """Выводит шаблон страницы редактирования поста"""
     post = get_object_or_404(Post, pk=post_id)
-    user = post.author
-    if request.user != user:
+    if not permissions.can_edit(request.user, post):
         return redirect('posts:post_detail', post_id)
     form = PostForm(
         request.POST or None,
@@ -120,10 +173,50 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(8)
+@replica_reads
+def post_search(request):
+    """Выводит шаблон поиска по постам и комментариям"""
+    query = request.GET.get('q', '').strip()
+    page = search.search_page(query, request) if query else None
+    if page is not None:
+        followgraph.annotate(request.user, page)
+    context = {
+        'query': query,
+        'page_obj': page,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(3)
+@replica_reads
+@etags.conditional(etags.popular)
+def popular(request):
+    """Выводит популярные посты из готового списка"""
+    ids = trending.top_ids()
+    posts = feeds.feed_queryset(Post.objects.filter(pk__in=ids)).in_bulk()
+    page = [posts[pk] for pk in ids if pk in posts]
+    caching.attach_cards(page)
+    followgraph.annotate(request.user, page)
+    return render(request, 'posts/popular.html', {
+        'page_obj': page,
+        'popular': True,
+    })
+
+
+@query_budget(7)
+@replica_reads
 @login_required
+@etags.conditional(etags.follow_index)
 def follow_index(request):
-    post = Post.objects.filter(author__following__user=request.user)
-    context = {'page_obj': page_paginator(post, request)}
+    post = feeds.follow_feed(request.user)
+    context = {
+        'page_obj': caching.feed_page(
+            post, request, *caching.followed_scopes(request.user),
+            key=feeds.FOLLOW_KEY,
+        ),
+        'suggestions': recommendations.who_to_follow(request.user),
+    }
     return render(request, 'posts/follow.html', context)
 
 
@@ -131,7 +224,7 @@ def follow_index(request):
 def profile_follow(request, username):
     """Функция для подписки на автора"""
     author = get_object_or_404(User, username=username)
-    if request.user != author:
+    if permissions.can_follow(request.user, author):
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username=username)
 
@@ -1,12 +1,14 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
 
+from core.forms import FormControlMixin
+
 User = get_user_model()
 
 
 #  создадим собственный класс для формы регистрации
 #  сделаем его наследником предустановленного класса UserCreationForm
-class CreationForm(UserCreationForm):
+class CreationForm(FormControlMixin, UserCreationForm):
     #  наследуется класс Meta, вложенный в класс UserCreationForm:
     class Meta(UserCreationForm.Meta):
         # укажем модель, с которой связана создаваемая форма
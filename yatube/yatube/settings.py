@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,10 +47,14 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',  # Зарегистрировали приложение users
     'core.apps.CoreConfig',  # Зарегистрировали приложение core
     'about.apps.AboutConfig',  # Зарегистрировали приложение about
+    'api.apps.ApiConfig',  # JSON API для мобильных клиентов
     'sorl.thumbnail',  # Зарегистрировали приложение для работы с картинками
+    'django.forms',  # Шаблоны виджетов форм для CachedWidgetTemplates
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryStatsMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,12 +66,31 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'yatube.urls'
 
+# Замер времени отрисовки шаблонов, тегов и фильтров
+# (core.renderstats), статистика - на странице stats/templates/
+TEMPLATE_PROFILING = DEBUG
+
+# Превышение бюджета SQL-запросов view (core.querystats.query_budget)
+# при разработке и в тестах роняет запрос, в бою только пишется в лог
+QUERY_BUDGET_RAISE = DEBUG
+
+# Вне режима отладки шаблоны разбираются один раз на процесс,
+# при разработке - заново на каждый запрос, чтобы правки были видны
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -89,6 +113,9 @@ TEMPLATES = [
     },
 ]
 
+# Шаблоны виджетов форм поставляются с Django и кешируются всегда
+FORM_RENDERER = 'core.forms.CachedWidgetTemplates'
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 # В Django есть несколько модулей для отправки писем, подключить
@@ -97,6 +124,8 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+# Адрес сайта для ссылок в письмах
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -108,6 +137,26 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: в них идут чтения view, отмеченных
+# core.routers.replica_reads. Локально реплики - копии SQLite:
+# DATABASE_REPLICAS=2 заводит replica1 и replica2, а команда
+# replicate --interval 1 копирует в них основную базу с задержкой,
+# как при настоящей репликации. Тесты запускаются без реплик:
+# транзакция TestCase видна только соединению default.
+REPLICA_DATABASES = []
+for number in range(1, int(os.getenv('DATABASE_REPLICAS', 0)) + 1):
+    REPLICA_DATABASES.append(f'replica{number}')
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.replica{number}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# За сколько секунд изменения доходят до реплик. Столько же после
+# записи пользователь читает из основной базы и столько живут в кеше
+# данные, прочитанные из реплики.
+REPLICA_LAG_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -167,8 +216,82 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Фоновые задачи (core.tasks): раскладка постов по лентам, поисковый
+# индекс, миниатюры. Очередь хранится в базе, выполняет её команда
+# run_tasks. При разработке и в тестах задачи выполняются сразу.
+TASKS_EAGER = DEBUG
+# Сколько раз пробовать упавшую задачу; пауза перед повтором
+# в секундах, каждый раз вдвое дольше
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10
+# Задача, которая выполняется дольше, считается брошенной упавшим
+# воркером и возвращается в очередь
+TASK_TIMEOUT = 60 * 10
+# Сколько секунд хранить выполненные задачи для статистики
+TASK_KEEP_DONE = 60 * 60 * 24
+
+# Посты автора, у которого подписчиков больше этого числа,
+# не раскладываются по лентам подписок, а подмешиваются при чтении
+FEED_FANOUT_LIMIT = 1000
+
+# Счёт популярности поста (posts.trending) падает вдвое за столько
+# секунд без новых комментариев и подписок на автора
+TRENDING_HALF_LIFE = 60 * 60 * 24
+
+# Граф подписок в памяти воркера (posts.followgraph): как часто
+# читать журнал чужих подписок и через сколько секунд загружать
+# граф из базы заново
+FOLLOW_GRAPH = {
+    'SYNC_INTERVAL': 0.5,
+    'RELOAD_INTERVAL': 60 * 60,
+}
+
+# Сколько живут в кеше карточки постов и списки постов лент.
+# Записи сбрасываются сигналами при изменении данных, поэтому
+# время жизни может быть долгим.
+POSTS_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Поиск по постам идёт через SQLite FTS5, если она доступна,
+# иначе через собственный инвертированный индекс posts.SearchTerm.
+# После переключения индекс нужно перестроить командой
+# rebuild_search_index.
+POST_SEARCH_FTS = True
+
+# Кеш двухуровневый: LRU в памяти каждого воркера перед общим кешем.
+# Общий кеш по умолчанию файловый, этого хватает на одном сервере;
+# его incr атомарен благодаря блокировке файла (core.cache).
+# Для Redis (или совместимой по протоколу замены) достаточно задать
+# SHARED_CACHE_BACKEND=django_redis.cache.RedisCache и
+# SHARED_CACHE_LOCATION=redis://127.0.0.1:6379/1
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'SYNC_INTERVAL': 0.5,
+        },
+    },
+    'shared': {
+        'BACKEND': os.environ.get(
+            'SHARED_CACHE_BACKEND',
+            'core.cache.FileBasedCache',
+        ),
+        'LOCATION': os.environ.get(
+            'SHARED_CACHE_LOCATION',
+            os.path.join(BASE_DIR, 'cache'),
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+# Тесты не трогают общий кеш в BASE_DIR/cache и не очищают его:
+# у каждого запуска свой общий кеш в памяти
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+if TESTING:
+    CACHES['shared'] = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
     }
-}
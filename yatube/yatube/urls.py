@@ -17,6 +17,10 @@ urlpatterns = [
     # urls.py модуля django.contrib.auth
     # подключили новое приложение about в головной urls
     path('about/', include('about.urls', namespace='about')),
+    # JSON API постов, групп, комментариев и подписок
+    path('api/v1/', include('api.urls', namespace='api')),
+    # Статистика SQL-запросов по view для staff
+    path('stats/', include('core.urls', namespace='core')),
 ]
 
 handler404 = 'core.views.page_not_found'
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Граф подписок загружается до fork воркеров (gunicorn --preload),
+# и его массивы остаются общими для всех процессов
+from posts import followgraph  # noqa: E402
+
+followgraph.preload()